@@ -6,8 +6,7 @@ import sys
 import time
 import numpy
 from pauxy.utils.io import write_qmcpack_dense
-from pauxy.utils.hamiltonian_converter import read_fcidump
-from pauxy.utils.linalg import modified_cholesky
+from pauxy.utils.hamiltonian_converter import fcidump_to_cholesky
 
 
 def parse_args(args):
@@ -60,20 +59,15 @@ def main(args):
         command-line arguments.
     """
     options = parse_args(args)
-    (hcore, eri, ecore, nelec) = read_fcidump(options.input_file,
-                                              symmetry=options.symm,
-                                              verbose=options.verbose)
+    (hcore, chol, ecore, nelec) = fcidump_to_cholesky(options.input_file,
+                                                      tol=options.thresh,
+                                                      symmetry=options.symm,
+                                                      verbose=options.verbose,
+                                                      cmax=20)
     norb = hcore.shape[-1]
-
-    # If the ERIs are complex then we need to form M_{(ik),(lj}} which is
-    # Hermitian. For real integrals we will have 8-fold symmetry so trasposing
-    # will have no effect.
-    eri = numpy.transpose(eri,(0,1,3,2))
-
-    chol = modified_cholesky(eri.reshape(norb**2,norb**2),
-                             options.thresh, options.verbose,
-                             cmax=20).T.copy()
-    cplx_chol = options.write_complex or numpy.any(abs(eri.imag)>1e-14)
+    cplx_chol = (options.write_complex or
+                 numpy.any(abs(chol.imag)>1e-14))
+    chol = chol.T.copy()
     write_qmcpack_dense(hcore, chol, nelec, norb, enuc=ecore,
                         real_chol=(not cplx_chol),
                         filename=options.output_file)
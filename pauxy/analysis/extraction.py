@@ -8,8 +8,7 @@ from pauxy.utils.misc import get_from_dict
 def extract_data(filename, group, estimator, raw=False):
     fp = get_param(filename, ['propagators', 'free_projection'])
     with h5py.File(filename, 'r') as fh5:
-        dsets = list(fh5[group][estimator].keys())
-        data = numpy.array([fh5[group][estimator][d][:] for d in dsets])
+        data = read_dataset(fh5[group][estimator])
         if 'rdm' in estimator or raw:
             return data
         else:
@@ -21,6 +20,61 @@ def extract_data(filename, group, estimator, raw=False):
                 df = df.apply(numpy.real)
             return df
 
+def read_dataset(obj, rows=slice(None)):
+    """Read estimator data stored either as a single dataset or as a group of
+    per-block datasets (older output format).
+
+    Parameters
+    ----------
+    obj : :class:`h5py.Dataset` or :class:`h5py.Group`
+        Estimator data.
+    rows : slice
+        Blocks to read.
+
+    Returns
+    -------
+    data : :class:`numpy.ndarray`
+        Estimator data. First index is block index.
+    """
+    if isinstance(obj, h5py.Dataset):
+        return obj[rows]
+    else:
+        dsets = list(obj.keys())[rows]
+        return numpy.array([obj[d][:] for d in dsets])
+
+def extract_column(filename, group, estimator, column, start=0, end=None):
+    """Extract a single column of estimator data.
+
+    Parameters
+    ----------
+    filename : string
+        Estimator output file.
+    group : string
+        Estimator group, e.g. 'basic' or 'back_propagated'.
+    estimator : string
+        Estimator name, e.g. 'energies'.
+    column : string or int
+        Column header or index.
+    start : int
+        First block to read.
+    end : int
+        Last block to read (exclusive). Default None reads to end.
+
+    Returns
+    -------
+    data : :class:`numpy.ndarray`
+        Column data.
+    """
+    with h5py.File(filename, 'r') as fh5:
+        if not isinstance(column, int):
+            header = [h.decode('utf-8') for h in fh5[group]['headers'][:]]
+            column = header.index(column)
+        obj = fh5[group][estimator]
+        if isinstance(obj, h5py.Dataset):
+            return obj[start:end,column]
+        else:
+            return read_dataset(obj, slice(start,end))[:,column]
+
 def extract_mixed_estimates(filename, skip=0):
     return extract_data(filename, 'basic', 'energies')[skip:]
 
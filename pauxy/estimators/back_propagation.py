@@ -8,7 +8,7 @@ try:
 except ImportError:
     mpi_sum = None
 import sys
-from pauxy.estimators.utils import H5EstimatorHelper
+from pauxy.estimators.utils import H5EstimatorHelper, FLUSH_FREQ
 from pauxy.estimators.greens_function import gab
 from pauxy.estimators.mixed import local_energy
 from pauxy.estimators.ekt import ekt_1p_fock_opt, ekt_1h_fock_opt
@@ -78,6 +78,8 @@ class BackPropagation(object):
         self.nstblz = qmc.nstblz
         self.BT2 = BT2
         self.restore_weights = bp.get('restore_weights', None)
+        self.h5_opts = {'compression': bp.get('compression', None),
+                        'flush_freq': bp.get('flush_freq', FLUSH_FREQ)}
         if root:
             print("# restore_weights = {}".format(self.restore_weights))
         self.dt = qmc.dt
@@ -325,6 +327,26 @@ class BackPropagation(object):
         self.accumulated = False
         self.zero()
 
+    def get_state(self):
+        """Get accumulated estimates for checkpointing.
+
+        Returns
+        -------
+        state : dict
+            Local estimates accumulated since the last output step.
+        """
+        return {'estimates': self.estimates.copy()}
+
+    def set_state(self, state):
+        """Restore accumulated estimates from checkpoint.
+
+        Parameters
+        ----------
+        state : dict
+            State returned by :meth:`get_state`.
+        """
+        self.estimates[:] = state['estimates']
+
     def zero(self):
         """Zero (in the appropriate sense) various estimator arrays."""
         self.estimates[:] = 0
@@ -335,4 +357,4 @@ class BackPropagation(object):
         if self.eval_energy:
             with h5py.File(filename, 'a') as fh5:
                 fh5[est_name+'/headers'] = numpy.array(self.header).astype('S')
-        self.output = H5EstimatorHelper(filename, est_name)
+        self.output = H5EstimatorHelper(filename, est_name, **self.h5_opts)
@@ -1,6 +1,8 @@
 import numpy
 import scipy.linalg
+import scipy.sparse
 import itertools
+from pauxy.utils.bitstring import occs_to_bits, excitation_level, excitation
 
 def simple_fci(system, gen_dets=False, occs=None, hamil=False):
     """Very dumb FCI routine."""
@@ -14,11 +16,7 @@ def simple_fci(system, gen_dets=False, occs=None, hamil=False):
     # convert to spin orbitals
     dets = [[j for j in a] + [i+system.nbasis for i in c] for (a,c) in zip(oa,ob)]
     dets = [numpy.sort(d) for d in dets]
-    ndets = len(dets)
-    H = numpy.zeros((ndets,ndets))
-    for i in range(ndets):
-        for j in range(i,ndets):
-            H[i,j] = get_hmatel(system, dets[i], dets[j])[0]
+    H = ci_hamiltonian(system, oa, ob)[0].toarray()
     if gen_dets:
         return scipy.linalg.eigh(H, lower=False), (dets,numpy.array(oa),numpy.array(ob))
     elif hamil:
@@ -155,3 +153,227 @@ def get_one_body_matel(ints, di, dj):
         return -matel
     else:
         return matel
+
+def connected_pairs(occa, occb, nbasis, max_exc=2, max_pairs=2**22):
+    """Find pairs of determinants connected by at most max_exc excitations.
+
+    Determinants are grouped by the spin string with more distinct values.
+    Only pairs of groups whose strings are connected are expanded, and the
+    remaining pairs are screened using their other spin string.
+
+    Parameters
+    ----------
+    occa : :class:`numpy.ndarray`
+        (ndets, nup) occupied alpha orbitals.
+    occb : :class:`numpy.ndarray`
+        (ndets, ndown) occupied beta orbitals.
+    nbasis : int
+        Number of spatial orbitals.
+    max_exc : int
+        Maximum excitation level. Optional. Default 2.
+    max_pairs : int
+        Approximate number of candidate pairs processed at once. Optional.
+        Default 2**22.
+
+    Returns
+    -------
+    i : :class:`numpy.ndarray`
+        Bra determinant indices.
+    j : :class:`numpy.ndarray`
+        Ket determinant indices with j <= i.
+    nex : :class:`numpy.ndarray`
+        Excitation level of each pair.
+    """
+    ua, ia = numpy.unique(occs_to_bits(occa, nbasis), axis=0,
+                          return_inverse=True)
+    ub, ib = numpy.unique(occs_to_bits(occb, nbasis), axis=0,
+                          return_inverse=True)
+    ia = ia.reshape(-1)
+    ib = ib.reshape(-1)
+    if len(ub) > len(ua):
+        (ua, ia, ub, ib) = (ub, ib, ua, ia)
+    # Connected pairs of group strings.
+    pa, pb, ea = [], [], []
+    block = max(1, max_pairs//len(ua))
+    for r0 in range(0, len(ua), block):
+        ex = excitation_level(ua[r0:r0+block,None,:], ua[None,:,:])
+        (r, c) = numpy.nonzero(ex <= max_exc)
+        pa.append(r+r0)
+        pb.append(c)
+        ea.append(ex[r,c])
+    pa = numpy.concatenate(pa)
+    pb = numpy.concatenate(pb)
+    ea = numpy.concatenate(ea)
+    order = numpy.argsort(ia, kind='stable')
+    counts = numpy.bincount(ia, minlength=len(ua))
+    starts = numpy.cumsum(counts) - counts
+    npairs = counts[pa] * counts[pb]
+    offsets = numpy.cumsum(npairs) - npairs
+    I, J, N = [], [], []
+    p0 = 0
+    while p0 < len(pa):
+        p1 = max(p0+1, numpy.searchsorted(offsets, offsets[p0]+max_pairs))
+        n = npairs[p0:p1]
+        p = numpy.repeat(numpy.arange(p0,p1), n)
+        local = (numpy.arange(n.sum()) -
+                 numpy.repeat(offsets[p0:p1]-offsets[p0], n))
+        cb = counts[pb[p]]
+        i = order[starts[pa[p]]+local//cb]
+        j = order[starts[pb[p]]+local%cb]
+        keep = i >= j
+        (i, j, p) = (i[keep], j[keep], p[keep])
+        nex = ea[p] + excitation_level(ub[ib[i]], ub[ib[j]])
+        keep = nex <= max_exc
+        I.append(i[keep])
+        J.append(j[keep])
+        N.append(nex[keep])
+        p0 = p1
+    return numpy.concatenate(I), numpy.concatenate(J), numpy.concatenate(N)
+
+def _hijkl(system, i, j, k, l, block_size=2**14):
+    """Vectorised <ij|kl> for arrays of spatial orbital indices."""
+    shape = numpy.shape(i)
+    (i, j, k, l) = [numpy.ravel(x) for x in (i, j, k, l)]
+    if system.name == "Generic":
+        M = system.nbasis
+        L = system.chol_vecs.reshape((-1,M,M))
+        out = numpy.zeros(len(i), dtype=L.dtype)
+        for b0 in range(0, len(i), block_size):
+            b = slice(b0, b0+block_size)
+            out[b] = numpy.einsum('nx,nx->x', L[:,i[b],k[b]], L[:,j[b],l[b]])
+    else:
+        out = numpy.array([system.hijkl(*x) for x in zip(i,j,k,l)])
+    return out.reshape(shape)
+
+def ci_hamiltonian(system, occa, occb):
+    """Sparse Hamiltonian for an orthogonal determinant expansion.
+
+    Determinants are encoded as bit strings, only pairs connected by at most
+    double excitations are evaluated, and matrix elements follow the
+    conventions of :func:`get_hmatel`.
+
+    Parameters
+    ----------
+    system : :class:`pauxy.system` object
+        System object.
+    occa : :class:`numpy.ndarray`
+        (ndets, nup) occupied alpha orbitals.
+    occb : :class:`numpy.ndarray`
+        (ndets, ndown) occupied beta orbitals.
+
+    Returns
+    -------
+    H : list of :class:`scipy.sparse.csr_matrix`
+        Hermitian total, one-body and two-body Hamiltonian matrices.
+    """
+    M = system.nbasis
+    occa = numpy.array(occa, dtype=numpy.int64).reshape((len(occa),-1))
+    occb = numpy.array(occb, dtype=numpy.int64).reshape((len(occb),-1))
+    ndets = occa.shape[0]
+    occs = numpy.hstack([occa, occb+M])
+    bits = occs_to_bits(occs, 2*M)
+    (I, J, N) = connected_pairs(occa, occb, M)
+    H1 = system.H1[0]
+    rows, cols, data = [], [], []
+    # Diagonal: Slater-Condon rules with occupation numbers.
+    d = numpy.arange(ndets)
+    na = numpy.zeros((ndets,M))
+    nb = numpy.zeros((ndets,M))
+    na[numpy.repeat(d,occa.shape[1]),occa.ravel()] = 1
+    nb[numpy.repeat(d,occb.shape[1]),occb.ravel()] = 1
+    (p, q) = numpy.meshgrid(numpy.arange(M), numpy.arange(M), indexing='ij')
+    Jpq = _hijkl(system, p, q, p, q)
+    Kpq = _hijkl(system, p, q, q, p)
+    n = na + nb
+    ej = numpy.sum(numpy.dot(n,Jpq)*n, axis=1) - numpy.dot(n, Jpq.diagonal())
+    ek = sum(numpy.sum(numpy.dot(ns,Kpq)*ns, axis=1) -
+             numpy.dot(ns, Kpq.diagonal()) for ns in (na, nb))
+    e1b = system.ecore + numpy.dot(n, H1.diagonal())
+    e2b = 0.5 * (ej - ek)
+    rows.append(d)
+    cols.append(d)
+    data.append(numpy.array([e1b+e2b, e1b, e2b]))
+    # Single excitations.
+    sel = N == 1
+    (i, j) = (I[sel], J[sel])
+    (f, t, perm) = excitation(bits[i], bits[j], 1)
+    (f, t) = (f[:,0], t[:,0])
+    (fs, ts) = (f % M, t % M)
+    occ = occs[i]
+    same_spin = (occ // M) == (f // M)[:,None]
+    fs_ = numpy.repeat(fs[:,None], occ.shape[1], axis=1)
+    ts_ = numpy.repeat(ts[:,None], occ.shape[1], axis=1)
+    # \sum_j <ij|aj> - <ij|ja>
+    e2b = numpy.sum(_hijkl(system, fs_, occ%M, ts_, occ%M) -
+                    same_spin*_hijkl(system, fs_, occ%M, occ%M, ts_), axis=1)
+    e1b = H1[fs,ts]
+    sign = numpy.where(perm, -1, 1)
+    rows.append(i)
+    cols.append(j)
+    data.append(sign*numpy.array([e1b+e2b, e1b, e2b]))
+    # Double excitations.
+    sel = N == 2
+    (i, j) = (I[sel], J[sel])
+    (f, t, perm) = excitation(bits[i], bits[j], 2)
+    (s, fs, ts) = (f // M, f % M, t % M)
+    e2b = (numpy.where(s[:,0] == t[:,0]//M,
+                       _hijkl(system, fs[:,0], fs[:,1], ts[:,0], ts[:,1]), 0) -
+           numpy.where(s[:,0] == t[:,1]//M,
+                       _hijkl(system, fs[:,0], fs[:,1], ts[:,1], ts[:,0]), 0))
+    sign = numpy.where(perm, -1, 1)
+    rows.append(i)
+    cols.append(j)
+    data.append(sign*numpy.array([e2b, numpy.zeros_like(e2b), e2b]))
+    rows = numpy.concatenate(rows)
+    cols = numpy.concatenate(cols)
+    data = numpy.concatenate(data, axis=1)
+    # Fill in upper triangle.
+    off = rows != cols
+    (rows, cols) = (numpy.concatenate([rows, cols[off]]),
+                    numpy.concatenate([cols, rows[off]]))
+    data = numpy.concatenate([data, data[:,off].conj()], axis=1)
+    return [scipy.sparse.csr_matrix((x,(rows,cols)), shape=(ndets,ndets))
+            for x in data]
+
+def ci_transition_density(occa, occb, coeffs, nbasis):
+    """Contracted one-body transition density of an orthogonal expansion.
+
+    Returns D such that tr(D V) reproduces the sum over determinant pairs of
+    :func:`get_one_body_matel` weighted by c_i^* c_j^*, normalised by
+    sum_i c_i^* c_i^*.
+
+    Parameters
+    ----------
+    occa : :class:`numpy.ndarray`
+        (ndets, nup) occupied alpha orbitals.
+    occb : :class:`numpy.ndarray`
+        (ndets, ndown) occupied beta orbitals.
+    coeffs : :class:`numpy.ndarray`
+        Expansion coefficients.
+    nbasis : int
+        Number of spatial orbitals.
+
+    Returns
+    -------
+    D : :class:`numpy.ndarray`
+        (nbasis, nbasis) transition density matrix.
+    """
+    M = nbasis
+    occa = numpy.array(occa, dtype=numpy.int64).reshape((len(occa),-1))
+    occb = numpy.array(occb, dtype=numpy.int64).reshape((len(occb),-1))
+    occs = numpy.hstack([occa, occb+M])
+    bits = occs_to_bits(occs, 2*M)
+    cfac = numpy.conj(coeffs)
+    D = numpy.zeros((M,M), dtype=numpy.complex128)
+    # Diagonal: occupation numbers of each determinant.
+    d = numpy.repeat(numpy.arange(len(occs)), occs.shape[1])
+    numpy.add.at(D, (occs.ravel()%M,occs.ravel()%M), (cfac*cfac)[d])
+    (I, J, N) = connected_pairs(occa, occb, M, max_exc=1)
+    sel = (N == 1)
+    (i, j) = (I[sel], J[sel])
+    (f, t, perm) = excitation(bits[i], bits[j], 1)
+    (f, t) = (f[:,0] % M, t[:,0] % M)
+    w = cfac[i] * cfac[j] * numpy.where(perm, -1, 1)
+    numpy.add.at(D, (f,t), w)
+    numpy.add.at(D, (t,f), w)
+    return D / numpy.sum(cfac*cfac)
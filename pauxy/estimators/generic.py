@@ -43,6 +43,8 @@ def local_energy_generic_opt(system, G, Ghalf=None):
                      (system.rchol_vecs[1].T).dot(Gdn))
 
     e2b = euu + edd + eos #eud + edu
+    if system.chol_group is not None:
+        e2b = system.chol_group.reduce(e2b)
     return (e1b + e2b + system.ecore, e1b + system.ecore, e2b)
 
 def local_energy_generic_cholesky_opt(system, G, Ghalf=None, rchol=None):
@@ -86,6 +88,61 @@ def local_energy_generic_cholesky_opt(system, G, Ghalf=None, rchol=None):
     exxb = numpy.tensordot(Tb, Tb, axes=((0,1,2),(1,0,2)))
     exx = exxa + exxb
     e2b = 0.5 * (ecoul - exx)
+    if system.chol_group is not None:
+        # Coulomb and exchange contributions from each Cholesky slice.
+        e2b = system.chol_group.reduce(e2b)
+    return (e1b + e2b + system.ecore, e1b + system.ecore, e2b)
+
+def local_energy_generic_cholesky_opt_batch(system, G, Ghalf=None, rchol=None):
+    r"""Calculate local energy for a batch of walkers.
+
+    Batched version of :func:`local_energy_generic_cholesky_opt`.
+
+    Parameters
+    ----------
+    system : :class:`Generic`
+        Generic system object.
+    G : :class:`numpy.ndarray`
+        Walkers' "green's functions" of shape (nwalkers, 2, nbasis, nbasis).
+    Ghalf : list of :class:`numpy.ndarray`
+        Walkers' half-rotated green's functions for each spin of shape
+        (nwalkers, nsigma, nbasis).
+
+    Returns
+    -------
+    (E, T, V): tuple of :class:`numpy.ndarray`
+        Local, kinetic and potential energies of each walker.
+    """
+    e1b = numpy.tensordot(G, system.H1, axes=((1,2,3),(0,1,2)))
+    if rchol is None:
+        rchol = system.rchol_vecs
+    nalpha, nbeta = system.nup, system.ndown
+    nbasis = system.nbasis
+    nwalkers = G.shape[0]
+    Ga, Gb = Ghalf[0], Ghalf[1]
+    # X_{wn} = \sum_{ak} G_{w,ak} L_{ak,n}
+    Xa = rchol[0].T.dot(Ga.reshape(nwalkers,-1).T).T
+    Xb = rchol[1].T.dot(Gb.reshape(nwalkers,-1).T).T
+    ecoul = numpy.einsum('wn,wn->w', Xa+Xb, Xa+Xb)
+    if system.sparse:
+        rchol_a, rchol_b = [rchol[0].toarray(), rchol[1].toarray()]
+    else:
+        rchol_a, rchol_b = rchol[0], rchol[1]
+    rchol_a = rchol_a.reshape((nalpha,nbasis,-1))
+    rchol_b = rchol_b.reshape((nbeta,nbasis,-1))
+    # T_{wabn} = \sum_k Theta_{w,ak} LL_{bk,n}, evaluated as a single
+    # (nwalkers*nsigma, nbasis) x (nbasis, nsigma*nchol) product per spin.
+    exx = numpy.zeros(nwalkers, dtype=numpy.complex128)
+    for (Gs, rchol_s, nocc) in [(Ga, rchol_a, nalpha), (Gb, rchol_b, nbeta)]:
+        if nocc == 0:
+            continue
+        L = rchol_s.transpose((1,0,2)).reshape((nbasis,-1))
+        T = numpy.dot(Gs.reshape((-1,nbasis)), L)
+        T = T.reshape((nwalkers,nocc,nocc,-1))
+        exx += numpy.einsum('wabn,wban->w', T, T, optimize=True)
+    e2b = 0.5 * (ecoul - exx)
+    if system.chol_group is not None:
+        e2b = system.chol_group.reduce(e2b)
     return (e1b + e2b + system.ecore, e1b + system.ecore, e2b)
 
 def local_energy_generic_cholesky(system, G, Ghalf=None):
@@ -124,6 +181,8 @@ def local_energy_generic_cholesky(system, G, Ghalf=None):
     exxb = numpy.tensordot(Tb, Tb, axes=((0,1,2),(0,2,1)))
     exx = exxa + exxb
     e2b = 0.5 * (ecoul - exx)
+    if system.chol_group is not None:
+        e2b = system.chol_group.reduce(e2b)
     return (e1b+e2b+system.ecore, e1b+system.ecore, e2b)
 
 def core_contribution(system, Gcore):
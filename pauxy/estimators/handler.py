@@ -12,6 +12,7 @@ import warnings
 from pauxy.estimators.back_propagation import BackPropagation
 from pauxy.estimators.mixed import Mixed
 from pauxy.estimators.itcf import ITCF
+from pauxy.estimators.utils import H5EstimatorHelper, FLUSH_FREQ
 from pauxy.utils.io import get_input_value
 
 
@@ -73,9 +74,14 @@ class Estimators(object):
                 print("# Writing estimator data to {}.".format(self.filename))
         else:
             self.filename = None
+        # Output options common to all estimators.
+        compression = estimates.get('compression', None)
+        flush_freq = estimates.get('flush_freq', FLUSH_FREQ)
         # Sub-members:
         # 1. Back-propagation
         mixed = estimates.get('mixed', {})
+        mixed.setdefault('compression', compression)
+        mixed.setdefault('flush_freq', flush_freq)
         self.estimators = {}
         dtype = complex
         self.estimators['mixed'] = Mixed(mixed, system, root, self.filename,
@@ -85,6 +91,8 @@ class Estimators(object):
                               verbose=verbose)
         self.back_propagation = bp is not None
         if self.back_propagation:
+            bp.setdefault('compression', compression)
+            bp.setdefault('flush_freq', flush_freq)
             self.estimators['back_prop'] = BackPropagation(bp, root, self.filename,
                                                            qmc, system, trial,
                                                            dtype, BT2)
@@ -110,11 +118,26 @@ class Estimators(object):
 
     def reset(self, root):
         if root:
+            self.close()
             self.increment_file_number()
             self.dump_metadata()
             for k, e in self.estimators.items():
                 e.setup_output(self.filename)
 
+    def flush(self):
+        """Write any buffered estimator data to file."""
+        for k, e in self.estimators.items():
+            output = getattr(e, 'output', None)
+            if isinstance(output, H5EstimatorHelper):
+                output.flush()
+
+    def close(self):
+        """Write any buffered estimator data and close output file."""
+        for k, e in self.estimators.items():
+            output = getattr(e, 'output', None)
+            if isinstance(output, H5EstimatorHelper):
+                output.close()
+
     def dump_metadata(self):
         with h5py.File(self.filename, 'a') as fh5:
             fh5['metadata'] = self.json_string
@@ -140,6 +163,37 @@ class Estimators(object):
         for k, e in self.estimators.items():
             e.print_step(comm, nprocs, step, nsteps=nsteps, free_projection=free_projection)
 
+    def get_state(self):
+        """Get estimator state for checkpointing.
+
+        Returns
+        -------
+        state : dict
+            Arrays local to this processor keyed by 'estimator/name'.
+        """
+        state = {}
+        for k, e in self.estimators.items():
+            if hasattr(e, 'get_state'):
+                for (name, v) in e.get_state().items():
+                    state[k+'/'+name] = v
+        return state
+
+    def set_state(self, state):
+        """Restore estimator state from checkpoint.
+
+        Parameters
+        ----------
+        state : dict
+            State returned by :meth:`get_state`.
+        """
+        for k, e in self.estimators.items():
+            if hasattr(e, 'set_state'):
+                prefix = k + '/'
+                sub = {name[len(prefix):]: v for (name, v) in state.items()
+                       if name.startswith(prefix)}
+                if sub:
+                    e.set_state(sub)
+
     def update(self, system, qmc, trial, psi, step, free_projection=False):
         """Update estimators
 
@@ -1,4 +1,5 @@
 import h5py
+import multiprocessing
 import numpy
 try:
     from mpi4py import MPI
@@ -7,8 +8,8 @@ except ImportError:
     mpi_sum = None
 import scipy.linalg
 import time
-from pauxy.estimators.utils import H5EstimatorHelper
-from pauxy.estimators.ci import get_hmatel
+from pauxy.estimators.utils import H5EstimatorHelper, FLUSH_FREQ
+from pauxy.estimators.ci import ci_hamiltonian
 from pauxy.estimators.thermal import particle_number, one_rdm_from_G
 try:
     from pauxy.estimators.ueg import local_energy_ueg
@@ -76,6 +77,8 @@ class Mixed(object):
         if self.energy_eval_freq is None:
             self.energy_eval_freq = qmc.nsteps
         self.verbose = mixed.get('verbose', True)
+        self.h5_opts = {'compression': mixed.get('compression', None),
+                        'flush_freq': mixed.get('flush_freq', FLUSH_FREQ)}
         # number of steps per block
         self.nsteps = qmc.nsteps
         self.header = ['Iteration', 'WeightFactor', 'Weight', 'ENumer',
@@ -145,6 +148,10 @@ class Mixed(object):
         free_projection : bool
             True if doing free projection.
         """
+        if psi.batched:
+            self.update_batch(system, qmc, trial, psi.batch, step,
+                              free_projection)
+            return
         if free_projection:
             for i, w in enumerate(psi.walkers):
                 # For T > 0 w.ot = 1 always.
@@ -226,6 +233,52 @@ class Mixed(object):
                     end = end + self.two_rdm.size
                     self.estimates[start:end] += w.weight*self.two_rdm.flatten().real
 
+    def update_batch(self, system, qmc, trial, walker_batch, step,
+                     free_projection=False):
+        """Update mixed estimates for a batch of walkers.
+
+        Parameters
+        ----------
+        system : system object.
+            Container for model input options.
+        qmc : :class:`pauxy.state.QMCOpts` object.
+            Container for qmc input options.
+        trial : :class:`pauxy.trial_wavefunction.X' object
+            Trial wavefunction class.
+        walker_batch : :class:`pauxy.walkers.single_det_batch.SingleDetWalkerBatch`
+            Batch of walkers.
+        step : int
+            Current simulation step
+        free_projection : bool
+            True if doing free projection.
+        """
+        ns = self.names
+        weight = walker_batch.weight
+        if free_projection:
+            wfac = weight * walker_batch.ot * walker_batch.phase
+        else:
+            wfac = weight
+        if step % self.energy_eval_freq == 0:
+            walker_batch.greens_function(trial)
+            if self.eval_energy:
+                E, T, V = walker_batch.local_energy(system)
+                if not free_projection:
+                    E, T, V = E.real, T.real, V.real
+                self.estimates[ns.enumer] += numpy.dot(wfac, E)
+                self.estimates[ns.e1b:ns.e2b+1] += (
+                        numpy.array([numpy.dot(wfac, T), numpy.dot(wfac, V)])
+                )
+            self.estimates[ns.edenom] += numpy.sum(wfac)
+        self.estimates[ns.uweight] += numpy.sum(walker_batch.unscaled_weight)
+        self.estimates[ns.weight] += numpy.sum(weight)
+        self.estimates[ns.ovlp] += numpy.dot(wfac, numpy.abs(walker_batch.ot))
+        self.estimates[ns.ehyb] += numpy.dot(wfac, walker_batch.hybrid_energy)
+        if self.calc_one_rdm:
+            start = ns.time+1
+            end = ns.time+1+self.G.size
+            rdm = numpy.tensordot(weight, walker_batch.G, axes=((0),(0)))
+            self.estimates[start:end] += rdm.ravel().real
+
     def print_step(self, comm, nprocs, step, nsteps=None, free_projection=False):
         """Print mixed estimates to file.
 
@@ -346,6 +399,27 @@ class Mixed(object):
         """
         return self.eshift.real
 
+    def get_state(self):
+        """Get accumulated estimates for checkpointing.
+
+        Returns
+        -------
+        state : dict
+            Local estimates accumulated since the last output step.
+        """
+        return {'estimates': self.estimates.copy()}
+
+    def set_state(self, state):
+        """Restore accumulated estimates from checkpoint.
+
+        Parameters
+        ----------
+        state : dict
+            State returned by :meth:`get_state`.
+        """
+        self.estimates[:] = state['estimates']
+        self.estimates[self.names.time] = time.time()
+
     def zero(self):
         """Zero (in the appropriate sense) various estimator arrays."""
         self.estimates[:] = 0
@@ -355,7 +429,7 @@ class Mixed(object):
     def setup_output(self, filename):
         with h5py.File(filename, 'a') as fh5:
             fh5['basic/headers'] = numpy.array(self.header).astype('S')
-        self.output = H5EstimatorHelper(filename, 'basic')
+        self.output = H5EstimatorHelper(filename, 'basic', **self.h5_opts)
 
 # Energy evaluation routines.
 
@@ -443,39 +517,189 @@ def variational_energy(system, psi, coeffs, G=None, GH=None):
     else:
         return variational_energy_single_det(system, psi, G=G, GH=GH)
 
-def variational_energy_multi_det(system, psi, coeffs, H=None, S=None):
-    weight = 0
-    energies = 0
-    denom = 0
-    nup = system.nup
-    ndet = len(coeffs)
+def variational_energy_multi_det(system, psi, coeffs, H=None, S=None,
+                                 nproc=1):
+    """Compute variational energy for non-orthogonal multi-determinant trial.
+
+    Parameters
+    ----------
+    system : :class:`pauxy.system` object
+        System object.
+    psi : :class:`numpy.ndarray`
+        Determinants (ndets, nbasis, nelec).
+    coeffs : :class:`numpy.ndarray`
+        Expansion coefficients.
+    H : :class:`numpy.ndarray`
+        If present, stores <i|H|j>. Optional. Default None.
+    S : :class:`numpy.ndarray`
+        If present, stores <i|j>. Optional. Default None.
+    nproc : int
+        Number of processes used to build matrix elements. Optional.
+        Default 1.
+
+    Returns
+    -------
+    energy : tuple of float / complex
+        Total energies: (etot,e1b,e2b).
+    """
+    Hij, Sij = nomsd_hamiltonian(system, numpy.array(psi), nproc=nproc)
     if H is not None and S is not None:
-        store = True
+        H[:] = Hij[0]
+        S[:] = Sij
+    cfac = numpy.outer(numpy.conj(coeffs), coeffs)
+    energies = numpy.einsum('ij,xij->x', cfac, Hij)
+    denom = numpy.sum(cfac*Sij)
+    return tuple(energies/denom)
+
+def nomsd_hamiltonian(system, psi, rot_chol=None, block_size=None, nproc=1,
+                      thresh=1e-12):
+    """Build Hamiltonian and overlap matrices between non-orthogonal
+    determinants.
+
+    Only the upper triangle is computed, the rest follows from Hermiticity.
+    For each bra all kets are treated in blocks with batched inverses. For
+    generic systems the one-body and Cholesky integrals are half rotated by
+    the bra once and contracted with the stacked half rotated transition
+    Green's functions of the block.
+
+    Parameters
+    ----------
+    system : :class:`pauxy.system` object
+        System object.
+    psi : :class:`numpy.ndarray`
+        Determinants (ndets, nbasis, nelec).
+    rot_chol : list
+        Half rotated Cholesky vectors for each determinant, e.g.,
+        :attr:`MultiSlater.rot_chol`. Computed on the fly if not present.
+        Optional. Default None.
+    block_size : int
+        Number of kets per block. Optional. Default None, i.e., chosen so the
+        exchange intermediate is roughly 128 MB.
+    nproc : int
+        Number of processes over which bras are distributed. Forks the
+        calling process so should not be used from MPI ranks. Optional.
+        Default 1, i.e., rely on threaded BLAS.
+    thresh : float
+        Pairs with smaller overlap are set to zero. Optional. Default 1e-12.
+
+    Returns
+    -------
+    H : :class:`numpy.ndarray`
+        (3, ndets, ndets) overlap weighted total, one-body and two-body matrix
+        elements.
+    S : :class:`numpy.ndarray`
+        (ndets, ndets) overlap matrix.
+    """
+    ndets = psi.shape[0]
+    H = numpy.zeros((3,ndets,ndets), dtype=numpy.complex128)
+    S = numpy.zeros((ndets,ndets), dtype=numpy.complex128)
+    fast = system.name == "Generic" and system.chol_group is None
+    if fast:
+        M = system.nbasis
+        chol = system.chol_vecs.reshape((-1,M*M)).T.reshape((M,M,-1))
+        if block_size is None:
+            nmax = max(system.nup, system.ndown)
+            block_size = max(1, 2**27//(16*nmax*nmax*chol.shape[-1]+1))
+        data = {'psi': psi, 'nup': system.nup, 'H1': system.H1,
+                'chol': chol, 'ecore': system.ecore, 'rot_chol': rot_chol,
+                'block_size': block_size, 'thresh': thresh}
     else:
-        store = False
-    for i, (Bi, ci) in enumerate(zip(psi, coeffs)):
-        for j, (Aj, cj) in enumerate(zip(psi, coeffs)):
-            # construct "local" green's functions for each component of A
-            Gup, GH, inv_O_up = gab_mod_ovlp(Bi[:,:nup], Aj[:,:nup])
-            Gdn, GH, inv_O_dn = gab_mod_ovlp(Bi[:,nup:], Aj[:,nup:])
-            ovlp = 1.0 / (scipy.linalg.det(inv_O_up)*scipy.linalg.det(inv_O_dn))
-            weight = (ci.conj()*cj) * ovlp
+        data = {'psi': psi, 'nup': system.nup, 'system': system,
+                'thresh': thresh}
+    if nproc > 1 and fast:
+        pool = multiprocessing.Pool(nproc, initializer=_init_nomsd_worker,
+                                    initargs=(data,))
+        rows = pool.imap_unordered(_nomsd_worker, range(ndets))
+    else:
+        pool = None
+        row = _nomsd_row if fast else _nomsd_row_slow
+        rows = ((i,) + row(i, **data) for i in range(ndets))
+    for (i, ovlp, hij) in rows:
+        S[i,i:] = ovlp
+        S[i:,i] = ovlp.conj()
+        H[:,i,i:] = hij
+        H[:,i:,i] = hij.conj()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return H, S
+
+# Shared with pool workers through the initializer so the integrals are
+# only sent once per process.
+_nomsd_data = None
+
+def _init_nomsd_worker(data):
+    global _nomsd_data
+    _nomsd_data = data
+
+def _nomsd_worker(i):
+    return (i,) + _nomsd_row(i, **_nomsd_data)
+
+def _nomsd_row(i, psi=None, nup=None, H1=None, chol=None, ecore=None,
+               rot_chol=None, block_size=None, thresh=None):
+    """Matrix elements between determinant i and determinants j >= i."""
+    bra = psi[i]
+    kets = psi[i:]
+    M = bra.shape[0]
+    spins = [slice(0,nup), slice(nup,bra.shape[1])]
+    Ac = [bra[:,ix].conj() for ix in spins]
+    # One-body and Cholesky integrals half rotated by the bra.
+    H1r = [numpy.dot(A.T, H1[s]) for (s, A) in enumerate(Ac)]
+    if rot_chol is not None:
+        rchol = rot_chol[i]
+    else:
+        rchol = [numpy.tensordot(A, chol, axes=((0),(0))).reshape((-1,
+                                                               chol.shape[-1]))
+                 for A in Ac]
+    ovlp = numpy.ones(len(kets), dtype=numpy.complex128)
+    energies = numpy.zeros((3,len(kets)), dtype=numpy.complex128)
+    for j0 in range(0, len(kets), block_size):
+        B = kets[j0:j0+block_size]
+        nj = B.shape[0]
+        ovlp_b = numpy.ones(nj, dtype=numpy.complex128)
+        e1b = numpy.zeros(nj, dtype=numpy.complex128)
+        X = 0.0
+        exx = numpy.zeros(nj, dtype=numpy.complex128)
+        for (s, ix) in enumerate(spins):
+            Bs = B[:,:,ix]
+            n = Bs.shape[-1]
+            O = numpy.einsum('jpa,pb->jab', Bs, Ac[s], optimize=True)
+            det = numpy.linalg.det(O)
+            # Avoid inverting (near) singular overlap matrices.
+            singular = numpy.abs(det) < thresh
+            O[singular] = numpy.eye(n)
+            ovlp_b *= numpy.where(singular, 0.0, det)
+            # Half rotated transition Green's functions for the block.
+            Ghalf = numpy.matmul(numpy.linalg.inv(O), Bs.transpose((0,2,1)))
+            e1b += numpy.einsum('jak,ak->j', Ghalf, H1r[s], optimize=True)
+            X = X + numpy.dot(Ghalf.reshape((nj,-1)), rchol[s])
+            # T_{jabn} = \sum_k Ghalf_{jak} L_{bk,n}
+            T = numpy.tensordot(Ghalf, rchol[s].reshape((n,M,-1)),
+                                axes=((2),(1)))
+            exx += numpy.einsum('jabn,jban->j', T, T, optimize=True)
+        e2b = 0.5 * (numpy.einsum('jn,jn->j', X, X) - exx)
+        mask = numpy.abs(ovlp_b) > thresh
+        ovlp_b[~mask] = 0.0
+        energies[:,j0:j0+nj] = ovlp_b * numpy.array([e1b+e2b+ecore,
+                                                     e1b+ecore, e2b])
+        ovlp[j0:j0+nj] = ovlp_b
+    return ovlp, energies
+
+def _nomsd_row_slow(i, psi=None, nup=None, system=None, thresh=None):
+    """Matrix elements between determinant i and determinants j >= i using
+    :func:`local_energy`."""
+    bra = psi[i]
+    ovlp = numpy.zeros(psi.shape[0]-i, dtype=numpy.complex128)
+    energies = numpy.zeros((3,psi.shape[0]-i), dtype=numpy.complex128)
+    for (j, ket) in enumerate(psi[i:]):
+        Gup, GH, inv_O_up = gab_mod_ovlp(bra[:,:nup], ket[:,:nup])
+        Gdn, GH, inv_O_dn = gab_mod_ovlp(bra[:,nup:], ket[:,nup:])
+        o = 1.0 / (scipy.linalg.det(inv_O_up)*scipy.linalg.det(inv_O_dn))
+        if abs(o) > thresh:
             G = numpy.array([Gup, Gdn])
-            e = numpy.array(local_energy(system, G, opt=False))
-            if (i == 0 and j == 1) or (i == 1 and j == 0):
-                Gup, GH, inv_O_up = gab_mod_ovlp(Aj[:,:nup],Bi[:,:nup])
-                Gdn, GH, inv_O_dn = gab_mod_ovlp(Aj[:,nup:], Bi[:,nup:])
-                G = numpy.array([Gup, Gdn])
-                e2 = numpy.array(local_energy(system, G, opt=False))
-
-            Gup, GH, inv_O_up = gab_mod_ovlp(Bi[:,:nup], Aj[:,:nup])
-            Gdn, GH, inv_O_dn = gab_mod_ovlp(Bi[:,nup:], Aj[:,nup:])
-            if store:
-                H[i,j] = ovlp*e[0]
-                S[i,j] = ovlp
-            energies += weight * e
-            denom += weight
-    return tuple(energies/denom)
+            ovlp[j] = o
+            energies[:,j] = o * numpy.array(local_energy(system, G, opt=False))
+    return ovlp, energies
 
 def variational_energy_ortho_det(system, occs, coeffs):
     """Compute variational energy for CI-like multi-determinant expansion.
@@ -494,24 +718,12 @@ def variational_energy_ortho_det(system, occs, coeffs):
     energy : tuple of float / complex
         Total energies: (etot,e1b,e2b).
     """
-    evar = 0.0
-    denom = 0.0
-    one_body = 0.0
-    two_body = 0.0
-    for i, (occi, ci) in enumerate(zip(occs, coeffs)):
-        denom += ci.conj()*ci
-        for j in range(0,i+1):
-            cj = coeffs[j]
-            occj = occs[j]
-            etot, e1b, e2b = ci.conj()*cj*get_hmatel(system, occi, occj)
-            evar += etot
-            one_body += e1b
-            two_body += e2b
-            if j < i:
-                # Use Hermiticity
-                evar += etot
-                one_body += e1b
-                two_body += e2b
+    occs = numpy.array(occs)
+    nup = system.nup
+    H = ci_hamiltonian(system, occs[:,:nup], occs[:,nup:]-system.nbasis)
+    denom = numpy.dot(coeffs.conj(), coeffs)
+    evar, one_body, two_body = [numpy.dot(coeffs.conj(), h.dot(coeffs))
+                                for h in H]
     return evar/denom, one_body/denom, two_body/denom
 
 
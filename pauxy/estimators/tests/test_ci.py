@@ -1,6 +1,15 @@
+import numpy
 import pytest
+from pauxy.systems.generic import Generic
 from pauxy.systems.ueg import UEG
-from pauxy.estimators.ci import simple_fci
+from pauxy.estimators.ci import (
+        simple_fci,
+        get_hmatel,
+        get_one_body_matel,
+        ci_hamiltonian,
+        ci_transition_density
+        )
+from pauxy.utils.testing import generate_hamiltonian
 
 
 @pytest.mark.unit
@@ -13,3 +22,46 @@ def test_ueg():
     assert eig[231] == pytest.approx(2.883365264420)
     assert eig[424] == pytest.approx(3.039496944900)
     assert eig[-1] == pytest.approx(3.207573492596)
+
+def random_ci_expansion(nmo, nelec, ndets):
+    dets = set()
+    while len(dets) < ndets:
+        oa = tuple(sorted(numpy.random.choice(nmo, nelec[0], replace=False)))
+        ob = tuple(sorted(numpy.random.choice(nmo, nelec[1], replace=False)))
+        dets.add((oa,ob))
+    oa, ob = zip(*sorted(dets))
+    occs = [numpy.array(list(a)+[b+nmo for b in c]) for (a,c) in zip(oa,ob)]
+    return numpy.array(oa), numpy.array(ob), occs
+
+@pytest.mark.unit
+def test_ci_hamiltonian():
+    numpy.random.seed(7)
+    nmo = 8
+    nelec = (3,2)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    sys = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc)
+    oa, ob, occs = random_ci_expansion(nmo, nelec, 60)
+    H = [h.toarray() for h in ci_hamiltonian(sys, oa, ob)]
+    for i in range(len(occs)):
+        for j in range(i+1):
+            ref = get_hmatel(sys, occs[i], occs[j])
+            assert numpy.allclose([h[i,j] for h in H], ref)
+
+@pytest.mark.unit
+def test_ci_transition_density():
+    numpy.random.seed(7)
+    nmo = 8
+    nelec = (3,2)
+    oa, ob, occs = random_ci_expansion(nmo, nelec, 40)
+    coeffs = numpy.random.random(40) + 1j*numpy.random.random(40)
+    ints = numpy.random.random((nmo,nmo))
+    numer = 0.0
+    denom = 0.0
+    for i in range(len(occs)):
+        for j in range(len(occs)):
+            cfac = coeffs[i].conj()*coeffs[j].conj()
+            numer += cfac * get_one_body_matel(ints, occs[i], occs[j])
+            if i == j:
+                denom += cfac
+    D = ci_transition_density(oa, ob, coeffs, nmo)
+    assert numpy.dot(ints.ravel(), D.ravel()) == pytest.approx(numer/denom)
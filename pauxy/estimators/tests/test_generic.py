@@ -2,6 +2,8 @@ import numpy
 import pytest
 from pauxy.systems.generic import Generic
 from pauxy.trial_wavefunction.multi_slater import MultiSlater
+from pauxy.estimators.greens_function import gab_mod_ovlp
+from pauxy.estimators.mixed import nomsd_hamiltonian
 from pauxy.estimators.generic import (
         local_energy_generic_opt,
         local_energy_generic_cholesky,
@@ -57,3 +59,35 @@ def test_local_energy_cholesky_opt():
     assert e[0] == pytest.approx(20.6826247016273)
     assert e[1] == pytest.approx(23.0173528796140)
     assert e[2] == pytest.approx(-2.3347281779866)
+
+@pytest.mark.unit
+def test_nomsd_hamiltonian():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (4,3)
+    na = nelec[0]
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    # Matrix elements are only computed for j >= i.
+    h1e = 0.5 * (h1e + h1e.T)
+    sys = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc)
+    wfn = get_random_nomsd(sys, ndet=5)
+    psi = wfn[1]
+    ndets = psi.shape[0]
+    Href = numpy.zeros((ndets,ndets), dtype=numpy.complex128)
+    Sref = numpy.zeros((ndets,ndets), dtype=numpy.complex128)
+    for i in range(ndets):
+        for j in range(ndets):
+            ga, gha, ioa = gab_mod_ovlp(psi[i][:,:na], psi[j][:,:na])
+            gb, ghb, iob = gab_mod_ovlp(psi[i][:,na:], psi[j][:,na:])
+            ovlp = 1.0/(numpy.linalg.det(ioa)*numpy.linalg.det(iob))
+            e = local_energy_generic_cholesky(sys, numpy.array([ga,gb]))
+            Href[i,j] = ovlp * e[0]
+            Sref[i,j] = ovlp
+    H, S = nomsd_hamiltonian(sys, psi, block_size=2)
+    assert numpy.allclose(S, Sref)
+    assert numpy.allclose(H[0], Href)
+    assert numpy.allclose(H[0], H[1]+H[2])
+    trial = MultiSlater(sys, wfn, options={'half_rotate': True})
+    H, S = nomsd_hamiltonian(sys, psi, rot_chol=trial.rot_chol, nproc=2)
+    assert numpy.allclose(S, Sref)
+    assert numpy.allclose(H[0], Href)
@@ -0,0 +1,41 @@
+import h5py
+import json
+import numpy
+import os
+import pytest
+from pauxy.analysis.extraction import extract_column, extract_data
+from pauxy.estimators.utils import H5EstimatorHelper
+
+@pytest.mark.unit
+def test_h5_estimator_helper():
+    filename = 'estimates_test_utils.h5'
+    with h5py.File(filename, 'w') as fh5:
+        fh5['basic/headers'] = numpy.array(['Iteration', 'ETotal']).astype('S')
+        fh5['metadata'] = json.dumps({'propagators': {'free_projection': False}})
+    output = H5EstimatorHelper(filename, 'basic', flush_freq=3,
+                               compression='gzip')
+    for i in range(10):
+        output.push([i, -i], 'energies')
+        output.push(i*numpy.ones((2,3,3)), 'one_rdm')
+        output.increment()
+    # Data is written in batches of flush_freq pushes.
+    with h5py.File(filename, 'r') as fh5:
+        assert fh5['basic/energies'].shape == (9,2)
+    output.close()
+    data = extract_data(filename, 'basic', 'energies')
+    assert numpy.allclose(data.ETotal.values, -numpy.arange(10))
+    etot = extract_column(filename, 'basic', 'energies', 'ETotal', start=2,
+                          end=5)
+    assert numpy.allclose(etot, [-2, -3, -4])
+    rdm = extract_data(filename, 'basic', 'one_rdm')
+    assert rdm.shape == (10,2,3,3)
+    assert rdm[4,1,2,2] == pytest.approx(4)
+
+def teardown_module(self):
+    cwd = os.getcwd()
+    files = ['estimates_test_utils.h5']
+    for f in files:
+        try:
+            os.remove(cwd+'/'+f)
+        except OSError:
+            pass
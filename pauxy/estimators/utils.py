@@ -276,34 +276,51 @@ def convolve(f, g, mesh, backend=numpy.fft):
     fq = fq.reshape(nqtot) * numpy.prod(fshape)
     return fq
 
+# Default number of pushes buffered by estimator output before writing.
+FLUSH_FREQ = 10
+
 class H5EstimatorHelper(object):
-    """Helper class for pushing data to hdf5 dataset of fixed length.
+    """Helper class for pushing data to hdf5 datasets.
+
+    Each named estimator is stored in a single resizable, chunked dataset
+    whose first axis indexes the block. Data is buffered in memory and
+    appended every flush_freq pushes through a persistent file handle.
 
     Parameters
     ----------
-    h5f : :class:`h5py.File`
-        Output file object.
-    name : string
-        Dataset name.
-    shape : tuple
-        Shape of output data.
-    dtype : type
-        Output data type.
+    filename : string
+        Output file name.
+    base : string
+        Group name under which datasets are stored.
+    nav : int
+        Deprecated.
+    compression : string
+        hdf5 compression filter for datasets (e.g. 'gzip'). Default None.
+    flush_freq : int
+        Number of pushes to buffer before writing to file.
+    chunk_bytes : int
+        Approximate size of dataset chunks in bytes.
 
     Attributes
     ----------
-    store : :class:`h5py.File.DataSet`
-        Dataset object.
+    fh5 : :class:`h5py.File`
+        Output file object. Opened on first write.
     index : int
         Counter for incrementing data.
+    buffers : dict
+        Data not yet written to file.
     """
-    def __init__(self, filename, base, nav=1):
-        # self.store = h5f.create_dataset(name, shape, dtype=dtype)
+    def __init__(self, filename, base, nav=1, compression=None,
+                 flush_freq=1, chunk_bytes=2**16):
         self.filename = filename
         self.base = base
         self.index = 0
-        self.nzero = 9
         self.nav = nav
+        self.compression = compression
+        self.flush_freq = flush_freq
+        self.chunk_bytes = chunk_bytes
+        self.buffers = {}
+        self.fh5 = None
 
     def push(self, data, name):
         """Push data to dataset.
@@ -312,13 +329,55 @@ class H5EstimatorHelper(object):
         ----------
         data : :class:`numpy.ndarray`
             Data to push.
+        name : string
+            Dataset name.
+        """
+        buff = self.buffers.setdefault(name, [])
+        buff.append(numpy.array(data))
+        if len(buff) >= self.flush_freq:
+            self.flush(name)
+
+    def flush(self, name=None):
+        """Write buffered data to file.
+
+        Parameters
+        ----------
+        name : string
+            Dataset to write. Default None, in which case all buffered data is
+            written.
         """
-        ix = str(self.index)
-        # To ensure string indices are sorted properly.
-        padded = '0'*(self.nzero-len(ix)) + ix
-        dset = self.base + '/' + name + '/' + padded
-        with h5py.File(self.filename, 'a') as fh5:
-            fh5[dset] = data
+        if name is None:
+            names = list(self.buffers.keys())
+        else:
+            names = [name]
+        if self.fh5 is None:
+            self.fh5 = h5py.File(self.filename, 'a')
+        for n in names:
+            buff = self.buffers.get(n, [])
+            if len(buff) == 0:
+                continue
+            data = numpy.array(buff)
+            dset = self.base + '/' + n
+            if dset not in self.fh5:
+                nrow = max(1, self.chunk_bytes // max(data[0].nbytes, 1))
+                self.fh5.create_dataset(dset, data=data,
+                                        maxshape=(None,)+data.shape[1:],
+                                        chunks=(nrow,)+data.shape[1:],
+                                        compression=self.compression)
+            else:
+                start = self.fh5[dset].shape[0]
+                self.fh5[dset].resize(start+len(data), axis=0)
+                self.fh5[dset][start:] = data
+            self.buffers[n] = []
+        self.fh5.flush()
+
+    def close(self):
+        """Write remaining data and close file."""
+        if self.fh5 is None and not any(self.buffers.values()):
+            return
+        self.flush()
+        self.fh5.close()
+        self.fh5 = None
 
     def increment(self):
         self.index = (self.index + 1) // self.nav
@@ -2,7 +2,7 @@ import cmath
 import math
 import numpy
 import sys
-from pauxy.propagation.operations import kinetic_real
+from pauxy.propagation.operations import kinetic_real, kinetic_real_batch
 from pauxy.propagation.hubbard import HubbardContinuous
 from pauxy.propagation.planewave import PlaneWave
 from pauxy.propagation.generic import GenericContinuous
@@ -26,6 +26,19 @@ class Continuous(object):
             if verbose:
                 print("# Setting force bias to %r."%self.force_bias)
         self.exp_nmax = options.get('expansion_order', 6)
+        self.adaptive_exp = options.get('adaptive_expansion', False)
+        self.exp_tol = options.get('expansion_tol', 1e-6)
+        self.exp_scaling = options.get('expansion_scaling', True)
+        if verbose and self.adaptive_exp:
+            print("# Using adaptive Taylor expansion of two-body propagator.")
+            print("# Maximum expansion order: {:d}. Tolerance: {:13.8e}."
+                  .format(self.exp_nmax, self.exp_tol))
+            print("# Using scaling for large potentials: "
+                  "{}.".format(self.exp_scaling))
+        # Number of terms in Taylor expansion and number of applications of
+        # exponential for average expansion order.
+        self.exp_nterms = 0
+        self.exp_ncalls = 0
         # Derived Attributes
         self.dt = qmc.dt
         self.sqrt_dt = qmc.dt**0.5
@@ -47,15 +60,20 @@ class Continuous(object):
 
         self.ebound = (2.0/self.dt)**0.5
         self.mean_local_energy = 0
+        # Single determinant walkers obtain the overlap and Green's function
+        # from one LU factorisation per spin.
+        self.fused_greens = trial.ndets == 1
 
         if self.free_projection:
             if verbose:
                 print("# Using free projection.")
             self.propagate_walker = self.propagate_walker_free
+            self.propagate_walker_batch = self.propagate_walker_batch_free
         else:
             if verbose:
                 print("# Using phaseless approximation.")
             self.propagate_walker = self.propagate_walker_phaseless
+            self.propagate_walker_batch = self.propagate_walker_batch_phaseless
         self.verbose = verbose
 
     def apply_exponential(self, phi, VHS, debug=False):
@@ -73,6 +91,8 @@ class Continuous(object):
         phi : numpy array
             Exp(VHS) * phi
         """
+        if self.adaptive_exp:
+            return self.apply_exponential_adaptive(phi, VHS)
         if debug:
             copy = numpy.copy(phi)
             c2 = scipy.linalg.expm(VHS).dot(copy)
@@ -87,6 +107,133 @@ class Continuous(object):
             print("DIFF: {: 10.8e}".format((c2 - phi).sum() / c2.size))
         return phi
 
+    def apply_exponential_batch(self, phi, VHS):
+        """Apply exponential propagator of the HS transformation to a batch.
+
+        Parameters
+        ----------
+        phi : numpy array
+            Batch of states of shape (nwalkers, nbasis, nsigma). Updated
+            inplace.
+        VHS : numpy array
+            HS transformation potentials of shape (nwalkers, nbasis, nbasis).
+
+        Returns
+        -------
+        phi : numpy array
+            Exp(VHS) * phi
+        """
+        if self.adaptive_exp:
+            return self.apply_exponential_batch_adaptive(phi, VHS)
+        Temp = numpy.copy(phi)
+        for n in range(1, self.exp_nmax+1):
+            Temp = numpy.matmul(VHS, Temp) / n
+            phi += Temp
+        return phi
+
+    def get_exponential_scaling(self, VHS):
+        """Number of steps to split exponential of HS potential into.
+
+        Parameters
+        ----------
+        VHS : numpy array
+            HS transformation potential(s). The last two axes are the matrix
+            indices.
+
+        Returns
+        -------
+        nscale : int / numpy array
+            exp(VHS) is applied as nscale applications of exp(VHS/nscale) so
+            that the 1-norm of the scaled potential is at most one.
+        """
+        norm = numpy.max(numpy.sum(numpy.abs(VHS), axis=-2), axis=-1)
+        return numpy.maximum(numpy.ceil(norm), 1).astype(int)
+
+    def apply_exponential_adaptive(self, phi, VHS):
+        """Apply exponential propagator using adaptive order Taylor series.
+
+        The series is truncated once the norm of the next term falls below
+        exp_tol relative to the norm of phi.
+
+        Parameters
+        ----------
+        phi : numpy array
+            a state. Updated inplace.
+        VHS : numpy array
+            HS transformation potential
+
+        Returns
+        -------
+        phi : numpy array
+            Exp(VHS) * phi
+        """
+        nscale = 1
+        if self.exp_scaling:
+            nscale = self.get_exponential_scaling(VHS)
+            if nscale > 1:
+                VHS = VHS / nscale
+        thresh = self.exp_tol * numpy.linalg.norm(phi)
+        for i in range(nscale):
+            Temp = numpy.copy(phi)
+            for n in range(1, self.exp_nmax+1):
+                Temp = VHS.dot(Temp) / n
+                phi += Temp
+                if numpy.linalg.norm(Temp) < thresh:
+                    break
+            self.exp_nterms += n
+        self.exp_ncalls += 1
+        return phi
+
+    def apply_exponential_batch_adaptive(self, phi, VHS):
+        """Apply exponential propagator to a batch using adaptive order.
+
+        The series of each walker is truncated once the norm of its next term
+        falls below exp_tol relative to the norm of its phi.
+
+        Parameters
+        ----------
+        phi : numpy array
+            Batch of states of shape (nwalkers, nbasis, nsigma). Updated
+            inplace.
+        VHS : numpy array
+            HS transformation potentials of shape (nwalkers, nbasis, nbasis).
+
+        Returns
+        -------
+        phi : numpy array
+            Exp(VHS) * phi
+        """
+        nwalkers = phi.shape[0]
+        nscale = numpy.ones(nwalkers, dtype=int)
+        if self.exp_scaling:
+            nscale = self.get_exponential_scaling(VHS)
+            VHS = VHS / nscale[:,None,None]
+        thresh = self.exp_tol * numpy.linalg.norm(phi, axis=(1,2))
+        for i in range(numpy.max(nscale)):
+            idx = nscale > i
+            if numpy.all(idx):
+                phi_sub, VHS_sub, thresh_sub = phi, VHS, thresh
+            else:
+                phi_sub, VHS_sub, thresh_sub = phi[idx], VHS[idx], thresh[idx]
+            Temp = numpy.copy(phi_sub)
+            # Walkers stop accumulating terms once their own series has
+            # converged.
+            order = numpy.full(len(phi_sub), self.exp_nmax)
+            active = numpy.ones(len(phi_sub), dtype=bool)
+            for n in range(1, self.exp_nmax+1):
+                Temp = numpy.matmul(VHS_sub, Temp) / n
+                phi_sub += Temp * active[:,None,None]
+                small = numpy.linalg.norm(Temp, axis=(1,2)) < thresh_sub
+                order[active & small] = n
+                active &= ~small
+                if not numpy.any(active):
+                    break
+            if not numpy.all(idx):
+                phi[idx] = phi_sub
+            self.exp_nterms += numpy.sum(order)
+        self.exp_ncalls += nwalkers
+        return phi
+
     def two_body_propagator(self, walker, system, trial):
         """It appliese the two-body propagator
         Parameters
@@ -143,6 +290,61 @@ class Continuous(object):
 
         return (cmf, cfb, xshifted)
 
+    def two_body_propagator_batch(self, walker_batch, system, trial):
+        """Apply the two-body propagator to a batch of walkers.
+
+        Parameters
+        ----------
+        walker_batch : :class:`pauxy.walkers.single_det_batch.SingleDetWalkerBatch`
+            Batch of walkers.
+        system :
+            system class
+        trial :
+            trial wavefunction class
+
+        Returns
+        -------
+        cmf : numpy array
+            the constant factor arising from mean-field shift for each walker.
+        cfb : numpy array
+            the constant factor arising from the force-bias for each walker.
+        xshifted : numpy array
+            shifted auxiliary fields of shape (nwalkers, nfields).
+        """
+        nwalkers = walker_batch.nwalkers
+        # Drawn in the same order as the per-walker propagator.
+        xi = numpy.random.normal(0.0, 1.0, nwalkers*system.nfields)
+        xi = xi.reshape(nwalkers, system.nfields)
+
+        xbar = numpy.zeros((nwalkers, system.nfields))
+        if self.force_bias:
+            xbar = self.propagator.construct_force_bias_batch(system,
+                                                              walker_batch,
+                                                              trial)
+        absxbar = numpy.absolute(xbar)
+        idx_to_rescale = absxbar > 1.0
+        nrescale = numpy.sum(idx_to_rescale)
+        if nrescale > 0:
+            self.nfb_trig += nrescale
+            xbar[idx_to_rescale] /= absxbar[idx_to_rescale]
+
+        xshifted = xi - xbar
+
+        # Constant factor arising from force bias and mean field shift
+        cmf = -self.sqrt_dt * xshifted.dot(self.propagator.mf_shift)
+        # Constant factor arising from shifting the propability distribution.
+        cfb = (numpy.einsum('wn,wn->w', xi, xbar) -
+               0.5*numpy.einsum('wn,wn->w', xbar, xbar))
+
+        # Operator terms contributing to propagator.
+        VHS = self.propagator.construct_VHS_batch(system, xshifted)
+        nup = system.nup
+        self.apply_exponential_batch(walker_batch.phi[:,:,:nup], VHS)
+        if system.ndown > 0:
+            self.apply_exponential_batch(walker_batch.phi[:,:,nup:], VHS)
+
+        return (cmf, cfb, xshifted)
+
     def propagate_walker_free(self, walker, system, trial, eshift):
         """Free projection propagator
         Parameters
@@ -162,14 +364,34 @@ class Continuous(object):
         (cmf, cfb, xmxbar) = self.two_body_propagator(walker, system, trial)
         # 3. Apply kinetic projector.
         kinetic_real(walker.phi, system, self.propagator.BH1)
-        walker.inverse_overlap(trial)
-        walker.ot = walker.calc_otrial(trial)
-        walker.greens_function(trial)
+        walker.ot = self.update_greens_function(walker, trial)
         # Constant terms are included in the walker's weight.
         (magn, dtheta) = cmath.polar(cmath.exp(cmf+self.dt*eshift))
         walker.weight *= magn
         walker.phase *= cmath.exp(1j*dtheta)
 
+    def update_greens_function(self, walker, trial):
+        """Update walker's Green's function and compute its overlap.
+
+        Parameters
+        ----------
+        walker :
+            walker class
+        trial :
+            trial wavefunction class
+
+        Returns
+        -------
+        ot : float / complex
+            Overlap of walker with trial wavefunction.
+        """
+        if self.fused_greens:
+            return walker.overlap_greens_function(trial)
+        else:
+            walker.inverse_overlap(trial)
+            walker.greens_function(trial)
+            return walker.calc_otrial(trial)
+
     def apply_bound(self, ehyb, eshift):
         # For initial steps until first estimator communication eshift will be
         # zero and hybrid energy can be incorrectly. So just avoid capping for
@@ -206,9 +428,7 @@ class Continuous(object):
         kinetic_real(walker.phi, system, self.propagator.BH1)
 
         # Now apply phaseless approximation
-        walker.inverse_overlap(trial)
-        walker.greens_function(trial)
-        ot_new = walker.calc_otrial(trial)
+        ot_new = self.update_greens_function(walker, trial)
         ovlp_ratio = ot_new / walker.ot
         hybrid_energy = -(cmath.log(ovlp_ratio) + cfb + cmf)/self.dt
         hybrid_energy = self.apply_bound(hybrid_energy, eshift)
@@ -238,6 +458,79 @@ class Continuous(object):
             walker.ot = ot_new
             walker.weight = 0.0
 
+    def propagate_walker_batch_free(self, walker_batch, system, trial, eshift):
+        """Free projection propagator for a batch of walkers.
+
+        Parameters
+        ----------
+        walker_batch : :class:`pauxy.walkers.single_det_batch.SingleDetWalkerBatch`
+            Batch of walkers.
+        system :
+            system class
+        trial :
+            trial wavefunction class
+        """
+        kinetic_real_batch(walker_batch.phi, system, self.propagator.BH1)
+        (cmf, cfb, xmxbar) = self.two_body_propagator_batch(walker_batch,
+                                                            system, trial)
+        kinetic_real_batch(walker_batch.phi, system, self.propagator.BH1)
+        walker_batch.ot = walker_batch.overlap_greens_function(trial)
+        # Constant terms are included in the walker's weight.
+        fac = numpy.exp(cmf+self.dt*eshift)
+        magn = numpy.absolute(fac)
+        walker_batch.weight *= magn
+        walker_batch.phase *= fac / magn
+
+    def apply_bound_batch(self, ehyb, eshift):
+        """Batched version of :meth:`apply_bound`."""
+        if abs(eshift) < 1e-10:
+            return ehyb
+        emax = eshift.real + self.ebound
+        emin = eshift.real - self.ebound
+        above = ehyb.real > emax
+        below = ehyb.real < emin
+        self.nhe_trig += numpy.sum(above) + numpy.sum(below)
+        ehyb = numpy.where(above, emax+1j*ehyb.imag, ehyb)
+        ehyb = numpy.where(below, emin+1j*ehyb.imag, ehyb)
+        return ehyb
+
+    def propagate_walker_batch_phaseless(self, walker_batch, system, trial,
+                                         eshift):
+        """Phaseless propagator for a batch of walkers.
+
+        Parameters
+        ----------
+        walker_batch : :class:`pauxy.walkers.single_det_batch.SingleDetWalkerBatch`
+            Batch of walkers.
+        system :
+            system class
+        trial :
+            trial wavefunction class
+        """
+        kinetic_real_batch(walker_batch.phi, system, self.propagator.BH1)
+        (cmf, cfb, xmxbar) = self.two_body_propagator_batch(walker_batch,
+                                                            system, trial)
+        kinetic_real_batch(walker_batch.phi, system, self.propagator.BH1)
+
+        # Now apply phaseless approximation
+        ot_new = walker_batch.overlap_greens_function(trial)
+        ovlp_ratio = ot_new / walker_batch.ot
+        hybrid_energy = -(numpy.log(ovlp_ratio) + cfb + cmf)/self.dt
+        hybrid_energy = self.apply_bound_batch(hybrid_energy, eshift)
+        importance_function = numpy.exp(
+                -self.dt*(0.5*(hybrid_energy+walker_batch.hybrid_energy)-eshift)
+        )
+        magn = numpy.absolute(importance_function)
+        walker_batch.hybrid_energy = hybrid_energy
+        # Determine cosine phase from Arg(<psi_T|B(x-\bar{x})|phi>/<psi_T|phi>)
+        dtheta = (-self.dt*hybrid_energy-cfb).imag
+        cosine_fac = numpy.maximum(0, numpy.cos(dtheta))
+        finite = numpy.isfinite(magn)
+        walker_batch.weight = numpy.where(finite,
+                                          walker_batch.weight*magn*cosine_fac,
+                                          0.0)
+        walker_batch.ot = ot_new
+
 def get_continuous_propagator(system, trial, qmc, options={}, verbose=False):
     """Wrapper to select propagator class.
 
@@ -2,6 +2,7 @@ import cmath
 import math
 import numpy
 import scipy.linalg
+import scipy.sparse
 import sys
 from pauxy.utils.linalg import exponentiate_matrix
 from pauxy.walkers.single_det import SingleDetWalker
@@ -34,6 +35,13 @@ class GenericContinuous(object):
         self.isqrt_dt = 1j*self.sqrt_dt
         if trial.ndets > 1:
             optimised = False
+        if system.chol_group is not None and not optimised:
+            if verbose:
+                print("# Distributed Cholesky vectors require a single "
+                      "determinant trial wavefunction and optimised "
+                      "propagator.")
+            sys.exit()
+        if trial.ndets > 1:
             self.mf_shift = (
                     self.construct_mean_field_shift_multi_det(system, trial)
                     )
@@ -77,12 +85,28 @@ class GenericContinuous(object):
         else:
             mf_shift = 1j*numpy.dot(system.hs_pot.T,
                                     (trial.G[0]+trial.G[1]).ravel())
+        if system.chol_group is not None:
+            mf_shift = system.chol_group.gather(mf_shift)
         return mf_shift
 
     def construct_mean_field_shift_multi_det(self, system, trial):
+        """Compute mean field shift for multi-determinant trial.
+
+        The pairwise transition density matrices are contracted once so the
+        shift is a single product with hs_pot.
+        """
         nb = system.nbasis
-        mf_shift = [trial.contract_one_body(Vpq.reshape(nb,nb)) for Vpq in system.hs_pot.T]
-        mf_shift = 1j*numpy.array(mf_shift)
+        if not hasattr(trial, 'compute_transition_density'):
+            mf_shift = [trial.contract_one_body(Vpq.reshape(nb,nb))
+                        for Vpq in system.hs_pot.T]
+            return 1j*numpy.array(mf_shift)
+        if trial.transition_dm is None:
+            trial.compute_transition_density()
+        G = trial.transition_dm
+        if system.sparse:
+            mf_shift = 1j*G.ravel()*system.hs_pot
+        else:
+            mf_shift = 1j*numpy.dot(system.hs_pot.T, G.ravel())
         return mf_shift
 
     def construct_one_body_propagator(self, system, dt):
@@ -101,7 +125,12 @@ class GenericContinuous(object):
             Timestep.
         """
         nb = system.nbasis
-        shift = 1j*system.hs_pot.dot(self.mf_shift).reshape(nb,nb)
+        if system.chol_group is not None:
+            mf_shift = self.mf_shift[system.chol_group.slice]
+            shift = system.chol_group.reduce(system.hs_pot.dot(mf_shift))
+        else:
+            shift = system.hs_pot.dot(self.mf_shift)
+        shift = 1j*shift.reshape(nb,nb)
         H1 = system.h1e_mod - numpy.array([shift,shift])
         self.BH1 = numpy.array([scipy.linalg.expm(-0.5*dt*H1[0]),
                                 scipy.linalg.expm(-0.5*dt*H1[1])])
@@ -149,11 +178,53 @@ class GenericContinuous(object):
         else:
             self.vbias = numpy.dot(system.rot_hs_pot[0].T, G[0].ravel())
             self.vbias += numpy.dot(system.rot_hs_pot[1].T, G[1].ravel())
+        if system.chol_group is not None:
+            self.vbias = system.chol_group.gather(self.vbias)
         return - self.sqrt_dt * (1j*self.vbias-self.mf_shift)
 
     def construct_force_bias_multi_det(self, system, walker, trial):
-        vbias = numpy.array([walker.contract_one_body(Vpq, trial)
-                             for Vpq in system.hs_pot.T])
+        """Compute optimal force bias for multi-determinant trial.
+
+        If the trial wavefunction stores half rotated Cholesky vectors the
+        per-determinant half rotated Green's functions, weighted by the
+        determinant overlaps, are contracted with them in a single
+        matrix-vector product per spin. Otherwise the Green's function is
+        first contracted over determinants.
+
+        Parameters
+        ----------
+        walker : :class:`pauxy.walkers.multi_det.MultiDetWalker`
+            Walker.
+
+        Returns
+        -------
+        xbar : :class:`numpy.ndarray`
+            Force bias.
+        """
+        weights = walker.weights / numpy.sum(walker.weights)
+        if (getattr(trial, 'rot_chol_stack', None) is not None and
+                not getattr(walker, 'wick', False) and not system.cplx_chol):
+            nup = system.nup
+            vbias = numpy.zeros(system.nfields, dtype=numpy.complex128)
+            for (s, ix) in enumerate([slice(0,nup), slice(nup,None)]):
+                if walker.inv_ovlp[s].shape[-1] == 0:
+                    continue
+                # Half rotated Green's functions (ndets, nocc, M).
+                Gmod = numpy.matmul(walker.phi[:,ix],
+                                    walker.inv_ovlp[s]).transpose((0,2,1))
+                Gmod = weights[:,None,None] * Gmod
+                vbias += numpy.dot(Gmod.ravel(), trial.rot_chol_stack[s])
+        else:
+            if walker.Gi is None:
+                G = walker.G[0] + walker.G[1]
+            else:
+                G = numpy.einsum('k,kpq->pq', weights,
+                                 walker.Gi[:,0]+walker.Gi[:,1],
+                                 optimize=True)
+            if system.sparse:
+                vbias = G.ravel() * system.hs_pot
+            else:
+                vbias = numpy.dot(system.hs_pot.T, G.ravel())
         return - self.sqrt_dt * (1j*vbias-self.mf_shift)
 
     def construct_VHS_slow(self, system, shifted):
@@ -174,10 +245,88 @@ class GenericContinuous(object):
         VHS : numpy array
             the HS potential
         """
-        VHS = system.hs_pot.dot(xshifted)
+        if system.chol_group is not None:
+            xshifted = xshifted[system.chol_group.slice]
+            VHS = system.chol_group.reduce(system.hs_pot.dot(xshifted))
+        else:
+            VHS = system.hs_pot.dot(xshifted)
         VHS = VHS.reshape(system.nbasis, system.nbasis)
         return  self.isqrt_dt * VHS
 
+    def construct_force_bias_batch(self, system, walker_batch, trial):
+        """Compute optimal force bias for a batch of walkers.
+
+        All walkers are contracted with the half-rotated HS potentials in a
+        single matrix-matrix product.
+
+        Parameters
+        ----------
+        walker_batch : :class:`pauxy.walkers.single_det_batch.SingleDetWalkerBatch`
+            Batch of walkers.
+
+        Returns
+        -------
+        xbar : :class:`numpy.ndarray`
+            Force bias of shape (nwalkers, nfields).
+        """
+        nwalkers = walker_batch.nwalkers
+        Ga = walker_batch.Gmod[0].reshape(nwalkers, -1)
+        Gb = walker_batch.Gmod[1].reshape(nwalkers, -1)
+        vbias = real_complex_dot(system.rot_hs_pot[0], Ga)
+        vbias += real_complex_dot(system.rot_hs_pot[1], Gb)
+        if system.chol_group is not None:
+            vbias = system.chol_group.gather(vbias)
+        return - self.sqrt_dt * (1j*vbias-self.mf_shift)
+
+    def construct_VHS_batch(self, system, xshifted):
+        """Construct the one body potentials for a batch of walkers.
+
+        Parameters
+        ----------
+        system :
+            system class
+        xshifted : numpy array
+            shifited auxiliary fields of shape (nwalkers, nfields).
+
+        Returns
+        -------
+        VHS : numpy array
+            the HS potentials of shape (nwalkers, nbasis, nbasis).
+        """
+        nwalkers = xshifted.shape[0]
+        nb = system.nbasis
+        if system.chol_group is not None:
+            xshifted = xshifted[:,system.chol_group.slice]
+            VHS = real_complex_dot(system.hs_pot.T, xshifted)
+            VHS = system.chol_group.reduce(VHS)
+        else:
+            VHS = real_complex_dot(system.hs_pot.T, xshifted)
+        return self.isqrt_dt * VHS.reshape(nwalkers, nb, nb)
+
+def real_complex_dot(A, X):
+    """Compute (A^T X^T)^T for possibly real A and complex X.
+
+    numpy will upcast a real A to complex before calling BLAS, so for real A
+    the real and imaginary parts of X are contracted separately instead.
+
+    Parameters
+    ----------
+    A : :class:`numpy.ndarray` or :class:`scipy.sparse.csr_matrix`
+        Matrix of shape (N, M).
+    X : :class:`numpy.ndarray`
+        Matrix of shape (nwalkers, N).
+
+    Returns
+    -------
+    Y : :class:`numpy.ndarray`
+        Matrix of shape (nwalkers, M).
+    """
+    if scipy.sparse.issparse(A):
+        return A.T.dot(X.T).T
+    if numpy.iscomplexobj(A) or not numpy.iscomplexobj(X):
+        return numpy.dot(X, A)
+    return numpy.dot(X.real, A) + 1j*numpy.dot(X.imag, A)
+
 def construct_propagator_matrix_generic(system, BT2, config, dt, conjt=False):
     """Construct the full projector from a configuration of auxiliary fields.
 
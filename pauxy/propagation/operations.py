@@ -51,6 +51,23 @@ def kinetic_real(phi, system, bt2, H1diag=False):
         phi[:,:nup] = bt2[0].dot(phi[:,:nup])
         phi[:,nup:] = bt2[1].dot(phi[:,nup:])
 
+def kinetic_real_batch(phi, system, bt2):
+    r"""Propagate a batch of walkers by the kinetic term.
+
+    Parameters
+    ----------
+    phi : :class:`numpy.ndarray`
+        Batch of walker wavefunctions of shape (nwalkers, nbasis, nelec).
+        Updated inplace.
+    system : system object in general.
+        Container for model input options.
+    bt2 : :class:`numpy.ndarray`
+        One body propagator.
+    """
+    nup = system.nup
+    phi[:,:,:nup] = numpy.matmul(bt2[0], phi[:,:,:nup])
+    phi[:,:,nup:] = numpy.matmul(bt2[1], phi[:,:,nup:])
+
 
 
 def local_energy_bound(local_energy, mean, threshold):
@@ -1,16 +1,22 @@
 import numpy
 import os
 import pytest
+import scipy.linalg
+from pauxy.estimators.greens_function import gab_mod_ovlp
 from pauxy.systems.generic import Generic
 from pauxy.trial_wavefunction.multi_slater import MultiSlater
+from pauxy.propagation.continuous import Continuous
 from pauxy.propagation.generic import GenericContinuous
 from pauxy.utils.misc import dotdict
 from pauxy.utils.testing import (
         generate_hamiltonian,
         get_random_nomsd,
-        get_random_phmsd
+        get_random_phmsd,
+        get_random_wavefunction
         )
 from pauxy.walkers.multi_det import MultiDetWalker
+from pauxy.walkers.single_det import SingleDetWalker
+from pauxy.walkers.single_det_batch import SingleDetWalkerBatch
 
 @pytest.mark.unit
 def test_phmsd():
@@ -34,3 +40,131 @@ def test_phmsd():
     walker = MultiDetWalker({}, system, trial)
     fb = prop.construct_force_bias(system, walker, trial)
     vhs = prop.construct_VHS(system, fb)
+
+@pytest.mark.unit
+def test_force_bias_multi_det():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (5,4)
+    options = {'sparse': False}
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=0, inputs=options)
+    wfn = get_random_nomsd(system, ndet=4)
+    init = get_random_wavefunction(nelec, nmo)
+    qmc = dotdict({'dt': 0.005, 'nstblz': 5})
+    trial = MultiSlater(system, wfn, init=init)
+    walker = MultiDetWalker({}, system, trial)
+    prop = GenericContinuous(system, trial, qmc)
+    vbias = numpy.array([walker.contract_one_body(Vpq, trial)
+                         for Vpq in system.hs_pot.T])
+    ref = - prop.sqrt_dt * (1j*vbias-prop.mf_shift)
+    fb = prop.construct_force_bias(system, walker, trial)
+    assert numpy.allclose(fb, ref)
+    trial = MultiSlater(system, wfn, init=init, options={'half_rotate': True})
+    walker = MultiDetWalker({}, system, trial)
+    fb = prop.construct_force_bias(system, walker, trial)
+    assert numpy.allclose(fb, ref)
+
+@pytest.mark.unit
+def test_mean_field_shift_nomsd():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (5,4)
+    na = nelec[0]
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    qmc = dotdict({'dt': 0.005, 'nstblz': 5})
+    for sparse in [False, True]:
+        options = {'sparse': sparse}
+        system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=0,
+                         inputs=options)
+        wfn = get_random_nomsd(system, ndet=4)
+        init = get_random_wavefunction(nelec, nmo)
+        trial = MultiSlater(system, wfn, init=init)
+        prop = GenericContinuous(system, trial, qmc)
+        # Reference: explicit loop over determinant pairs.
+        G = numpy.zeros((nmo,nmo), dtype=numpy.complex128)
+        denom = 0.0
+        for i in range(trial.ndets):
+            for j in range(trial.ndets):
+                di = trial.psi[i]
+                dj = trial.psi[j]
+                ga, gha, ioa = gab_mod_ovlp(di[:,:na], dj[:,:na])
+                gb, ghb, iob = gab_mod_ovlp(di[:,na:], dj[:,na:])
+                ovlp = 1.0/(scipy.linalg.det(ioa)*scipy.linalg.det(iob))
+                cfac = trial.coeffs[i].conj()*trial.coeffs[j].conj()
+                G += cfac * ovlp * (ga+gb)
+                denom += cfac * ovlp
+        G /= denom
+        if sparse:
+            hs_pot = system.hs_pot.toarray()
+        else:
+            hs_pot = system.hs_pot
+        ref = 1j*numpy.dot(hs_pot.T, G.ravel())
+        assert numpy.allclose(prop.mf_shift, ref)
+        assert numpy.isclose(trial.contract_one_body(h1e),
+                             numpy.dot(h1e.ravel(), G.ravel()))
+
+@pytest.mark.unit
+def test_batched_force_bias_vhs():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (5,4)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    qmc = dotdict({'dt': 0.005, 'nstblz': 5})
+    for sparse in [False, True]:
+        options = {'sparse': sparse}
+        system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=0, inputs=options)
+        wfn = get_random_nomsd(system, ndet=1)
+        init = get_random_wavefunction(nelec, nmo)
+        trial = MultiSlater(system, wfn, init=init)
+        system.construct_integral_tensors_real(trial)
+        prop = GenericContinuous(system, trial, qmc)
+        nwalkers = 3
+        walkers = [SingleDetWalker({}, system, trial) for i in range(nwalkers)]
+        for w in walkers:
+            w.phi = get_random_wavefunction(nelec, nmo)
+            w.greens_function(trial)
+        batch = SingleDetWalkerBatch({}, system, trial, nwalkers)
+        batch.phi[:] = [w.phi for w in walkers]
+        batch.greens_function(trial)
+        fb = prop.construct_force_bias_batch(system, batch, trial)
+        vhs = prop.construct_VHS_batch(system, fb)
+        for iw, w in enumerate(walkers):
+            fb_ref = prop.construct_force_bias_fast(system, w, trial)
+            assert numpy.allclose(fb[iw], fb_ref)
+            vhs_ref = prop.construct_VHS_fast(system, fb_ref)
+            assert numpy.allclose(vhs[iw], vhs_ref)
+
+@pytest.mark.unit
+def test_adaptive_exponential():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (4,3)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc)
+    wfn = get_random_nomsd(system, ndet=1, cplx=True)
+    trial = MultiSlater(system, wfn)
+    system.construct_integral_tensors_real(trial)
+    qmc = dotdict({'dt': 0.005, 'nstblz': 5})
+    options = {'adaptive_expansion': True, 'expansion_order': 20,
+               'expansion_tol': 1e-12}
+    prop = Continuous(system, trial, qmc, options=options)
+    VHS = 0.1j*numpy.random.random((3, nmo, nmo))
+    # Large potential triggers scaling.
+    VHS[2] *= 20
+    phi = numpy.random.random((3, nmo, system.nup)).astype(numpy.complex128)
+    ref = numpy.array([scipy.linalg.expm(V).dot(p) for V, p in zip(VHS, phi)])
+    res = prop.apply_exponential(phi[0].copy(), VHS[0])
+    # Series is truncated before maximum order.
+    assert prop.exp_nterms < 20
+    assert numpy.allclose(res, ref[0])
+    prop.exp_nterms = 0
+    res = numpy.array([prop.apply_exponential(p.copy(), V)
+                       for V, p in zip(VHS, phi)])
+    assert numpy.allclose(res, ref)
+    nterms = prop.exp_nterms
+    prop.exp_nterms = 0
+    res = prop.apply_exponential_batch(phi.copy(), VHS)
+    assert numpy.allclose(res, ref)
+    # Each walker is charged with the order at which its own series converged.
+    assert prop.exp_nterms == nterms
@@ -15,6 +15,7 @@ from pauxy.qmc.utils import set_rng_seed
 from pauxy.systems.utils import get_system
 from pauxy.trial_wavefunction.utils import get_trial_wavefunction
 from pauxy.utils.misc import get_git_revision_hash, print_sys_info
+from pauxy.utils.mpi import bcast_object
 from pauxy.utils.io import  to_json, serialise, get_input_value
 from pauxy.walkers.handler import Walkers
 
@@ -104,6 +105,8 @@ class AFQMC(object):
         # else:
             # system = None
         # self.system = comm.bcast(system, root=0)
+        self.setup_timing = {}
+        start = time.time()
         if system is not None:
             self.system = system
         else:
@@ -111,13 +114,23 @@ class AFQMC(object):
                                        default={},
                                        alias=['system'],
                                        verbose=self.verbosity>1)
-            self.system = get_system(sys_opts, verbose=verbose)
+            self.system = get_system(sys_opts, verbose=verbose, comm=comm)
+        self.setup_timing['system'] = time.time() - start
+        # With distributed Cholesky vectors all ranks in a group propagate the
+        # same walkers, so walker operations only involve ranks holding the
+        # same slice of the integrals.
+        self.chol_group = getattr(self.system, 'chol_group', None)
+        if self.chol_group is not None:
+            self.walker_comm = self.chol_group.walker_comm
+        else:
+            self.walker_comm = comm
         qmc_opt = get_input_value(options, 'qmc', default={},
                                   alias=['qmc_options'],
                                   verbose=self.verbosity>1)
         self.qmc = QMCOpts(qmc_opt, self.system,
                            verbose=self.verbosity>1)
-        self.qmc.rng_seed = set_rng_seed(self.qmc.rng_seed, comm)
+        self.qmc.rng_seed = set_rng_seed(self.qmc.rng_seed, comm,
+                                         offset=self.walker_comm.rank)
         self.cplx = self.determine_dtype(options.get('propagator', {}),
                                          self.system)
         twf_opt = get_input_value(options, 'trial', default={},
@@ -126,6 +139,7 @@ class AFQMC(object):
         if trial is not None:
             self.trial = trial
         else:
+            start = time.time()
             if comm.rank == 0:
                 self.trial = (
                     get_trial_wavefunction(self.system, options=twf_opt,
@@ -133,19 +147,26 @@ class AFQMC(object):
                 )
             else:
                 self.trial = None
-            self.trial = comm.bcast(self.trial, root=0)
+            self.setup_timing['trial'] = time.time() - start
+            start = time.time()
+            self.trial = bcast_object(self.trial, comm, root=0)
+            self.setup_timing['trial_bcast'] = time.time() - start
+        start = time.time()
         if self.system.name == "Generic":
             if self.trial.ndets == 1:
                 if self.system.cplx_chol:
                     self.system.construct_integral_tensors_cplx(self.trial)
                 else:
                     self.system.construct_integral_tensors_real(self.trial)
-        if comm.rank == 0:
+        if self.walker_comm.rank == 0:
             self.trial.calculate_energy(self.system)
+        self.setup_timing['integrals'] = time.time() - start
+        start = time.time()
         prop_opt = options.get('propagator', {})
         self.propagators = get_propagator_driver(self.system, self.trial,
                                                  self.qmc, options=prop_opt,
                                                  verbose=verbose)
+        self.setup_timing['propagators'] = time.time() - start
         self.tsetup = time.time() - self._init_time
         wlk_opts = get_input_value(options, 'walkers', default={},
                                    alias=['walker', 'walker_opts'],
@@ -158,10 +179,17 @@ class AFQMC(object):
             Estimators(est_opts, self.root, self.qmc, self.system,
                        self.trial, self.propagators.BT_BP, verbose)
         )
+        if self.chol_group is not None and (self.estimators.back_propagation
+                                            or self.estimators.calc_itcf):
+            if comm.rank == 0:
+                print("# Back propagation is not implemented with distributed "
+                      "Cholesky vectors.")
+            sys.exit()
         # Reset number of walkers so they are evenly distributed across
         # cores/ranks.
         # Number of walkers per core/rank.
-        self.qmc.nwalkers = int(self.qmc.nwalkers/comm.size)
+        wcomm = self.walker_comm
+        self.qmc.nwalkers = int(self.qmc.nwalkers/wcomm.size)
         # Total number of walkers.
         if self.qmc.nwalkers == 0:
             if comm.rank == 0:
@@ -170,12 +198,18 @@ class AFQMC(object):
                       "input file.")
                 print("# Setting one walker per core.")
             self.qmc.nwalkers = 1
-        self.qmc.ntot_walkers = self.qmc.nwalkers * comm.size
+        self.qmc.ntot_walkers = self.qmc.nwalkers * wcomm.size
+        start = time.time()
         self.psi = Walkers(wlk_opts, self.system, self.trial,
                            self.qmc, verbose,
                            nprop_tot=self.estimators.nprop_tot,
                            nbp=self.estimators.nbp,
-                           comm=comm)
+                           comm=wcomm)
+        self.setup_timing['walkers'] = time.time() - start
+        if verbose:
+            print("# Setup timing (root processor):")
+            for (k, v) in self.setup_timing.items():
+                print("# - {:s}: {:.6f} s".format(k, v))
         if comm.rank == 0:
             json.encoder.FLOAT_REPR = lambda o: format(o, '.6f')
             json_string = to_json(self)
@@ -196,19 +230,33 @@ class AFQMC(object):
         """
         if psi is not None:
             self.psi = psi
+        if self.chol_group is not None:
+            comm = self.walker_comm
+        # Only the first rank of each Cholesky group contributes to estimators.
+        leader = self.chol_group is None or self.chol_group.comm.rank == 0
         self.setup_timers()
-        (etot, e1b, e2b) = self.psi.walkers[0].local_energy(self.system)
-        eshift = 0
+        restart = self.psi.restart_state
+        if restart is not None:
+            # Resume from checkpoint.
+            first_step = int(restart['attrs'].get('step', 0)) + 1
+            eshift = float(restart['attrs'].get('eshift', 0.0))
+            self.estimators.set_state(restart['state'])
+            self.estimators.estimators['mixed'].eshift = eshift
+            self.psi.restart_state = None
+        else:
+            first_step = 1
+            eshift = 0
         self.propagators.mean_local_energy = eshift.real
-        # Calculate estimates for initial distribution of walkers.
-        self.estimators.estimators['mixed'].update(self.system, self.qmc,
-                                                   self.trial, self.psi, 0,
-                                                   self.propagators.free_projection)
-        # Print out zeroth step for convenience.
-        if verbose:
-            self.estimators.estimators['mixed'].print_step(comm, comm.size, 0, 1)
+        if restart is None:
+            # Calculate estimates for initial distribution of walkers.
+            self.estimators.estimators['mixed'].update(self.system, self.qmc,
+                                                       self.trial, self.psi, 0,
+                                                       self.propagators.free_projection)
+            # Print out zeroth step for convenience.
+            if verbose and leader:
+                self.estimators.estimators['mixed'].print_step(comm, comm.size, 0, 1)
 
-        for step in range(1, self.qmc.total_steps + 1):
+        for step in range(first_step, self.qmc.total_steps + 1):
             start_step = time.time()
             if step % self.qmc.nstblz == 0:
                 start = time.time()
@@ -216,6 +264,13 @@ class AFQMC(object):
                                        self.propagators.free_projection)
                 self.tortho += time.time() - start
             start = time.time()
+            if self.psi.batched:
+                batch = self.psi.batch
+                self.propagators.propagate_walker_batch(batch, self.system,
+                                                        self.trial, eshift)
+                if step > 1:
+                    wmax = batch.total_weight * 0.10
+                    batch.weight[numpy.abs(batch.weight) > wmax] = wmax
             for w in self.psi.walkers:
                 if abs(w.weight) > 1e-8:
                     self.propagators.propagate_walker(w, self.system,
@@ -233,14 +288,25 @@ class AFQMC(object):
                                    self.trial, self.psi, step,
                                    self.propagators.free_projection)
             self.testim += time.time() - start
-            self.estimators.print_step(comm, comm.size, step)
-            if self.psi.write_restart and step % self.psi.write_freq == 0:
-                self.psi.write_walkers(comm)
+            if leader:
+                self.estimators.print_step(comm, comm.size, step)
             if step < self.qmc.neqlb:
                 eshift = self.estimators.estimators['mixed'].get_shift()
             else:
                 eshift += (self.estimators.estimators['mixed'].get_shift()-eshift)
+            if self.chol_group is not None:
+                eshift = self.chol_group.comm.bcast(eshift, root=0)
+            if (leader and self.psi.write_restart and
+                    step % self.psi.write_freq == 0):
+                # Estimator rows up to this step must be on disk before the
+                # checkpoint marks them as done.
+                if self.root:
+                    self.estimators.flush()
+                self.psi.write_walkers(comm,
+                                       attrs={'step': step, 'eshift': eshift},
+                                       state=self.estimators.get_state())
             self.tstep += time.time() - start_step
+        self.estimators.close()
 
     def finalise(self, verbose=False):
         """Tidy up.
@@ -265,6 +331,10 @@ class AFQMC(object):
                 print("# - Propagation: {:.6f} s".format(self.tprop/nsteps))
                 print("# - Estimators: {:.6f} s".format(self.testim/nsteps))
                 print("# - Population control: {:.6f} s".format(self.tpopc/npcon))
+                if getattr(self.propagators, 'adaptive_exp', False):
+                    ncalls = max(self.propagators.exp_ncalls, 1)
+                    print("# - Average Taylor expansion order: {:.2f}"
+                          .format(self.propagators.exp_nterms/ncalls))
 
 
     def determine_dtype(self, propagator, system):
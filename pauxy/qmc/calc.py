@@ -19,6 +19,7 @@ from pauxy.qmc.thermal_afqmc import ThermalAFQMC
 from pauxy.estimators.handler import Estimators
 from pauxy.utils.io import  to_json, get_input_value
 from pauxy.utils.misc import serialise
+from pauxy.utils.mpi import bcast_object
 from pauxy.walkers.handler import Walkers
 from pauxy.qmc.comm import FakeComm
 
@@ -121,13 +122,15 @@ def setup_parallel(options, comm=None, verbose=False):
     """
     if comm.rank == 0:
         afqmc = get_driver(options, comm)
-        system = afqmc.system
         print("# Setup base driver.")
     else:
         afqmc = None
-        system = None
-    system = comm.bcast(system)
-    afqmc = comm.bcast(afqmc, root=0)
+    start = time.time()
+    # Large arrays (e.g. the trial wavefunction and integrals) are broadcast
+    # as raw buffers rather than pickled.
+    afqmc = bcast_object(afqmc, comm, root=0)
+    if comm.rank == 0:
+        print("# Time to broadcast driver: {:.6f} s".format(time.time()-start))
     afqmc.init_time = time.time()
     if afqmc.trial.error:
         print("# Error in constructing trial wavefunction. Exiting")
@@ -1,3 +1,4 @@
+import copy
 import numpy
 from mpi4py import MPI
 import os
@@ -266,9 +267,63 @@ def test_generic_single_det():
     assert rdm[0,1].trace() == pytest.approx(nelec[1])
     assert rdm[11,0,1,3].real == pytest.approx(-0.121883381144845)
 
+@pytest.mark.driver
+def test_generic_restart():
+    nmo = 11
+    nelec = (3,3)
+    options = {
+            'verbosity': 0,
+            'get_sha1': False,
+            'qmc': {
+                'timestep': 0.005,
+                'steps': 10,
+                'blocks': 2,
+                'rng_seed': 8,
+            },
+            'trial': {
+                'name': 'hartree_fock'
+            }
+        }
+    numpy.random.seed(7)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    sys = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc)
+    comm = MPI.COMM_WORLD
+    afqmc = AFQMC(comm=comm, system=sys, options=options)
+    afqmc.run(comm=comm, verbose=0)
+    ref = afqmc.psi.get_walker_buffers()
+    # Checkpoint after first block then restart.
+    opts = copy.deepcopy(options)
+    opts['qmc']['blocks'] = 1
+    opts['walkers'] = {'write_freq': 10, 'write_file': 'restart_test.h5'}
+    afqmc = AFQMC(comm=comm, system=sys, options=opts)
+    # Estimator output must be flushed to the checkpointed step.
+    write_walkers = afqmc.psi.write_walkers
+    rows = []
+    def checkpoint(comm, attrs=None, state=None):
+        if comm.rank == 0:
+            fh5 = afqmc.estimators.estimators['mixed'].output.fh5
+            rows.append((attrs['step'], fh5['basic/energies'].shape[0]))
+        write_walkers(comm, attrs=attrs, state=state)
+    afqmc.psi.write_walkers = checkpoint
+    afqmc.run(comm=comm, verbose=0)
+    if comm.rank == 0:
+        assert rows == [(10, 1)]
+    opts = copy.deepcopy(options)
+    opts['walkers'] = {'read_file': 'restart_test.h5'}
+    afqmc = AFQMC(comm=comm, system=sys, options=opts)
+    assert afqmc.psi.restart_state['attrs']['step'] == 10
+    afqmc.run(comm=comm, verbose=0)
+    assert numpy.array_equal(afqmc.psi.get_walker_buffers(), ref)
+    # Restart with a different number of walkers.
+    opts['qmc']['nwalkers'] = 4
+    afqmc = AFQMC(comm=comm, system=sys, options=opts)
+    assert afqmc.psi.restart_state['attrs']['step'] == 10
+    assert afqmc.psi.get_walker_buffers().shape[0] == 4 // comm.size
+    assert numpy.allclose(afqmc.psi.get_weights(), 1.0)
+
 def teardown_module(self):
     cwd = os.getcwd()
-    files = ['estimates.0.h5']
+    files = ['estimates.0.h5', 'restart_test.h5']
     for f in files:
         try:
             os.remove(cwd+'/'+f)
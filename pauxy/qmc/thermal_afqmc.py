@@ -116,7 +116,8 @@ class ThermalAFQMC(object):
                                        alias=['model'],
                                        verbose=self.verbosity>1)
             sys_opts['thermal'] = True
-            self.system = get_system(sys_opts=sys_opts, verbose=verbose)
+            self.system = get_system(sys_opts=sys_opts, verbose=verbose,
+                                     comm=comm)
         self.qmc = QMCOpts(qmc_opts, self.system, verbose)
         self.qmc.rng_seed = set_rng_seed(self.qmc.rng_seed, comm)
         self.qmc.ntime_slices = int(round(self.qmc.beta/self.qmc.dt))
@@ -228,6 +229,7 @@ class ThermalAFQMC(object):
             self.estimators.print_step(comm, self.nprocs, step,
                                        free_projection=self.propagators.free_projection)
             self.walk.reset(self.trial)
+        self.estimators.close()
 
     def finalise(self, verbose):
         """Tidy up.
@@ -251,6 +253,10 @@ class ThermalAFQMC(object):
                 print("# - Propagation: %f s"%(self.tprop/nslice))
                 print("# - Estimators: %f s"%(self.testim/nsteps))
                 print("# - Population control: %f s"%(self.tpopc/npcon))
+                if getattr(self.propagators, 'adaptive_exp', False):
+                    ncalls = max(self.propagators.exp_ncalls, 1)
+                    print("# - Average Taylor expansion order: %.2f"
+                          %(self.propagators.exp_nterms/ncalls))
 
     def determine_dtype(self, propagator, system):
         """Determine dtype for trial wavefunction and walkers.
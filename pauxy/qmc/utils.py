@@ -1,6 +1,22 @@
 import numpy
 
-def set_rng_seed(seed, comm):
+def set_rng_seed(seed, comm, offset=None):
+    """Set numpy's random number generator seed.
+
+    Parameters
+    ----------
+    seed : int
+        Base seed. If None a random seed is generated on the root processor.
+    comm : MPI communicator
+        Communicator.
+    offset : int
+        Offset added to base seed. Optional. Default comm.rank.
+
+    Returns
+    -------
+    seed : int
+        Seed used on this processor.
+    """
     if seed is None:
         # only set "random" part of seed on parent processor so we can reproduce
         # results in when running in parallel.
@@ -11,6 +27,36 @@ def set_rng_seed(seed, comm):
             seed = numpy.empty(1, dtype='i4')
         comm.Bcast(seed, root=0)
         seed = seed[0]
-    seed = seed + comm.rank
+    if offset is None:
+        offset = comm.rank
+    seed = seed + offset
     numpy.random.seed(seed)
     return seed
+
+def get_rng_state():
+    """Get state of numpy's global random number generator.
+
+    Returns
+    -------
+    state : dict
+        Generator state as numpy arrays suitable for writing to file.
+    """
+    (name, keys, pos, has_gauss, cached_gaussian) = numpy.random.get_state()
+    return {'keys': numpy.array(keys, dtype=numpy.uint32),
+            'pos': numpy.array([pos], dtype=numpy.int64),
+            'has_gauss': numpy.array([has_gauss], dtype=numpy.int64),
+            'cached_gaussian': numpy.array([cached_gaussian])}
+
+def set_rng_state(state):
+    """Set state of numpy's global random number generator.
+
+    Parameters
+    ----------
+    state : dict
+        Generator state returned by :func:`get_rng_state`.
+    """
+    numpy.random.set_state(('MT19937',
+                            numpy.asarray(state['keys'], dtype=numpy.uint32),
+                            int(state['pos'][0]),
+                            int(state['has_gauss'][0]),
+                            float(state['cached_gaussian'][0])))
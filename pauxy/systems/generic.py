@@ -4,11 +4,19 @@ import numpy
 import sys
 import scipy.linalg
 import time
+import scipy.sparse
 from scipy.sparse import csr_matrix
 from pauxy.utils.linalg import modified_cholesky
+from pauxy.utils.mpi import get_shared_memory, is_mpi_comm, CholeskyGroup
+from pauxy.utils.cache import (
+        file_fingerprint,
+        integral_cache_key,
+        read_integral_cache,
+        write_integral_cache,
+        )
 from pauxy.utils.io import (
-        from_qmcpack_sparse,
-        from_qmcpack_dense,
+        from_qmcpack_cholesky,
+        read_qmcpack_cholesky_dims,
         write_qmcpack_sparse,
         write_qmcpack_dense,
         )
@@ -18,6 +26,80 @@ from pauxy.estimators.generic import (
 )
 
 
+def is_complex(chol):
+    """True if Cholesky vectors have a non-negligible imaginary part."""
+    if not numpy.iscomplexobj(chol):
+        return False
+    return numpy.max(numpy.abs(chol.imag)) > 1e-6
+
+
+def construct_vakbl_blocked(A, B, cutoff=None, max_memory=1.0):
+    """Construct sparse V_{(ak)(bl)} from tiles of (a,k) rows.
+
+    Computes
+
+    .. math::
+        V_{(ak)(bl)} = \\sum_n A_{akn} B_{bln} - A_{bkn} B_{aln}
+
+    without forming the dense (na*M, na*M) tensor. Each tile is screened
+    against the cutoff and appended to CSR buffers.
+
+    Parameters
+    ----------
+    A : :class:`numpy.ndarray`
+        Half-rotated vectors of shape (na, M, nfields).
+    B : :class:`numpy.ndarray`
+        Half-rotated vectors of shape (na, M, nfields).
+    cutoff : float
+        Discard elements smaller than this in magnitude. Optional. Default
+        None, i.e., only exact zeros are discarded.
+    max_memory : float
+        Approximate memory in GB to use for dense tiles. Optional. Default
+        1.0.
+
+    Returns
+    -------
+    vakbl : :class:`scipy.sparse.csr_matrix`
+        Sparse (na*M, na*M) matrix.
+    """
+    na, M, nfields = A.shape
+    ncol = na*M
+    dtype = numpy.result_type(A.dtype, B.dtype)
+    if ncol == 0:
+        return csr_matrix((ncol, ncol), dtype=dtype)
+    Bflat = B.reshape(ncol, nfields)
+    # Coulomb and exchange tiles and their difference.
+    row_mem = 3 * ncol * dtype.itemsize
+    nrow = max(1, int(max_memory*1024.0**3) // row_mem)
+    if nrow < M:
+        tiles = [(a, a+1, k, min(k+nrow, M))
+                 for a in range(na) for k in range(0, M, nrow)]
+    else:
+        da = nrow // M
+        tiles = [(a, min(a+da, na), 0, M) for a in range(0, na, da)]
+    data = []
+    indices = []
+    counts = []
+    for (a0, a1, k0, k1) in tiles:
+        rows = A[a0:a1,k0:k1].reshape(-1, nfields)
+        tile = numpy.dot(rows, Bflat.T)
+        exx = numpy.tensordot(A[:,k0:k1], B[a0:a1], axes=((2),(2)))
+        # (b,k,a,l) -> (a,k,b,l)
+        tile -= exx.transpose(2,1,0,3).reshape(tile.shape)
+        if cutoff is not None:
+            mask = numpy.abs(tile) >= cutoff
+        else:
+            mask = tile != 0
+        ix, jx = numpy.nonzero(mask)
+        data.append(tile[ix,jx])
+        indices.append(jx.astype(numpy.int32))
+        counts.append(numpy.count_nonzero(mask, axis=1))
+    indptr = numpy.zeros(ncol+1, dtype=numpy.int64)
+    numpy.cumsum(numpy.concatenate(counts), out=indptr[1:])
+    return csr_matrix((numpy.concatenate(data), numpy.concatenate(indices),
+                       indptr), shape=(ncol, ncol))
+
+
 class Generic(object):
     """Generic system defined by ab-initio Hamiltonian.
 
@@ -49,6 +131,30 @@ class Generic(object):
         Cutoff for cholesky decomposition or minimum eigenvalue.
     verbose : bool
         Print extra information.
+    comm : MPI communicator
+        Required if shared_memory is set. Optional. Default: None.
+    shared_memory : bool
+        Construct integrals on the root rank only and store them once per node
+        in shared memory. Optional. Default False.
+    cholesky_group_size : int
+        Distribute the Cholesky index of the integrals across groups of this
+        many ranks. Each rank only reads its own slice. Requires comm.
+        Optional. Default 1.
+    chol_block_size : int
+        Number of Cholesky vectors processed at once when reading integrals
+        and constructing HS potentials. Optional. Default: blocks of roughly
+        128 MB.
+    integral_tensor_memory : float
+        Approximate memory in GB used for the dense tiles when constructing
+        V_{(ak)(bl)}. Optional. Default 1.0.
+    integral_cache : string
+        Directory used to store half-rotated integrals between runs. Entries
+        are keyed by a hash of the integrals, trial wavefunction and options
+        affecting the half-rotated integrals. Optional. Default None, i.e., no
+        caching.
+    integral_cache_max_entries : int
+        Maximum number of entries kept in integral_cache. Least recently used
+        entries are removed first. Optional. Default 8.
 
     Attributes
     ----------
@@ -72,7 +178,8 @@ class Generic(object):
         integrals.
     """
 
-    def __init__(self, nelec=None, h1e=None, chol=None, ecore=None, inputs={}, verbose=False):
+    def __init__(self, nelec=None, h1e=None, chol=None, ecore=None, inputs={},
+                 verbose=False, comm=None):
         if verbose:
             print("# Parsing input options.")
         self.name = "Generic"
@@ -90,15 +197,38 @@ class Generic(object):
         self.cutoff = inputs.get('sparse_cutoff', None)
         self.sparse = inputs.get('sparse', False)
         self.half_rotated_integrals = inputs.get('integral_tensor', False)
+        self.integral_tensor_memory = inputs.get('integral_tensor_memory', 1.0)
         self._opt = self.sparse
         self.cplx_chol = inputs.get('complex_cholesky', False)
         self.mu = inputs.get('mu', None)
+        self.chol_block_size = inputs.get('chol_block_size', None)
+        self.integral_cache = inputs.get('integral_cache', None)
+        self.integral_cache_max_entries = inputs.get(
+                'integral_cache_max_entries', 8)
+        self._shm = None
+        self.chol_group = None
+        group_size = inputs.get('cholesky_group_size', 1)
+        # Partition the Cholesky index before reading so each rank only ever
+        # holds its own slice.
+        if comm is not None and group_size > 1:
+            self.setup_cholesky_group(comm, group_size, chol=chol)
+        if comm is not None and inputs.get('shared_memory', False):
+            if self.chol_group is None:
+                self._shm = get_shared_memory(comm, verbose=verbose)
+            else:
+                # Ranks on a node holding the same slice share it.
+                self._shm = get_shared_memory(self.chol_group.walker_comm,
+                                              verbose=verbose)
         if verbose:
             print("# Reading integrals from %s." % self.integral_file)
         if chol is not None:
+            if self.chol_group is not None:
+                chol = chol[self.chol_group.slice]
             self.chol_vecs = chol
             self.ecore = ecore
-            if numpy.max(numpy.abs(self.chol_vecs.imag)) > 1e-6:
+            if self._shm is not None:
+                self.chol_vecs = self._shm.share(chol)
+            if is_complex(self.chol_vecs):
                 self.cplx_chol = True
                 if verbose:
                     print("# Found complex integrals.")
@@ -109,8 +239,16 @@ class Generic(object):
                 self.cplx_chol = False
         else:
             start = time.time()
-            h1e, self.chol_vecs, self.ecore = self.read_integrals()
-            if numpy.max(numpy.abs(self.chol_vecs.imag)) > 1e-6:
+            if self._shm is None:
+                h1e, self.chol_vecs, self.ecore = self.read_integrals()
+            else:
+                if self._shm.is_root:
+                    h1e, chol_vecs, ecore = self.read_integrals()
+                else:
+                    h1e = chol_vecs = ecore = None
+                h1e, self.ecore = self._shm.comm.bcast((h1e, ecore), root=0)
+                self.chol_vecs = self._shm.share(chol_vecs)
+            if is_complex(self.chol_vecs):
                 self.cplx_chol = True
                 if verbose:
                     print("# Found complex integrals.")
@@ -124,13 +262,33 @@ class Generic(object):
                        "s".format(time.time()-start))
         self.H1 = numpy.array([h1e,h1e])
         self.nbasis = h1e.shape[0]
+        if self.chol_block_size is None:
+            self.chol_block_size = max(1, 2**27//(16*self.nbasis*self.nbasis))
         self._alt_convention = False
         mem = self.chol_vecs.nbytes / (1024.0**3)
         if verbose:
             print("# Number of orbitals: %d"%self.nbasis)
             print("# Number of electrons: (%d, %d)"%(self.nup, self.ndown))
             print("# Approximate memory required by Cholesky vectors %f GB"%mem)
-        self.nchol = self.chol_vecs.shape[0]
+        if self.chol_group is not None:
+            self.nchol = self.chol_group.nfields
+        else:
+            self.nchol = self.chol_vecs.shape[0]
+        # Only one rank per distinct set of integrals writes to the cache.
+        if comm is None:
+            self._cache_writer = True
+        elif self.chol_group is not None:
+            self._cache_writer = self.chol_group.walker_comm.rank == 0
+        else:
+            self._cache_writer = comm.rank == 0
+        # Identify the integral file once on the root rank.
+        self._integral_file_id = None
+        if self.integral_cache is not None and self.integral_file is not None:
+            if comm is None or comm.rank == 0:
+                self._integral_file_id = file_fingerprint(self.integral_file)
+            if comm is not None:
+                self._integral_file_id = comm.bcast(self._integral_file_id,
+                                                    root=0)
         start = time.time()
         self.construct_h1e_mod()
         if verbose:
@@ -140,55 +298,148 @@ class Generic(object):
         # For consistency
         self.vol = 1.0
         start = time.time()
-        if self.cplx_chol:
-            self.nfields = 2 * self.nchol
-            self.hs_pot = numpy.zeros(shape=(self.nfields,self.nbasis,self.nbasis),
-                                      dtype=numpy.complex128)
-            for (n,cn) in enumerate(self.chol_vecs):
-                vplus = 0.5*(cn+cn.conj().T)
-                vminus = 0.5j*(cn-cn.conj().T)
-                self.hs_pot[n] = vplus
-                self.hs_pot[self.nchol+n] = vminus
+        # Real dense potentials are a view of the (shared) Cholesky vectors.
+        share_hs_pot = self._shm is not None and (self.sparse or self.cplx_chol)
+        if share_hs_pot and not self._shm.is_root:
+            self.hs_pot = None
+            self.nfields = 2*self.nchol if self.cplx_chol else self.nchol
         else:
-            self.hs_pot = self.chol_vecs
-            self.nfields = self.nchol
+            self.construct_hs_pot()
+        if share_hs_pot:
+            self.hs_pot = self._shm.share(self.hs_pot)
         if verbose:
             print("# Number of Cholesky vectors: %d"%(self.nchol))
             print("# Number of fields: %d"%(self.nfields))
             print("# Time to construct Hubbard--Stratonovich potentials: "
                   "%f s"%(time.time()-start))
-        if self.sparse:
-            if verbose:
-                print("# Using sparse linear algebra.")
-            if self.cutoff is not None:
-                self.hs_pot[numpy.abs(self.hs_pot) < self.cutoff] = 0
-            tmp = numpy.transpose(self.hs_pot, axes=(1,2,0))
-            tmp = tmp.reshape(self.nbasis*self.nbasis, self.nfields)
-            self.hs_pot = csr_matrix(tmp)
-        else:
-            self.hs_pot = numpy.transpose(self.hs_pot, axes=(1,2,0))
-            self.hs_pot = self.hs_pot.reshape(self.nbasis*self.nbasis, self.nfields)
         write_ints = inputs.get('write_integrals', None)
         if write_ints is not None:
             self.write_integrals()
         if verbose:
             print("# Finished setting up Generic system object.")
 
+    def construct_hs_pot(self):
+        """Construct (nbasis*nbasis, nfields) Hubbard--Stratonovich potentials.
+
+        For real dense integrals this is a view of the Cholesky vectors. Sparse
+        potentials are built from blocks of vectors.
+        """
+        M = self.nbasis
+        nchol = self.chol_vecs.shape[0]
+        if self.cplx_chol:
+            self.nfields = 2 * self.nchol
+            hs_pot = numpy.zeros(shape=(2*nchol,M,M), dtype=numpy.complex128)
+            for (n,cn) in enumerate(self.chol_vecs):
+                vplus = 0.5*(cn+cn.conj().T)
+                vminus = 0.5j*(cn-cn.conj().T)
+                hs_pot[n] = vplus
+                hs_pot[nchol+n] = vminus
+        else:
+            hs_pot = self.chol_vecs
+            self.nfields = self.nchol
+        hs_pot = hs_pot.reshape(hs_pot.shape[0], M*M).T
+        if self.sparse:
+            if self.verbose:
+                print("# Using sparse linear algebra.")
+            blocks = []
+            for (n0, n1) in self.chol_blocks(hs_pot.shape[1]):
+                tmp = hs_pot[:,n0:n1]
+                if self.cutoff is not None:
+                    tmp = numpy.where(numpy.abs(tmp) < self.cutoff, 0, tmp)
+                blocks.append(csr_matrix(tmp))
+            self.hs_pot = scipy.sparse.hstack(blocks, format='csr')
+            self.hs_pot.sort_indices()
+        else:
+            self.hs_pot = hs_pot
+
+    def chol_blocks(self, n):
+        """Split range(n) into blocks of at most chol_block_size vectors.
+
+        Parameters
+        ----------
+        n : int
+            Number of vectors.
+
+        Returns
+        -------
+        blocks : list
+            List of (start, end) tuples.
+        """
+        bs = self.chol_block_size
+        return [(i, min(i+bs, n)) for i in range(0, n, bs)]
+
+    def setup_cholesky_group(self, comm, group_size, chol=None):
+        """Partition the Cholesky vectors across groups of ranks.
+
+        Only the number and type of the vectors are needed, so this is called
+        before any integrals are read.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+            Global communicator.
+        group_size : int
+            Number of ranks to distribute Cholesky vectors over.
+        chol : :class:`numpy.ndarray`
+            Cholesky vectors if passed in directly. Optional. Default None,
+            i.e., read dimensions from integral file.
+        """
+        if not is_mpi_comm(comm):
+            if self.verbose:
+                print("# Distributed Cholesky vectors require mpi4py.")
+            return
+        if chol is not None:
+            (nchol, cplx) = (chol.shape[0], is_complex(chol))
+        else:
+            if comm.rank == 0:
+                try:
+                    meta = read_qmcpack_cholesky_dims(self.integral_file)
+                except (OSError, KeyError):
+                    meta = None
+            else:
+                meta = None
+            meta = comm.bcast(meta, root=0)
+            if meta is None:
+                # Reported when the integrals are read.
+                return
+            (nmo, nchol, real_ints) = meta
+            cplx = not real_ints
+        if cplx:
+            if self.verbose:
+                print("# Distributed Cholesky vectors are only implemented for "
+                      "real symmetric Cholesky decomposition.")
+            return
+        if comm.size % group_size != 0:
+            if comm.rank == 0:
+                print("# Number of ranks ({:d}) must be divisible by "
+                      "cholesky_group_size ({:d}).".format(comm.size,
+                                                           group_size))
+            sys.exit()
+        self.chol_group = CholeskyGroup(comm, group_size, nchol)
+        if self.verbose:
+            print("# Distributing Cholesky vectors across {:d} "
+                  "ranks.".format(group_size))
+            print("# Number of local Cholesky vectors: "
+                  "{:d}.".format(self.chol_group.counts[0]))
+
     def read_integrals(self):
+        if self.chol_group is not None:
+            (start, end) = (self.chol_group.slice.start,
+                            self.chol_group.slice.stop)
+        else:
+            (start, end) = (0, None)
         try:
-            (h1e, schol_vecs, ecore, nbasis, nup, ndown) = (
-                    from_qmcpack_sparse(self.integral_file)
-                    )
-            chol_vecs = schol_vecs.toarray().T.reshape((-1,nbasis,nbasis))
-        except KeyError:
             (h1e, chol_vecs, ecore, nbasis, nup, ndown) = (
-                    from_qmcpack_dense(self.integral_file)
+                    from_qmcpack_cholesky(self.integral_file, start=start,
+                                          end=end,
+                                          block_size=self.chol_block_size)
                     )
-            chol_vecs = chol_vecs.T.reshape((-1,nbasis,nbasis))
         except OSError:
             print("# Unknown Hamiltonian file {}.".format(self.integral_file))
-        except:
+            sys.exit()
+        except KeyError:
             print("# Unknown Hamiltonian file format.")
+            sys.exit()
         if ((nup != self.nup) or ndown != self.ndown):
             print("# Warning: Number of electrons differs from integral file.")
             print("# file: %d %d vs. input: %d %d"%(nup, ndown, self.nup, self.ndown))
@@ -197,14 +448,29 @@ class Generic(object):
     def construct_h1e_mod(self):
         # Subtract one-body bit following reordering of 2-body operators.
         # Eqn (17) of [Motta17]_
-        v0 = 0.5 * numpy.einsum('lik,ljk->ij', self.chol_vecs,
-                                self.chol_vecs.conj(), optimize='optimal')
+        if self._shm is None or self._shm.is_root:
+            M = self.nbasis
+            v0 = numpy.zeros((M,M), dtype=self.chol_vecs.dtype)
+            for (n0, n1) in self.chol_blocks(self.chol_vecs.shape[0]):
+                L = self.chol_vecs[n0:n1]
+                v0 += 0.5 * numpy.tensordot(L, L.conj(), axes=((0,2),(0,2)))
+        else:
+            v0 = None
+        if self._shm is not None:
+            v0 = self._shm.comm.bcast(v0, root=0)
+        if self.chol_group is not None:
+            v0 = self.chol_group.reduce(v0)
         self.h1e_mod = numpy.array([self.H1[0]-v0, self.H1[1]-v0])
 
 
     def construct_integral_tensors_real(self, trial):
         # Half rotated cholesky vectors (by trial wavefunction).
         # Assuming nup = ndown here
+        if self._shm is not None and not self._shm.is_root:
+            self.share_integral_tensors()
+            return
+        if self.load_integral_tensors(trial):
+            return
         M = self.nbasis
         na = self.nup
         nb = self.ndown
@@ -214,10 +480,8 @@ class Generic(object):
                           # dtype=numpy.complex128)
         # rdn = numpy.zeros(shape=(self.nchol, nb, M),
                           # dtype=numpy.complex128)
-        if self.sparse:
-            self.hs_pot = self.hs_pot.toarray().reshape(M,M,self.nfields)
-        else:
-            self.hs_pot = self.hs_pot.reshape(M,M,self.nfields)
+        # Column slices of csc matrices are cheap.
+        hs_pot = self.hs_pot.tocsc() if self.sparse else self.hs_pot
         start = time.time()
         # rrup = numpy.einsum('ia,ikn->akn',
                            # trial.psi[:,:na].conj(),
@@ -227,12 +491,21 @@ class Generic(object):
                            # trial.psi[:,na:].conj(),
                            # self.hs_pot,
                            # optimize='greedy')
-        rup = numpy.tensordot(trial.psi[:,:na].conj(),
-                              self.hs_pot,
-                              axes=((0),(0)))
-        rdn = numpy.tensordot(trial.psi[:,na:].conj(),
-                              self.hs_pot,
-                              axes=((0),(0)))
+        nfields = hs_pot.shape[1]
+        dtype = numpy.result_type(trial.psi.dtype, hs_pot.dtype)
+        rup = numpy.zeros((na,M,nfields), dtype=dtype)
+        rdn = numpy.zeros((nb,M,nfields), dtype=dtype)
+        for (n0, n1) in self.chol_blocks(nfields):
+            block = hs_pot[:,n0:n1]
+            if self.sparse:
+                block = block.toarray()
+            block = block.reshape(M,M,-1)
+            rup[:,:,n0:n1] = numpy.tensordot(trial.psi[:,:na].conj(),
+                                             block,
+                                             axes=((0),(0)))
+            rdn[:,:,n0:n1] = numpy.tensordot(trial.psi[:,na:].conj(),
+                                             block,
+                                             axes=((0),(0)))
         trot = time.time() - start
         # This is much faster than einsum.
         # for l in range(self.nchol):
@@ -242,30 +515,25 @@ class Generic(object):
             start = time.time()
             if self.verbose:
                 print("# Constructing half rotated V_{(ab)(kl)}.")
-            vakbl_a = (numpy.einsum('akn,bln->akbl', rup, rup, optimize='greedy') -
-                       numpy.einsum('bkn,aln->akbl', rup, rup, optimize='greedy'))
-            vakbl_b = (numpy.einsum('akn,bln->akbl', rdn, rdn, optimize='greedy') -
-                       numpy.einsum('bkn,aln->akbl', rdn, rdn, optimize='greedy'))
+            self.vakbl = [
+                    construct_vakbl_blocked(rup, rup, cutoff=self.cutoff,
+                                            max_memory=self.integral_tensor_memory),
+                    construct_vakbl_blocked(rdn, rdn, cutoff=self.cutoff,
+                                            max_memory=self.integral_tensor_memory)
+                    ]
             tvakbl = time.time() - start
         if self.cutoff is not None:
             rup[numpy.abs(rup) < self.cutoff] = 0.0
             rdn[numpy.abs(rdn) < self.cutoff] = 0.0
-            if self.half_rotated_integrals:
-                vakbl_a[numpy.abs(vakbl_a) < self.cutoff] = 0.0
-                vakbl_b[numpy.abs(vakbl_b) < self.cutoff] = 0.0
-        if self.half_rotated_integrals:
-            self.vakbl = [csr_matrix(vakbl_a.reshape((M*na, M*na))),
-                          csr_matrix(vakbl_b.reshape((M*nb, M*nb)))]
+        # hs_pot was already screened on construction so is left untouched.
         if self.sparse:
-            if self.cutoff is not None:
-                self.hs_pot[numpy.abs(self.hs_pot) < self.cutoff] = 0
-            self.hs_pot = self.hs_pot.reshape((M*M,-1))
-            self.hs_pot = csr_matrix(self.hs_pot)
             self.rot_hs_pot = [csr_matrix(rup.reshape((M*na, -1))),
                                csr_matrix(rdn.reshape((M*nb, -1)))]
         else:
             self.rot_hs_pot = [rup.reshape((M*na, -1)), rdn.reshape((M*nb, -1))]
-            self.hs_pot = self.hs_pot.reshape((M*M,-1))
+        self.store_integral_tensors(trial)
+        if self._shm is not None:
+            self.share_integral_tensors()
         self.rchol_vecs = self.rot_hs_pot
         if self.verbose:
             print("# Time to construct half-rotated Cholesky: %f s"%trot)
@@ -292,34 +560,27 @@ class Generic(object):
     def construct_integral_tensors_cplx(self, trial):
         # Half rotated cholesky vectors (by trial wavefunction).
         # Assuming nup = ndown here
+        if self._shm is not None and not self._shm.is_root:
+            self.share_integral_tensors()
+            return
+        if self.load_integral_tensors(trial):
+            return
         M = self.nbasis
         na = self.nup
         nb = self.ndown
         if self.verbose:
             print("# Constructing complex half rotated HS Potentials.")
-        rup = numpy.zeros(shape=(self.nfields, na, M),
-                          dtype=numpy.complex128)
-        rdn = numpy.zeros(shape=(self.nfields, nb, M),
-                          dtype=numpy.complex128)
-        # rup = numpy.einsum('ia,lik->lak',
-                           # trial.psi[:,:na].conj(),
-                           # self.hs_pot)
-        # rdn = numpy.einsum('ia,lik->lak',
-                           # trial.psi[:,na:].conj(),
-                           # self.hs_pot)
-        # This is much faster than einsum.
         start = time.time()
-        if self.sparse:
-            self.hs_pot = self.hs_pot.toarray().reshape(M,M,self.nfields)
-            self.hs_pot = self.hs_pot.transpose(2,0,1)
-        for (n,cn) in enumerate(self.hs_pot):
-            rup[n] = numpy.dot(trial.psi[:,:na].conj().T, self.hs_pot[n])
-            rdn[n] = numpy.dot(trial.psi[:,na:].conj().T, self.hs_pot[n])
-        self.rot_hs_pot = [csr_matrix(rup.reshape((-1,M*na)).T),
-                           csr_matrix(rdn.reshape((-1,M*nb)).T)]
+        rup = self.half_rotate_hs_pot(trial.psi[:,:na])
+        rdn = self.half_rotate_hs_pot(trial.psi[:,na:])
+        self.rot_hs_pot = [csr_matrix(rup.reshape((M*na,-1))),
+                           csr_matrix(rdn.reshape((M*nb,-1)))]
         if self.verbose:
             print("# Time to construct half-rotated HS potentials: "
                   "%f s"%(time.time()-start))
+            mem = (rup.nbytes + rdn.nbytes) / (1024.0**3)
+            print("# Approximate memory used for dense intermediates %f "
+                  "GB"%mem)
             nnz = self.rot_hs_pot[0].nnz
             print("# Number of non-zero elements in rotated potentials: %d"%nnz)
             nelem = self.rot_hs_pot[0].shape[0] * self.rot_hs_pot[0].shape[1]
@@ -327,43 +588,24 @@ class Generic(object):
             mem = (2*nnz*16/(1024.0**3))
             print("# Approximate memory required %f" " GB"%mem)
             print("# Constructing half rotated V_{(ab)(kl)}.")
-        # This is also much faster than einsum.
-        Qak = numpy.zeros((self.nchol, M*na), dtype=numpy.complex128)
-        Rbl = numpy.zeros((self.nchol, M*na), dtype=numpy.complex128)
+        rup = rdn = None
         start = time.time()
-        for (n,cn) in enumerate(self.chol_vecs):
-            Qak[n] = numpy.dot(trial.psi[:,:na].conj().T, cn).ravel()
-            Rbl[n] = numpy.dot(trial.psi[:,:na].conj().T, cn.conj()).ravel()
+        Qak, Rbl = self.half_rotate_cholesky(trial.psi[:,:na])
         if self.verbose:
             print("# Time to construct Qak, Rbl: %f s"%(time.time()-start))
-        Makbl = numpy.dot(Qak.T,Rbl)
-        vakbl_a = (
-            Makbl -
-            Makbl.reshape(na,M,na,M).transpose((2,1,0,3)).reshape(na*M,na*M)
-        )
-        Qak = numpy.zeros((self.nchol, M*nb), dtype=numpy.complex128)
-        Rbl = numpy.zeros((self.nchol, M*nb), dtype=numpy.complex128)
-        for (n,cn) in enumerate(self.chol_vecs):
-            Qak[n] = numpy.dot(trial.psi[:,na:].conj().T, cn).ravel()
-            Rbl[n] = numpy.dot(trial.psi[:,na:].conj().T, cn.conj()).ravel()
-        Makbl = numpy.dot(Qak.T,Rbl)
-        vakbl_b = (
-            Makbl -
-            Makbl.reshape(nb,M,nb,M).transpose((2,1,0,3)).reshape(nb*M,nb*M)
-        )
-        self.vakbl = [csr_matrix(vakbl_a.reshape((M*na, M*na))),
-                      csr_matrix(vakbl_b.reshape((M*nb, M*nb)))]
+            mem = 2 * Qak.nbytes / (1024.0**3)
+            print("# Approximate memory used for Qak, Rbl %f GB"%mem)
+        vakbl_a = construct_vakbl_blocked(Qak, Rbl,
+                                          max_memory=self.integral_tensor_memory)
+        Qak, Rbl = self.half_rotate_cholesky(trial.psi[:,na:])
+        vakbl_b = construct_vakbl_blocked(Qak, Rbl,
+                                          max_memory=self.integral_tensor_memory)
+        self.vakbl = [vakbl_a, vakbl_b]
         tvakbl = time.time() - start
-        # TODO: Stop converting hs pot to dense
-        if self.sparse:
-            if self.cutoff is not None:
-                self.hs_pot[numpy.abs(self.hs_pot) < self.cutoff] = 0
-            tmp = numpy.transpose(self.hs_pot, axes=(1,2,0))
-            tmp = tmp.reshape(self.nbasis*self.nbasis, self.nfields)
-            self.hs_pot = csr_matrix(tmp)
-        else:
-            self.hs_pot = numpy.transpose(self.hs_pot, axes=(1,2,0))
-            self.hs_pot = self.hs_pot.reshape(self.nbasis*self.nbasis, self.nfields)
+        self.rchol_vecs = self.rot_hs_pot
+        self.store_integral_tensors(trial)
+        if self._shm is not None:
+            self.share_integral_tensors()
         if self.verbose:
             print("# Time to construct V_{(ak)(bl)}: %f s"%(tvakbl))
             nnz = self.vakbl[0].nnz
@@ -373,6 +615,164 @@ class Generic(object):
             nelem = self.vakbl[0].shape[0] * self.vakbl[0].shape[1]
             print("# Sparsity: %f"%(1-float(nnz)/nelem))
 
+    def half_rotate_hs_pot(self, psi):
+        """Contract HS potentials with occupied orbitals in blocks of fields.
+
+        Sparse potentials are contracted without being made dense.
+
+        Parameters
+        ----------
+        psi : :class:`numpy.ndarray`
+            Occupied orbitals of shape (M, nocc).
+
+        Returns
+        -------
+        rot : :class:`numpy.ndarray`
+            Half-rotated potentials :math:`\\sum_i \\psi_{ia}^* v_{ik,n}` of
+            shape (nocc, M, nfields).
+        """
+        M = self.nbasis
+        nocc = psi.shape[1]
+        nfields = self.hs_pot.shape[1]
+        rot = numpy.zeros((nocc, M, nfields), dtype=numpy.complex128)
+        hs_pot = self.hs_pot.tocsc() if self.sparse else self.hs_pot
+        for (n0, n1) in self.chol_blocks(nfields):
+            if self.sparse:
+                # (ik,n) -> (i,kn)
+                block = hs_pot[:,n0:n1].tocoo().reshape((M, M*(n1-n0)))
+                tmp = block.T.dot(psi.conj()).T
+                rot[:,:,n0:n1] = tmp.reshape(nocc, M, n1-n0)
+            else:
+                block = hs_pot[:,n0:n1].T.reshape(-1, M, M)
+                tmp = numpy.tensordot(psi.conj(), block, axes=((0),(1)))
+                rot[:,:,n0:n1] = tmp.transpose(0,2,1)
+        return rot
+
+    def half_rotate_cholesky(self, psi):
+        """Contract Cholesky vectors and their conjugates with occupied orbitals.
+
+        Parameters
+        ----------
+        psi : :class:`numpy.ndarray`
+            Occupied orbitals of shape (M, nocc).
+
+        Returns
+        -------
+        Q : :class:`numpy.ndarray`
+            :math:`\\sum_i \\psi_{ia}^* L_{ik,n}` of shape (nocc, M, nchol).
+        R : :class:`numpy.ndarray`
+            :math:`\\sum_i \\psi_{ia}^* L^*_{ik,n}` of shape (nocc, M, nchol).
+        """
+        M = self.nbasis
+        nocc = psi.shape[1]
+        nchol = self.chol_vecs.shape[0]
+        Q = numpy.zeros((nocc, M, nchol), dtype=numpy.complex128)
+        R = numpy.zeros((nocc, M, nchol), dtype=numpy.complex128)
+        for (n0, n1) in self.chol_blocks(nchol):
+            L = self.chol_vecs[n0:n1]
+            Q[:,:,n0:n1] = numpy.tensordot(psi.conj(), L,
+                                           axes=((0),(1))).transpose(0,2,1)
+            R[:,:,n0:n1] = numpy.tensordot(psi.conj(), L.conj(),
+                                           axes=((0),(1))).transpose(0,2,1)
+        return Q, R
+
+    def integral_tensor_key(self, trial):
+        """Cache key for half-rotated integrals built from trial."""
+        options = {'nup': self.nup, 'ndown': self.ndown,
+                   'cutoff': self.cutoff, 'sparse': self.sparse,
+                   'cplx_chol': self.cplx_chol,
+                   'half_rotated_integrals': (self.half_rotated_integrals or
+                                              self.cplx_chol)}
+        if self.chol_group is not None:
+            options['chol_slice'] = (self.chol_group.slice.start,
+                                     self.chol_group.slice.stop)
+        if self.integral_file is not None:
+            return integral_cache_key([trial.psi], options,
+                                      fingerprint=self._integral_file_id)
+        else:
+            return integral_cache_key([self.H1[0], self.chol_vecs, trial.psi],
+                                      options)
+
+    def integral_tensor_shapes(self):
+        """Expected shapes of half-rotated integrals."""
+        M = self.nbasis
+        na = self.nup
+        nb = self.ndown
+        shapes = {'rot_hs_pot': [(M*na, self.hs_pot.shape[1]),
+                                 (M*nb, self.hs_pot.shape[1])]}
+        if self.half_rotated_integrals or self.cplx_chol:
+            shapes['vakbl'] = [(M*na, M*na), (M*nb, M*nb)]
+        return shapes
+
+    def load_integral_tensors(self, trial):
+        """Read half-rotated integrals from integral_cache if possible.
+
+        Parameters
+        ----------
+        trial : trial wavefunction object
+            Trial wavefunction used to rotate integrals.
+
+        Returns
+        -------
+        found : bool
+            True if integrals were read from the cache.
+        """
+        if self.integral_cache is None:
+            return False
+        start = time.time()
+        self._cache_key = self.integral_tensor_key(trial)
+        tensors = read_integral_cache(self.integral_cache, self._cache_key,
+                                      self.integral_tensor_shapes())
+        if tensors is None:
+            if self.verbose:
+                print("# No cached half-rotated integrals found in "
+                      "{}.".format(self.integral_cache))
+            return False
+        self.rot_hs_pot = tensors['rot_hs_pot']
+        self.rchol_vecs = self.rot_hs_pot
+        if 'vakbl' in tensors:
+            self.vakbl = tensors['vakbl']
+        if self._shm is not None:
+            self.share_integral_tensors()
+        if self.verbose:
+            print("# Read half-rotated integrals from cache entry "
+                  "{}.".format(self._cache_key))
+            print("# Time to read cached integrals: "
+                  "{:.6f} s".format(time.time()-start))
+        return True
+
+    def store_integral_tensors(self, trial):
+        """Write half-rotated integrals to integral_cache."""
+        if self.integral_cache is None or not self._cache_writer:
+            return
+        tensors = {'rot_hs_pot': self.rot_hs_pot}
+        if self.half_rotated_integrals or self.cplx_chol:
+            tensors['vakbl'] = self.vakbl
+        try:
+            write_integral_cache(self.integral_cache, self._cache_key, tensors,
+                                 max_entries=self.integral_cache_max_entries)
+        except OSError:
+            if self.verbose:
+                print("# Could not write integral cache "
+                      "{}.".format(self.integral_cache))
+
+    def share_integral_tensors(self):
+        """Move half-rotated integrals into node-level shared memory.
+
+        Called collectively. Tensors are only referenced on the root rank.
+        """
+        root = self._shm.is_root
+        rot_hs_pot = self.rot_hs_pot if root else [None, None]
+        self.rot_hs_pot = [self._shm.share(r) for r in rot_hs_pot]
+        self.rchol_vecs = self.rot_hs_pot
+        if root:
+            has_vakbl = getattr(self, 'vakbl', None) is not None
+        else:
+            has_vakbl = None
+        if self._shm.comm.bcast(has_vakbl, root=0):
+            vakbl = self.vakbl if root else [None, None]
+            self.vakbl = [self._shm.share(v) for v in vakbl]
+
     def hijkl(self, i, j, k, l):
         return numpy.dot(self.chol_vecs[:,i,k], self.chol_vecs[:,j,l])
 
@@ -1,9 +1,11 @@
 import os
+import shutil
 import unittest
 import numpy
 import pytest
-from pauxy.systems.generic import Generic
-from pauxy.utils.testing import generate_hamiltonian
+from pauxy.systems.generic import Generic, construct_vakbl_blocked
+from pauxy.trial_wavefunction.multi_slater import MultiSlater
+from pauxy.utils.testing import generate_hamiltonian, get_random_nomsd
 
 
 @pytest.mark.unit
@@ -54,6 +56,100 @@ def test_read():
     schol = sys.chol_vecs
     assert numpy.linalg.norm(chol-schol) == pytest.approx(0.0)
 
+@pytest.mark.unit
+def test_read_blocked():
+    numpy.random.seed(7)
+    nmo = 13
+    nelec = (4,3)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    from pauxy.utils.io import write_qmcpack_sparse, from_qmcpack_cholesky
+    chol_ = chol.reshape((-1,nmo*nmo)).T.copy()
+    write_qmcpack_sparse(h1e, chol_, nelec, nmo,
+                         enuc=enuc, filename='hamil.h5',
+                         real_chol=True)
+    options = {'nup': nelec[0], 'ndown': nelec[1], 'integrals': 'hamil.h5',
+               'chol_block_size': 3, 'sparse': True}
+    sys = Generic(inputs=options)
+    assert numpy.linalg.norm(chol-sys.chol_vecs) == pytest.approx(0.0)
+    hs_pot = sys.hs_pot.toarray()
+    assert numpy.linalg.norm(hs_pot-chol_) == pytest.approx(0.0)
+    (h1e_, chol_vecs, enuc_, nmo_, na, nb) = from_qmcpack_cholesky(
+            'hamil.h5', start=2, end=7)
+    assert numpy.linalg.norm(chol[2:7]-chol_vecs) == pytest.approx(0.0)
+
+@pytest.mark.unit
+def test_integral_cache():
+    numpy.random.seed(7)
+    nmo = 13
+    nelec = (4,3)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    options = {'integral_tensor': True, 'sparse': True,
+               'integral_cache': 'integral_cache'}
+    sys = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                  inputs=options)
+    wfn = get_random_nomsd(sys, ndet=1, cplx=False)
+    trial = MultiSlater(sys, wfn)
+    sys.construct_integral_tensors_real(trial)
+    assert len(os.listdir('integral_cache')) == 1
+    sys2 = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                   inputs=options)
+    assert sys2.load_integral_tensors(trial)
+    for (a, b) in zip(sys.vakbl+sys.rot_hs_pot, sys2.vakbl+sys2.rot_hs_pot):
+        assert abs(a-b).max() == pytest.approx(0.0)
+    # Different options give a new entry.
+    options['sparse_cutoff'] = 1e-3
+    sys3 = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                   inputs=options)
+    assert not sys3.load_integral_tensors(trial)
+    sys3.construct_integral_tensors_real(trial)
+    assert len(os.listdir('integral_cache')) == 2
+
+@pytest.mark.unit
+def test_vakbl_blocked():
+    numpy.random.seed(7)
+    na, M, nfields = 3, 7, 11
+    A = numpy.random.random((na,M,nfields))
+    B = numpy.random.random((na,M,nfields))
+    ref = (numpy.einsum('akn,bln->akbl', A, B) -
+           numpy.einsum('bkn,aln->akbl', A, B)).reshape(na*M,na*M)
+    # Tiles of partial and multiple a indices.
+    for mem in [1e-7, 1e-6, 1.0]:
+        vakbl = construct_vakbl_blocked(A, B, max_memory=mem)
+        assert numpy.linalg.norm(vakbl.toarray()-ref) == pytest.approx(0.0)
+    vakbl = construct_vakbl_blocked(A, B, cutoff=0.5, max_memory=1e-6)
+    ref[numpy.abs(ref) < 0.5] = 0.0
+    assert vakbl.nnz == numpy.count_nonzero(ref)
+    assert numpy.linalg.norm(vakbl.toarray()-ref) == pytest.approx(0.0)
+
+@pytest.mark.unit
+def test_integral_tensors_cplx():
+    numpy.random.seed(7)
+    nmo = 9
+    nelec = (3,2)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=True, sym=4)
+    sys = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                  inputs={'chol_block_size': 4})
+    ssys = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                   inputs={'chol_block_size': 4, 'sparse': True})
+    wfn = get_random_nomsd(sys, ndet=1, cplx=True)
+    trial = MultiSlater(sys, wfn)
+    sys.construct_integral_tensors_cplx(trial)
+    ssys.construct_integral_tensors_cplx(trial)
+    na = nelec[0]
+    psi = trial.psi[:,:na]
+    hs_pot = sys.hs_pot.T.reshape(-1,nmo,nmo)
+    ref = numpy.einsum('ia,nik->akn', psi.conj(), hs_pot).reshape(na*nmo,-1)
+    rot = sys.rot_hs_pot[0].toarray()
+    assert numpy.linalg.norm(rot-ref) == pytest.approx(0.0)
+    rot = ssys.rot_hs_pot[0].toarray()
+    assert numpy.linalg.norm(rot-ref) == pytest.approx(0.0)
+    Q = numpy.einsum('ia,nik->akn', psi.conj(), chol)
+    R = numpy.einsum('ia,nik->akn', psi.conj(), chol.conj())
+    ref = (numpy.einsum('akn,bln->akbl', Q, R) -
+           numpy.einsum('bkn,aln->akbl', Q, R)).reshape(na*nmo,na*nmo)
+    vakbl = sys.vakbl[0].toarray()
+    assert numpy.linalg.norm(vakbl-ref) == pytest.approx(0.0)
+
 def teardown_module():
     cwd = os.getcwd()
     files = ['hamil.h5']
@@ -62,3 +158,4 @@ def teardown_module():
             os.remove(cwd+'/'+f)
         except OSError:
             pass
+    shutil.rmtree(cwd+'/integral_cache', ignore_errors=True)
@@ -2,7 +2,7 @@ from pauxy.systems.hubbard import Hubbard
 from pauxy.systems.generic import Generic
 from pauxy.systems.ueg import UEG
 
-def get_system(sys_opts=None, verbose=0, chol_cut=1e-5):
+def get_system(sys_opts=None, verbose=0, chol_cut=1e-5, comm=None):
     """Wrapper to select system class
 
     Parameters
@@ -11,6 +11,8 @@ def get_system(sys_opts=None, verbose=0, chol_cut=1e-5):
         System input options.
     verbose : bool
         Output verbosity.
+    comm : MPI communicator
+        Communicator used for node-level shared memory. Optional.
 
     Returns
     -------
@@ -20,7 +22,7 @@ def get_system(sys_opts=None, verbose=0, chol_cut=1e-5):
     if sys_opts['name'] == 'Hubbard':
         system = Hubbard(sys_opts, verbose)
     elif sys_opts['name'] == 'Generic':
-        system = Generic(inputs=sys_opts, verbose=verbose)
+        system = Generic(inputs=sys_opts, verbose=verbose, comm=comm)
     elif sys_opts['name'] == 'UEG':
         system = UEG(sys_opts, verbose)
     else:
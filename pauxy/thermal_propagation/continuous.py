@@ -9,7 +9,10 @@ from pauxy.propagation.operations import kinetic_real
 from pauxy.thermal_propagation.planewave import PlaneWave
 from pauxy.thermal_propagation.generic import GenericContinuous
 from pauxy.thermal_propagation.hubbard import HubbardContinuous
-from pauxy.utils.linalg import exponentiate_matrix
+from pauxy.utils.linalg import (
+        exponentiate_matrix,
+        exponentiate_matrix_adaptive
+        )
 
 class Continuous(object):
     """Propagator for generic many-electron Hamiltonian.
@@ -37,6 +40,11 @@ class Continuous(object):
         # Input options
         self.hs_type = 'continuous'
         self.exp_nmax = options.get('expansion_order', 6)
+        self.adaptive_exp = options.get('adaptive_expansion', False)
+        self.exp_tol = options.get('expansion_tol', 1e-6)
+        self.exp_scaling = options.get('expansion_scaling', True)
+        self.exp_nterms = 0
+        self.exp_ncalls = 0
 
         optimised = options.get('optimised', True)
         # Derived Attributes
@@ -136,6 +144,13 @@ class Continuous(object):
         phi : numpy array
             Exp(VHS) * phi
         """
+        if self.adaptive_exp:
+            phi, order = exponentiate_matrix_adaptive(VHS, tol=self.exp_tol,
+                                                      max_order=self.exp_nmax,
+                                                      scaling=self.exp_scaling)
+            self.exp_nterms += order
+            self.exp_ncalls += 1
+            return phi
         # JOONHO: exact exponential
         # copy = numpy.copy(phi)
         # phi = scipy.linalg.expm(VHS).dot(copy)
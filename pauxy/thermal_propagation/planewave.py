@@ -9,7 +9,10 @@ from pauxy.estimators.thermal import (
         one_rdm_from_G, inverse_greens_function_qr,
         )
 from pauxy.propagation.operations import kinetic_real
-from pauxy.utils.linalg import exponentiate_matrix
+from pauxy.utils.linalg import (
+        exponentiate_matrix,
+        exponentiate_matrix_adaptive
+        )
 from pauxy.walkers.single_det import SingleDetWalker
 
 class PlaneWave(object):
@@ -26,6 +29,11 @@ class PlaneWave(object):
         self.optimised = options.get('optimised', True)
         self.lowrank = lowrank
         self.exp_nmax = options.get('expansion_order', 6)
+        self.adaptive_exp = options.get('adaptive_expansion', False)
+        self.exp_tol = options.get('expansion_tol', 1e-6)
+        self.exp_scaling = options.get('expansion_scaling', True)
+        self.exp_nterms = 0
+        self.exp_ncalls = 0
         self.nstblz = qmc.nstblz
         self.fb_bound = options.get('fb_bound', 1.0)
         # Derived Attributes
@@ -290,6 +298,13 @@ class PlaneWave(object):
         phi : numpy array
             Exp(VHS) * phi
         """
+        if self.adaptive_exp:
+            phi, order = exponentiate_matrix_adaptive(VHS, tol=self.exp_tol,
+                                                      max_order=self.exp_nmax,
+                                                      scaling=self.exp_scaling)
+            self.exp_nterms += order
+            self.exp_ncalls += 1
+            return phi
         # JOONHO: exact exponential
         # copy = numpy.copy(phi)
         # phi = scipy.linalg.expm(VHS).dot(copy)
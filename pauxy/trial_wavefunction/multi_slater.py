@@ -1,11 +1,12 @@
 import numpy
 import scipy.linalg
+import scipy.sparse.linalg
 import time
 from pauxy.estimators.mixed import (
-        variational_energy, variational_energy_ortho_det, local_energy
+        variational_energy, variational_energy_ortho_det, nomsd_hamiltonian
         )
-from pauxy.estimators.greens_function import gab, gab_spin, gab_mod, gab_mod_ovlp
-from pauxy.estimators.ci import get_hmatel, get_one_body_matel
+from pauxy.estimators.greens_function import gab, gab_spin, gab_mod
+from pauxy.estimators.ci import ci_hamiltonian, ci_transition_density
 from pauxy.utils.io import (
         get_input_value,
         write_qmcpack_wfn
@@ -28,6 +29,16 @@ class MultiSlater(object):
         self.half_rot = get_input_value(options, 'half_rotate',
                                         default=False, alias=['rotate'],
                                         verbose=verbose)
+        # Processes used to build the NOMSD Hamiltonian when recomputing the
+        # CI coefficients. The pool forks so is not allowed with several MPI
+        # ranks.
+        self.ci_nproc = get_input_value(options, 'recompute_ci_nproc',
+                                        default=1, verbose=verbose)
+        if parallel and self.ci_nproc > 1:
+            raise ValueError("recompute_ci_nproc > 1 is not supported when "
+                             "running with more than one MPI rank.")
+        # Cached contracted transition density matrix.
+        self.transition_dm = None
         if len(wfn) == 3:
             # CI type expansion.
             self.from_phmsd(system, wfn, orbs)
@@ -115,63 +126,84 @@ class MultiSlater(object):
         for idet, (occa, occb) in enumerate(zip(wfn[1], wfn[2])):
             self.psi[idet,:,:system.nup] = I[:,occa]
             self.psi[idet,:,system.nup:] = I[:,occb]
+        # Excitations relative to the first determinant for generalised Wick
+        # theorem based walkers.
+        self.excitations = [get_excitations(wfn[1]), get_excitations(wfn[2])]
 
     def recompute_ci_coeffs(self, system):
-        H = numpy.zeros((self.ndets, self.ndets), dtype=numpy.complex128)
-        S = numpy.zeros((self.ndets, self.ndets), dtype=numpy.complex128)
         if self.ortho_expansion:
-            for i in range(self.ndets):
-                for j in range(i,self.ndets):
-                    di = self.spin_occs[i]
-                    dj = self.spin_occs[j]
-                    H[i,j] = get_hmatel(system,di,dj)[0]
-            e, ev = scipy.linalg.eigh(H, lower=False)
+            H = ci_hamiltonian(system, self.occa, self.occb)[0]
+            if self.ndets > 2000:
+                e, ev = scipy.sparse.linalg.eigsh(H, k=1, which='SA')
+            else:
+                e, ev = scipy.linalg.eigh(H.toarray())
         else:
-            na = system.nup
-            for i, di in enumerate(self.psi):
-                for j, dj in enumerate(self.psi):
-                    if j >= i:
-                        ga, gha, ioa = gab_mod_ovlp(di[:,:na], dj[:,:na])
-                        gb, ghb, iob = gab_mod_ovlp(di[:,na:], dj[:,na:])
-                        G = numpy.array([ga,gb])
-                        Ghalf = numpy.array([gha,ghb])
-                        ovlp = 1.0/(scipy.linalg.det(ioa)*scipy.linalg.det(iob))
-                        if abs(ovlp) > 1e-12:
-                            H[i,j] = ovlp * local_energy(system, G, Ghalf=Ghalf)[0]
-                            S[i,j] = ovlp
-                            H[j,i] = numpy.conjugate(H[i,j])
-                            S[j,i] = numpy.conjugate(S[i,j])
+            rot_chol = getattr(self, 'rot_chol', None)
+            H, S = nomsd_hamiltonian(system, self.psi, rot_chol=rot_chol,
+                                     nproc=self.ci_nproc)
+            H = H[0]
             e, ev = scipy.linalg.eigh(H, S, lower=False)
         if self.verbose > 1:
             print("Old and New CI coefficients: ")
             for co,cn in zip(self.coeffs,ev[:,0]):
                 print("{} {}".format(co, cn))
         self.coeffs = numpy.array(ev[:,0], dtype=numpy.complex128)
+        self.transition_dm = None
 
     def contract_one_body(self, ints):
-        numer = 0.0
-        denom = 0.0
+        if self.transition_dm is None:
+            self.compute_transition_density()
+        return numpy.dot(ints.ravel(), self.transition_dm.ravel())
+
+    def compute_transition_density(self):
+        r"""Compute contracted transition density.
+
+        For a non-orthogonal expansion
+
+        .. math::
+            D = \frac{\sum_{ij} c_i^* c_j^* S_{ij} (G^{\alpha}_{ij} +
+                G^{\beta}_{ij})}{\sum_{ij} c_i^* c_j^* S_{ij}}
+
+        so that one-body contractions with the trial wavefunction are
+        tr(D V). All kets are handled together for each bra using batched
+        inverses. Storing every G_ij would need O(ndets^2 N^2) memory, so only
+        D is kept.
+
+        For orthogonal expansions D is built from the singly connected pairs of
+        determinants, see :func:`pauxy.estimators.ci.ci_transition_density`.
+        """
+        start = time.time()
+        if self.ortho_expansion:
+            self.transition_dm = ci_transition_density(self.occa, self.occb,
+                                                       self.coeffs,
+                                                       self.psi.shape[-2])
+            return
         na = self._nalpha
-        for i in range(self.ndets):
-            for j in range(self.ndets):
-                cfac = self.coeffs[i].conj()*self.coeffs[j].conj()
-                if self.ortho_expansion:
-                    di = self.spin_occs[i]
-                    dj = self.spin_occs[j]
-                    tij = get_one_body_matel(ints,di,dj)
-                    numer += cfac * tij
-                    if i == j:
-                        denom += self.coeffs[i].conj()*self.coeffs[i].conj()
-                else:
-                    di = self.psi[i]
-                    dj = self.psi[j]
-                    ga, gha, ioa = gab_mod_ovlp(di[:,:na], dj[:,:na])
-                    gb, ghb, iob = gab_mod_ovlp(di[:,na:], dj[:,na:])
-                    ovlp = 1.0/(scipy.linalg.det(ioa)*scipy.linalg.det(iob))
-                    tij = numpy.dot(ints.ravel(), ga.ravel()+gb.ravel())
-                    numer += cfac * ovlp * tij
-                    denom += cfac * ovlp
-        return numer / denom
+        psi = self.psi.reshape((self.ndets,)+self.psi.shape[-2:])
+        M = psi.shape[1]
+        spins = [slice(0,na), slice(na,psi.shape[2])]
+        cfac = self.coeffs.conj()
+        numer = numpy.zeros((M,M), dtype=numpy.complex128)
+        denom = 0.0
+        for (i, A) in enumerate(psi):
+            ovlp = numpy.ones(self.ndets, dtype=numpy.complex128)
+            inv_O = []
+            for ix in spins:
+                # O_j = (A^dagger B_j)^T for all kets B_j.
+                O = numpy.einsum('jpa,pb->jab', psi[:,:,ix], A[:,ix].conj(),
+                                 optimize=True)
+                ovlp *= numpy.linalg.det(O)
+                inv_O.append(numpy.linalg.inv(O))
+            w = cfac[i] * cfac * ovlp
+            for (ix, inv) in zip(spins, inv_O):
+                X = numpy.einsum('j,jab,jpb->ap', w, inv, psi[:,:,ix],
+                                 optimize=True)
+                numer += numpy.dot(A[:,ix].conj(), X)
+            denom += w.sum()
+        self.transition_dm = numer / denom
+        if self.verbose:
+            print("# Time to compute transition density matrix: {:.6f} s"
+                  .format(time.time()-start))
 
     def write_wavefunction(self, filename='wfn.h5', init=None, occs=False):
         if occs:
@@ -189,19 +221,81 @@ class MultiSlater(object):
         if self.verbose:
             print("# Constructing half rotated Cholesky vectors.")
 
-        chol = system.chol_vecs.reshape((M,M,-1))
+        # chol[i,k,n] = L^n_{ik}
+        chol = system.chol_vecs.reshape((-1,M*M)).T.reshape((M,M,-1))
         start = time.time()
-        self.rot_chol = []
-        for i, psi in enumerate(self.psi):
-            start = time.time()
-            if self.verbose:
-                print("# Rotating Cholesky for determinant {}".format(i))
-            rup = numpy.tensordot(psi[:,:na].conj(),
-                                  chol,
-                                  axes=((0),(0)))
-            rdn = numpy.tensordot(psi[:,na:].conj(),
-                                  chol,
-                                  axes=((0),(0)))
-            self.rot_chol.append([rup.reshape(M*na,-1), rdn.reshape((M*nb,-1))])
-            if self.verbose:
-                print("# Time to half rotate {}".format(time.time()-start))
+        psi = self.psi.reshape((-1,M,na+nb))
+        ndets = psi.shape[0]
+        rup = numpy.tensordot(psi[:,:,:na].conj(), chol, axes=((1),(0)))
+        rdn = numpy.tensordot(psi[:,:,na:].conj(), chol, axes=((1),(0)))
+        # Stacked over determinants so contractions with the per-determinant
+        # half rotated Green's functions are a single matrix product.
+        self.rot_chol_stack = [rup.reshape((ndets*na*M,-1)),
+                               rdn.reshape((ndets*nb*M,-1))]
+        self.rot_chol = [[rup[i].reshape((M*na,-1)), rdn[i].reshape((M*nb,-1))]
+                         for i in range(ndets)]
+        if self.verbose:
+            print("# Time to half rotate {}".format(time.time()-start))
+
+def permutation_parity(perm):
+    """Parity (+1 / -1) of a permutation of range(len(perm))."""
+    perm = list(perm)
+    visited = [False] * len(perm)
+    ncycles = 0
+    for i in range(len(perm)):
+        if not visited[i]:
+            ncycles += 1
+            j = i
+            while not visited[j]:
+                visited[j] = True
+                j = perm[j]
+    return 1 - 2*((len(perm)-ncycles) % 2)
+
+def get_excitations(occs):
+    """Find excitations of determinants relative to the first determinant.
+
+    Determinant i is obtained from the reference by replacing the orbitals at
+    positions holes[i] of the reference occupation list with particles[i].
+    The sign accounts for the ordering of the orbitals in occs[i].
+
+    Parameters
+    ----------
+    occs : list
+        Occupied orbitals of each determinant for a single spin.
+
+    Returns
+    -------
+    exc : dict
+        'reference' : occupied orbitals of reference.
+        'particles', 'holes' : per determinant arrays of particle orbitals and
+        hole positions.
+        'signs' : :class:`numpy.ndarray` of permutation signs.
+        'blocks' : list of (dets, particles, holes) arrays for determinants
+        grouped by excitation level.
+    """
+    ref = numpy.array(occs[0], dtype=numpy.int64)
+    ref_pos = {o: i for (i, o) in enumerate(ref)}
+    particles = []
+    holes = []
+    signs = numpy.ones(len(occs))
+    for (idet, occ) in enumerate(occs):
+        occ = [int(o) for o in occ]
+        occ_set = set(occ)
+        p = [o for o in occ if o not in ref_pos]
+        h = [i for (i, o) in enumerate(ref) if o not in occ_set]
+        aligned = list(ref)
+        for (i, o) in zip(h, p):
+            aligned[i] = o
+        pos = {o: i for (i, o) in enumerate(aligned)}
+        signs[idet] = permutation_parity([pos[o] for o in occ])
+        particles.append(numpy.array(p, dtype=numpy.int64))
+        holes.append(numpy.array(h, dtype=numpy.int64))
+    levels = numpy.array([len(p) for p in particles])
+    blocks = []
+    for k in numpy.unique(levels):
+        dets = numpy.where(levels == k)[0]
+        blocks.append((dets,
+                       numpy.array([particles[i] for i in dets]).reshape(-1,k),
+                       numpy.array([holes[i] for i in dets]).reshape(-1,k)))
+    return {'reference': ref, 'particles': particles, 'holes': holes,
+            'signs': signs, 'blocks': blocks}
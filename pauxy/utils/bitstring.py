@@ -0,0 +1,136 @@
+"""Bit string representation of Slater determinants.
+
+Determinants are stored as rows of uint64 words with bit p of the string set
+if orbital p is occupied.
+"""
+import numpy
+
+_M1 = numpy.uint64(0x5555555555555555)
+_M2 = numpy.uint64(0x3333333333333333)
+_M4 = numpy.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = numpy.uint64(0x0101010101010101)
+_ONE = numpy.uint64(1)
+_ZERO = numpy.uint64(0)
+
+
+def occs_to_bits(occs, norbs):
+    """Encode occupation lists as bit strings.
+
+    Parameters
+    ----------
+    occs : :class:`numpy.ndarray`
+        (ndets, nelec) occupied orbitals.
+    norbs : int
+        Number of orbitals.
+
+    Returns
+    -------
+    bits : :class:`numpy.ndarray`
+        (ndets, nwords) bit strings.
+    """
+    occs = numpy.asarray(occs, dtype=numpy.int64)
+    occs = occs.reshape((occs.shape[0],-1))
+    nwords = max(1, (norbs+63)//64)
+    bits = numpy.zeros((occs.shape[0],nwords), dtype=numpy.uint64)
+    rows = numpy.repeat(numpy.arange(occs.shape[0]), occs.shape[1])
+    flat = occs.ravel()
+    numpy.bitwise_or.at(bits, (rows,flat//64),
+                        _ONE << (flat%64).astype(numpy.uint64))
+    return bits
+
+
+def popcount(x):
+    """Number of set bits in each element of a uint64 array."""
+    x = numpy.asarray(x, dtype=numpy.uint64)
+    if hasattr(numpy, 'bitwise_count'):
+        return numpy.bitwise_count(x).astype(numpy.int64)
+    x = x - ((x >> _ONE) & _M1)
+    x = (x & _M2) + ((x >> numpy.uint64(2)) & _M2)
+    x = (x + (x >> numpy.uint64(4))) & _M4
+    return ((x * _H01) >> numpy.uint64(56)).astype(numpy.int64)
+
+
+def excitation_level(bi, bj):
+    """Excitation level between (arrays of) bit strings."""
+    return popcount(numpy.bitwise_xor(bi, bj)).sum(-1) // 2
+
+
+def set_bits(bits, n):
+    """Positions of the n lowest set bits of each bit string.
+
+    Parameters
+    ----------
+    bits : :class:`numpy.ndarray`
+        (nstr, nwords) bit strings with at least n bits set.
+    n : int
+        Number of positions to extract.
+
+    Returns
+    -------
+    pos : :class:`numpy.ndarray`
+        (nstr, n) positions in ascending order.
+    """
+    bits = numpy.array(bits, dtype=numpy.uint64, ndmin=2)
+    rows = numpy.arange(bits.shape[0])
+    pos = numpy.zeros((bits.shape[0],n), dtype=numpy.int64)
+    for k in range(n):
+        word = numpy.argmax(bits != 0, axis=1)
+        x = bits[rows,word]
+        lsb = x & (~x + _ONE)
+        # Powers of two are exact in double precision.
+        pos[:,k] = 64*word + numpy.frexp(lsb.astype(numpy.float64))[1] - 1
+        bits[rows,word] = x ^ lsb
+    return pos
+
+
+def count_below(bits, orbs):
+    """Number of occupied orbitals with index below orbs.
+
+    Parameters
+    ----------
+    bits : :class:`numpy.ndarray`
+        (nstr, nwords) bit strings.
+    orbs : :class:`numpy.ndarray`
+        (nstr,) orbital indices.
+
+    Returns
+    -------
+    count : :class:`numpy.ndarray`
+        (nstr,) number of set bits below orbs.
+    """
+    orbs = numpy.asarray(orbs, dtype=numpy.int64)
+    words = numpy.arange(bits.shape[-1])[None,:]
+    word = (orbs // 64)[:,None]
+    partial = (_ONE << (orbs % 64).astype(numpy.uint64)) - _ONE
+    mask = numpy.where(words < word, ~_ZERO,
+                       numpy.where(words == word, partial[:,None], _ZERO))
+    return popcount(bits & mask.astype(numpy.uint64)).sum(-1)
+
+
+def excitation(bi, bj, nex):
+    """Orbitals and parity of excitations connecting pairs of determinants.
+
+    Parameters
+    ----------
+    bi : :class:`numpy.ndarray`
+        (npairs, nwords) bra bit strings.
+    bj : :class:`numpy.ndarray`
+        (npairs, nwords) ket bit strings.
+    nex : int
+        Excitation level of all pairs.
+
+    Returns
+    -------
+    from_orb : :class:`numpy.ndarray`
+        (npairs, nex) orbitals occupied in the ket but not the bra.
+    to_orb : :class:`numpy.ndarray`
+        (npairs, nex) orbitals occupied in the bra but not the ket.
+    perm : :class:`numpy.ndarray`
+        (npairs,) True if the permutation aligning the determinants is odd.
+    """
+    from_orb = set_bits(bj & ~bi, nex)
+    to_orb = set_bits(bi & ~bj, nex)
+    perm = numpy.zeros(bi.shape[0], dtype=numpy.int64)
+    for k in range(nex):
+        perm += count_below(bj, from_orb[:,k]) + count_below(bi, to_orb[:,k])
+    return from_orb, to_orb, perm % 2 == 1
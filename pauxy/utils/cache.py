@@ -0,0 +1,197 @@
+"""On-disk cache of half-rotated integrals."""
+import glob
+import h5py
+import hashlib
+import numpy
+import os
+import scipy.sparse
+import socket
+
+# Bump when the layout of cache entries changes so old entries are discarded.
+CACHE_VERSION = 1
+
+
+def file_fingerprint(filename):
+    """Cheap identifier of an integral file.
+
+    Uses the resolved path, size and modification time of the file together
+    with the dimensions, energies and one-body Hamiltonian of QMCPACK hdf5
+    files, so the Cholesky vectors are never read.
+
+    Parameters
+    ----------
+    filename : string
+        Integral file.
+
+    Returns
+    -------
+    fingerprint : string
+        Hex digest.
+    """
+    stat = os.stat(filename)
+    hasher = hashlib.sha1()
+    hasher.update(str((os.path.realpath(filename), stat.st_size,
+                       stat.st_mtime_ns)).encode())
+    try:
+        with h5py.File(filename, 'r') as fh5:
+            for name in ('Hamiltonian/dims', 'Hamiltonian/Energies',
+                         'Hamiltonian/hcore'):
+                if name in fh5:
+                    hash_array(fh5[name][:], hasher)
+    except OSError:
+        pass
+    return hasher.hexdigest()
+
+
+def hash_array(array, hasher):
+    """Update hasher with the shape, type and contents of an array."""
+    if scipy.sparse.issparse(array):
+        array = array.tocsr()
+        for a in (array.data, array.indices, array.indptr):
+            hash_array(a, hasher)
+        hasher.update(str(array.shape).encode())
+        return
+    array = numpy.ascontiguousarray(array)
+    hasher.update(str((array.shape, array.dtype.str)).encode())
+    hasher.update(array.view(numpy.uint8).ravel())
+
+
+def integral_cache_key(arrays, options, fingerprint=None):
+    """Content hash identifying a set of half-rotated integrals.
+
+    Parameters
+    ----------
+    arrays : list
+        Arrays the integrals depend on, e.g. the trial wavefunction.
+    options : dict
+        Options affecting the integrals, e.g. cutoff and sparsity. Values must
+        have a deterministic string representation.
+    fingerprint : string
+        Identifier of integral file from :func:`file_fingerprint`. Optional.
+        Default None.
+
+    Returns
+    -------
+    key : string
+        Hex digest.
+    """
+    hasher = hashlib.sha1()
+    hasher.update(str(CACHE_VERSION).encode())
+    if fingerprint is not None:
+        hasher.update(fingerprint.encode())
+    for a in arrays:
+        hash_array(a, hasher)
+    hasher.update(str(sorted(options.items())).encode())
+    return hasher.hexdigest()
+
+
+def _write_matrix(group, name, matrix):
+    if scipy.sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        sub = group.create_group(name)
+        sub['data'] = matrix.data
+        sub['indices'] = matrix.indices
+        sub['indptr'] = matrix.indptr
+        sub['shape'] = numpy.array(matrix.shape)
+    else:
+        group[name] = matrix
+
+
+def _read_matrix(obj):
+    if isinstance(obj, h5py.Group):
+        return scipy.sparse.csr_matrix((obj['data'][:], obj['indices'][:],
+                                        obj['indptr'][:]),
+                                       shape=tuple(obj['shape'][:]))
+    else:
+        return obj[:]
+
+
+def write_integral_cache(directory, key, tensors, max_entries=8):
+    """Store tensors in cache and evict old entries.
+
+    The entry is written to a temporary file and moved into place so
+    concurrent jobs never see a partially written entry.
+
+    Parameters
+    ----------
+    directory : string
+        Cache directory. Created if necessary.
+    key : string
+        Cache key from :func:`integral_cache_key`.
+    tensors : dict
+        Maps name to list of dense or sparse matrices.
+    max_entries : int
+        Maximum number of entries to keep in directory. Optional. Default 8.
+    """
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, key+'.h5')
+    tmp = filename + '.tmp.{}.{}'.format(socket.gethostname(), os.getpid())
+    with h5py.File(tmp, 'w') as fh5:
+        fh5.attrs['key'] = key
+        fh5.attrs['version'] = CACHE_VERSION
+        for (name, mats) in tensors.items():
+            group = fh5.create_group(name)
+            for (i, m) in enumerate(mats):
+                _write_matrix(group, str(i), m)
+    os.replace(tmp, filename)
+    evict_integral_cache(directory, max_entries)
+
+
+def read_integral_cache(directory, key, shapes):
+    """Read tensors from cache.
+
+    Entries which do not match the key, version or expected shapes, or which
+    cannot be read, are deleted.
+
+    Parameters
+    ----------
+    directory : string
+        Cache directory.
+    key : string
+        Cache key from :func:`integral_cache_key`.
+    shapes : dict
+        Maps name to list of expected matrix shapes. Only these tensors are
+        read.
+
+    Returns
+    -------
+    tensors : dict or None
+        Maps name to list of matrices. None if there is no valid entry.
+    """
+    filename = os.path.join(directory, key+'.h5')
+    if not os.path.exists(filename):
+        return None
+    try:
+        with h5py.File(filename, 'r') as fh5:
+            valid = (fh5.attrs['key'] == key and
+                     fh5.attrs['version'] == CACHE_VERSION)
+            tensors = {}
+            for (name, shps) in shapes.items():
+                if not valid:
+                    break
+                mats = [_read_matrix(fh5[name][str(i)])
+                        for i in range(len(shps))]
+                valid = all(m.shape == tuple(s) for (m, s) in zip(mats, shps))
+                tensors[name] = mats
+    except (OSError, KeyError, ValueError):
+        valid = False
+    if not valid:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        return None
+    # Mark entry as recently used.
+    os.utime(filename, None)
+    return tensors
+
+
+def evict_integral_cache(directory, max_entries):
+    """Remove least recently used entries beyond max_entries."""
+    entries = glob.glob(os.path.join(directory, '*.h5'))
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for f in entries[max_entries:]:
+        try:
+            os.remove(f)
+        except OSError:
+            pass
@@ -381,44 +381,59 @@ def chunked_cholesky(mol, max_error=1e-6, verbose=False, cmax=10):
     return chol_vecs[:nchol]
 
 def chunked_cholesky_outcore(mol, filename='hamil.h5', max_error=1e-6,
-                             verbose=False, cmax=20, CHUNK_SIZE=2.0):
+                             verbose=False, cmax=20, CHUNK_SIZE=2.0,
+                             CACHE_SIZE=4.0, nbatch=16, pivot_ratio=0.1):
     """Modified cholesky decomposition from pyscf eris.
 
     See, e.g. [Motta17]_
 
-    Only works for molecular systems.
+    Only works for molecular systems. Cholesky vectors are written to
+    filename in chunks. Several pivots are selected per iteration so each
+    previously written chunk is read at most once per batch of pivots, and the
+    most recently written chunks are kept in memory.
 
     Parameters
     ----------
     mol : :class:`pyscf.mol`
         pyscf mol object.
-    orthoAO: :class:`numpy.ndarray`
-        Orthogonalising matrix for AOs. (e.g., mo_coeff).
-    delta : float
+    filename : string
+        File to write Cholesky vectors to.
+    max_error : float
         Accuracy desired.
     verbose : bool
         If true print out convergence progress.
     cmax : int
         nchol = cmax * M, where M is the number of basis functions.
         Controls buffer size for cholesky vectors.
+    CHUNK_SIZE : float
+        Size of chunks of Cholesky vectors in GB.
+    CACHE_SIZE : float
+        Memory in GB used to keep written chunks in memory.
+    nbatch : int
+        Maximum number of pivots selected per iteration.
+    pivot_ratio : float
+        Only diagonal elements larger than pivot_ratio times the current
+        largest residual are selected together.
 
     Returns
     -------
-    chol_vecs : :class:`numpy.ndarray`
-        Matrix of cholesky vectors in AO basis.
+    nchol : int
+        Number of Cholesky vectors.
     """
     nao = mol.nao_nr()
     diag = numpy.zeros(nao*nao)
     nchol_max = cmax * nao
     mem = 8.0*nchol_max*nao*nao / 1024.0**3
-    chunk_size = min(int(CHUNK_SIZE*1024.0**3/(8*nao*nao)),nchol_max)
+    chunk_size = max(min(int(CHUNK_SIZE*1024.0**3/(8*nao*nao)),nchol_max), 1)
+    max_cached = int(CACHE_SIZE*1024.0**3/(8.0*chunk_size*nao*nao))
     if verbose:
         print("# Number of AOs: {}".format(nao))
         print("# Writing AO Cholesky to {:s}.".format(filename))
         print("# Max number of Cholesky vectors: {}".format(nchol_max))
         print("# Max memory required for Cholesky tensor: {} GB".format(mem))
-        print("# Splitting calculation into chunks of size: {} / GB"
+        print("# Splitting calculation into chunks of size: {} / {} GB"
               .format(chunk_size, 8*chunk_size*nao*nao/(1024.0**3)))
+        print("# Number of chunks cached in memory: {}".format(max_cached))
         print("# Generating diagonal.")
     chol_vecs = numpy.zeros((chunk_size,nao*nao))
     ndiag = 0
@@ -436,103 +451,124 @@ def chunked_cholesky_outcore(mol, filename='hamil.h5', max_error=1e-6,
         di, dk, dj, dl = buf.shape
         diag[ndiag:ndiag+di*nao] = buf.reshape(di*nao,di*nao).diagonal()
         ndiag += di * nao
-    nu = numpy.argmax(diag)
-    delta_max = diag[nu]
     with h5py.File(filename, 'w') as fh5:
         fh5.create_dataset('Lao',
                            shape=(nchol_max, nao*nao),
                            dtype=numpy.float64)
     end = time.time()
+    # Running diagonal of the residual D_ii = M_ii - \sum_x L_i^x L_i^x.
+    delta = diag.copy()
+    delta_max = numpy.max(numpy.abs(delta))
     if verbose:
         print("# Time to generate diagonal {} s.".format(end-start))
         print("# Generating Cholesky decomposition of ERIs.")
         print("# iteration {:5d}: delta_max = {:13.8e}".format(0, delta_max))
-    j = nu // nao
-    l = nu % nao
-    sj = numpy.searchsorted(dims, j)
-    sl = numpy.searchsorted(dims, l)
-    if dims[sj] != j and j != 0:
-        sj -= 1
-    if dims[sl] != l and l != 0:
-        sl -= 1
-    Mapprox = numpy.zeros(nao*nao)
-    eri_col = mol.intor('int2e_sph',
-                        shls_slice=(0,mol.nbas,0,mol.nbas,sj,sj+1,sl,sl+1))
-    cj, cl = max(j-dims[sj],0), max(l-dims[sl],0)
-    chol_vecs[0] = numpy.copy(eri_col[:,:,cj,cl].reshape(nao*nao)) / delta_max**0.5
 
-    def compute_residual(chol, ichol, nchol, nu):
-        # Updated residual = \sum_x L_i^x L_nu^x
-        # R = numpy.dot(chol_vecs[:nchol+1,nu], chol_vecs[:nchol+1,:])
-        R = 0.0
-        with h5py.File(filename, 'r') as fh5:
-            for ic in range(0, ichol):
-                # Compute dot product from file.
-                # print(ichol*chunk_size, (ichol+1)*chunk_size)
-                # import sys
-                # sys.exit()
-                # print(ic*chunk_size, (ic*chunk_size)
-                L = fh5['Lao'][ic*chunk_size:(ic+1)*chunk_size,:]
-                R += numpy.dot(L[:,nu], L[:,:])
-        R += numpy.dot(chol[:nchol+1,nu], chol[:nchol+1,:])
+    def shell_index(i):
+        # Shell containing AO index i.
+        si = numpy.searchsorted(dims, i)
+        if dims[si] != i and i != 0:
+            si -= 1
+        return si
+
+    def eri_columns(pivots):
+        # ERI[:,jl] for each pivot jl. Pivots in the same pair of shells share
+        # a single integral evaluation.
+        cols = numpy.zeros((len(pivots), nao*nao))
+        shells = {}
+        for (ip, nu) in enumerate(pivots):
+            j = nu // nao
+            l = nu % nao
+            sj = shell_index(j)
+            sl = shell_index(l)
+            shells.setdefault((sj,sl), []).append((ip, j, l))
+        for ((sj,sl), pvs) in shells.items():
+            eri_col = mol.intor('int2e_sph',
+                                shls_slice=(0,mol.nbas,0,mol.nbas,
+                                            sj,sj+1,sl,sl+1))
+            for (ip, j, l) in pvs:
+                cols[ip] = eri_col[:,:,j-dims[sj],l-dims[sl]].reshape(nao*nao)
+        return cols
+
+    # Written chunks kept in memory, most recent last.
+    cache = {}
+
+    def compute_residual(pivots, ichunk, nfill):
+        # Residual R_nu = \sum_x L_nu^x L^x from all stored vectors.
+        R = numpy.zeros((len(pivots), nao*nao))
+        uncached = [ic for ic in range(0, ichunk) if ic not in cache]
+        if len(uncached) > 0:
+            with h5py.File(filename, 'r') as fh5:
+                for ic in uncached:
+                    L = fh5['Lao'][ic*chunk_size:(ic+1)*chunk_size,:]
+                    R += numpy.dot(L[:,pivots].T, L)
+        for L in cache.values():
+            R += numpy.dot(L[:,pivots].T, L)
+        R += numpy.dot(chol_vecs[:nfill,pivots].T, chol_vecs[:nfill])
         return R
 
     nchol = 0
     ichunk = 0
-    while abs(delta_max) > max_error:
-        # Update cholesky vector
+    nfill = 0
+    while delta_max > max_error and nchol < nchol_max:
         start = time.time()
-        # M'_ii = L_i^x L_i^x
-        Mapprox += chol_vecs[nchol%chunk_size] * chol_vecs[nchol%chunk_size]
-        # D_ii = M_ii - M'_ii
-        delta = diag - Mapprox
-        nu = numpy.argmax(numpy.abs(delta))
-        delta_max = numpy.abs(delta[nu])
+        # Select batch of pivots with large residual diagonal.
+        order = numpy.argsort(-numpy.abs(delta))[:nbatch]
+        thresh = max(max_error, pivot_ratio*delta_max)
+        pivots = [nu for nu in order if abs(delta[nu]) > thresh]
+        pivots = pivots[:nchol_max-nchol]
         # Compute ERI chunk.
-        # shls_slice computes shells of integrals as determined by the angular
-        # momentum of the basis function and the number of contraction
-        # coefficients. Need to search for AO index within this shell indexing
-        # scheme.
-        # AO index.
-        j = nu // nao
-        l = nu % nao
-        # Associated shell index.
-        sj = numpy.searchsorted(dims, j)
-        sl = numpy.searchsorted(dims, l)
-        if dims[sj] != j and j != 0:
-            sj -= 1
-        if dims[sl] != l and l != 0:
-            sl -= 1
-        # Compute ERI chunk.
-        eri_col = mol.intor('int2e_sph',
-                            shls_slice=(0,mol.nbas,0,mol.nbas,sj,sj+1,sl,sl+1))
-        # Select correct ERI chunk from shell.
-        cj, cl = max(j-dims[sj],0), max(l-dims[sl],0)
-        Munu0 = eri_col[:,:,cj,cl].reshape(nao*nao)
+        Munu0 = eri_columns(pivots)
         # Updated residual = \sum_x L_i^x L_nu^x
         startr = time.time()
-        R = compute_residual(chol_vecs, ichunk, nchol%chunk_size, nu)
+        R = compute_residual(pivots, ichunk, nfill)
         endr = time.time()
-        if nchol > 0 and (nchol + 1) % chunk_size == 0:
-            startw = time.time()
-            # delta = L[ichunk*chunk_size:(ichunk+1)*chunk_size]-chol_vecs
-            with h5py.File(filename, 'r+') as fh5:
-                fh5['Lao'][ichunk*chunk_size:(ichunk+1)*chunk_size] = chol_vecs
-            endw = time.time()
-            if verbose:
-                print("# Writing Cholesky chunk {} to file".format(ichunk))
-                print("# Time to write {}".format(endw-startw))
-            ichunk += 1
-            chol_vecs[:] = 0.0
-        chol_vecs[(nchol+1)%chunk_size] = (Munu0 - R) / (delta_max)**0.5
-        nchol += 1
+        Munu0 -= R
+        # Sequential decomposition within batch. Pivots are taken in order of
+        # their updated residual and skipped once it becomes too small.
+        new = []
+        remaining = list(range(len(pivots)))
+        while len(remaining) > 0:
+            ip = max(remaining, key=lambda k: abs(delta[pivots[k]]))
+            nu = pivots[ip]
+            if abs(delta[nu]) <= thresh:
+                break
+            remaining.remove(ip)
+            vec = Munu0[ip].copy()
+            for L in new:
+                vec -= L[nu] * L
+            L = vec / abs(delta[nu])**0.5
+            delta -= L * L
+            new.append(L)
+        delta_max = numpy.max(numpy.abs(delta))
+        for L in new:
+            if nfill == chunk_size:
+                startw = time.time()
+                with h5py.File(filename, 'r+') as fh5:
+                    fh5['Lao'][ichunk*chunk_size:(ichunk+1)*chunk_size] = chol_vecs
+                endw = time.time()
+                if verbose:
+                    print("# Writing Cholesky chunk {} to file".format(ichunk))
+                    print("# Time to write {}".format(endw-startw))
+                if max_cached > 0:
+                    cache[ichunk] = chol_vecs.copy()
+                    if len(cache) > max_cached:
+                        del cache[min(cache.keys())]
+                ichunk += 1
+                nfill = 0
+                chol_vecs[:] = 0.0
+            chol_vecs[nfill] = L
+            nfill += 1
+            nchol += 1
         if verbose:
             step_time = time.time() - start
-            # info = (nchol, delta_max, step_time, endr-startr)
             print("iteration {:5d} : delta_max = {:13.8e} : step time ="
                   " {:13.8e} : res time = {:13.8e} "
                   .format(nchol, delta_max, step_time, endr-startr))
     with h5py.File(filename, 'r+') as fh5:
+        if nfill > 0:
+            start = ichunk * chunk_size
+            fh5['Lao'][start:start+nfill] = chol_vecs[:nfill]
         fh5['dims'] = numpy.array([nao*nao, nchol])
     return nchol
 
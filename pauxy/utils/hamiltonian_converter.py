@@ -3,10 +3,149 @@ import numpy
 import scipy.sparse
 import scipy.linalg
 import sys
+import warnings
 from pauxy.utils.io import to_qmcpack_complex
+from pauxy.utils.linalg import modified_cholesky_blocked
 
-def read_fcidump(filename, symmetry=8, verbose=True):
-    """Read in integrals from file.
+def read_fcidump_header(f):
+    """Read namelist header of FCIDUMP file.
+
+    Parameters
+    ----------
+    f : file
+        Open FCIDUMP file. Left positioned at the start of the integrals.
+
+    Returns
+    -------
+    nbasis : int
+        Number of orbitals.
+    nelec : int
+        Total number of electrons.
+    ms2 : int
+        Twice the spin polarisation.
+    """
+    ms2 = 0
+    while True:
+        line = f.readline()
+        if 'END' in line or '/' in line:
+            break
+        for i in line.split(','):
+            if 'NORB' in i:
+                nbasis = int(i.split('=')[1])
+            elif 'NELEC' in i:
+                nelec = int(i.split('=')[1])
+            elif 'MS2' in i:
+                ms2 = int(i.split('=')[1])
+    return nbasis, nelec, ms2
+
+def _bad_fcidump_line(text, ncol):
+    """First line of text which is not ncol numbers."""
+    for line in text.splitlines():
+        tokens = line.split()
+        if not tokens:
+            continue
+        if len(tokens) != ncol:
+            return line
+        try:
+            [float(t) for t in tokens]
+        except ValueError:
+            return line
+    return ''
+
+def read_fcidump_body(f, chunk_size=2**26):
+    """Parse integrals from FCIDUMP file in blocks of lines.
+
+    Each block is tokenized in one call to numpy rather than line by line.
+    Real (v i k j l), complex (re im i k j l) and parenthesised complex
+    ((re,im) i k j l) formats are supported.
+
+    Parameters
+    ----------
+    f : file
+        Open FCIDUMP file positioned after the header.
+    chunk_size : int
+        Approximate number of characters to parse at once.
+
+    Yields
+    ------
+    vals : :class:`numpy.ndarray`
+        Integral values.
+    idx : :class:`numpy.ndarray`
+        (i, k, j, l) indices (one based) of each integral.
+    """
+    table = str.maketrans('(),Dd', '   Ee')
+    rest = ''
+    ncol = None
+    while True:
+        buf = f.read(chunk_size)
+        text = rest + buf
+        if buf:
+            # Only parse complete lines.
+            cut = text.rfind('\n') + 1
+            text, rest = text[:cut], text[cut:]
+        text = text.translate(table)
+        if ncol is None:
+            for line in text.splitlines():
+                if line.strip():
+                    ncol = len(line.split())
+                    break
+        if ncol is not None and text.strip():
+            # fromstring stops at the first token it can't parse.
+            ntok = len(text.split())
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                data = numpy.fromstring(text, sep=' ')
+            if data.size != ntok or ntok % ncol != 0:
+                line = _bad_fcidump_line(text, ncol)
+                raise ValueError("Could not parse FCIDUMP line: "
+                                 "'{}'".format(line.strip()))
+            data = data.reshape(-1, ncol)
+            if ncol == 6:
+                vals = data[:,0] + 1j*data[:,1]
+            else:
+                vals = data[:,0]
+            idx = data[:,-4:].astype(numpy.int64)
+            yield vals, idx
+        if not buf:
+            break
+
+def eri_symmetry_images(idx, vals, symmetry):
+    """Indices of all integrals related by permutational symmetry.
+
+    Images are ordered line by line, so assigning them in order gives the same
+    result as expanding each line in turn.
+
+    Parameters
+    ----------
+    idx : :class:`numpy.ndarray`
+        (i, k, j, l) indices (zero based) of (ik|jl).
+    vals : :class:`numpy.ndarray`
+        Integral values.
+    symmetry : int
+        Permutational symmetry (1, 4 or 8).
+
+    Returns
+    -------
+    ikjl : tuple
+        Index arrays of expanded integrals.
+    vals : :class:`numpy.ndarray`
+        Expanded integral values.
+    """
+    i, k, j, l = idx.T
+    vc = vals.conj()
+    images = [(i,k,j,l,vals)]
+    if symmetry >= 4:
+        images += [(j,l,i,k,vals), (k,i,l,j,vc), (l,j,k,i,vc)]
+    if symmetry == 8:
+        images += [(k,i,j,l,vals), (l,j,i,k,vals), (i,k,l,j,vals),
+                   (j,l,k,i,vals)]
+    expanded = [numpy.stack([im[n] for im in images], axis=1).ravel()
+                for n in range(5)]
+    return tuple(expanded[:4]), expanded[4]
+
+def read_fcidump_integrals(filename, symmetry=8, verbose=True,
+                           two_body=None):
+    """Read one-body integrals and stream two-body integrals from FCIDUMP.
 
     Parameters
     ----------
@@ -15,86 +154,87 @@ def read_fcidump(filename, symmetry=8, verbose=True):
     symmetry : int
         Permutational symmetry of two electron integrals.
     verbose : bool
-        Controls printing verbosity. Optional. Default: False.
+        Controls printing verbosity.
+    two_body : callable
+        Called as two_body(idx, vals) for each block of two-electron
+        integrals, with zero based (i, k, j, l) indices of (ik|jl).
 
     Returns
     -------
     h1e : :class:`numpy.ndarray`
         One-body part of the Hamiltonian.
-    h2e : :class:`numpy.ndarray`
-        Two-electron integrals.
     ecore : float
         Core contribution to the total energy.
+    nbasis : int
+        Number of orbitals.
     nelec : tuple
         Number of electrons.
     """
     assert(symmetry==1 or symmetry==4 or symmetry==8)
     if verbose:
         print ("# Reading integrals in plain text FCIDUMP format.")
+    ecore = 0.0
     with open(filename) as f:
-        while True:
-            line = f.readline()
-            if 'END' in line or '/' in line:
-                break
-            for i in line.split(','):
-                if 'NORB' in i:
-                    nbasis = int(i.split('=')[1])
-                elif 'NELEC' in i:
-                    nelec = int(i.split('=')[1])
-                elif 'MS2' in i:
-                    ms2 = int(i.split('=')[1])
+        nbasis, nelec, ms2 = read_fcidump_header(f)
         if verbose:
             print("# Number of orbitals: {}".format(nbasis))
             print("# Number of electrons: {}".format(nelec))
         h1e = numpy.zeros((nbasis, nbasis), dtype=numpy.complex128)
-        h2e = numpy.zeros((nbasis, nbasis, nbasis, nbasis), dtype=numpy.complex128)
-        lines = f.readlines()
-        for l in lines:
-            s = l.split()
+        for (vals, idx) in read_fcidump_body(f):
             # ascii fcidump uses Chemist's notation for integrals.
             # each line contains v_{ijkl} i k j l
             # Note (ik|jl) = <ij|kl>.
-            if len(s) == 6:
-                # FCIDUMP from quantum package.
-                integral = float(s[0]) + 1j*float(s[1])
-                s = s[1:]
-            else:
-                try:
-                    integral = float(s[0])
-                except ValueError:
-                    ig = ast.literal_eval(s[0].strip())
-                    integral = ig[0] + 1j*ig[1]
-            i, k, j, l = [int(x) for x in s[1:]]
-            if i == j == k == l == 0:
-                ecore = integral
-            elif j == 0 and l == 0:
+            i, k, j, l = idx.T
+            core = (i == 0) & (k == 0) & (j == 0) & (l == 0)
+            if numpy.any(core):
+                ecore = vals[core][-1]
+            one = (i > 0) & (k > 0) & (j == 0) & (l == 0)
+            if numpy.any(one):
                 # <i|k> = <k|i>
-                h1e[i-1,k-1] = integral
-                h1e[k-1,i-1] = integral.conjugate()
-            elif i > 0  and j > 0 and k > 0 and l > 0:
-                # Assuming 8 fold symmetry in integrals.
-                # <ij|kl> = <ji|lk> = <kl|ij> = <lk|ji> =
-                # <kj|il> = <li|jk> = <il|kj> = <jk|li>
-                # (ik|jl)
-                h2e[i-1,k-1,j-1,l-1] = integral
-                if symmetry == 1:
-                    continue
-                # (jl|ik)
-                h2e[j-1,l-1,i-1,k-1] = integral
-                # (ki|lj)
-                h2e[k-1,i-1,l-1,j-1] = integral.conjugate()
-                # (lj|ki)
-                h2e[l-1,j-1,k-1,i-1] = integral.conjugate()
-                if symmetry == 4:
-                    continue
-                # (ki|jl)
-                h2e[k-1,i-1,j-1,l-1] = integral
-                # (lj|ik)
-                h2e[l-1,j-1,i-1,k-1] = integral
-                # (ik|lj)
-                h2e[i-1,k-1,l-1,j-1] = integral
-                # (jl|ki)
-                h2e[j-1,l-1,k-1,i-1] = integral
+                ix = numpy.stack([i[one], k[one]], axis=1).ravel() - 1
+                kx = numpy.stack([k[one], i[one]], axis=1).ravel() - 1
+                v = numpy.stack([vals[one], vals[one].conj()], axis=1).ravel()
+                h1e[ix,kx] = v
+            two = (i > 0) & (k > 0) & (j > 0) & (l > 0)
+            if two_body is not None and numpy.any(two):
+                two_body(idx[two]-1, vals[two])
+    nalpha = (nelec + ms2) // 2
+    nbeta = nalpha - ms2
+    return h1e, ecore, nbasis, (nalpha, nbeta)
+
+def read_fcidump(filename, symmetry=8, verbose=True):
+    """Read in integrals from file.
+
+    Parameters
+    ----------
+    filename : string
+        File containing integrals in FCIDUMP format.
+    symmetry : int
+        Permutational symmetry of two electron integrals.
+    verbose : bool
+        Controls printing verbosity. Optional. Default: False.
+
+    Returns
+    -------
+    h1e : :class:`numpy.ndarray`
+        One-body part of the Hamiltonian.
+    h2e : :class:`numpy.ndarray`
+        Two-electron integrals.
+    ecore : float
+        Core contribution to the total energy.
+    nelec : tuple
+        Number of electrons.
+    """
+    with open(filename) as f:
+        nbasis, nelec, ms2 = read_fcidump_header(f)
+    h2e = numpy.zeros((nbasis, nbasis, nbasis, nbasis), dtype=numpy.complex128)
+    def two_body(idx, vals):
+        ikjl, v = eri_symmetry_images(idx, vals, symmetry)
+        h2e[ikjl] = v
+    h1e, ecore, nbasis, nelec = read_fcidump_integrals(filename,
+                                                       symmetry=symmetry,
+                                                       verbose=verbose,
+                                                       two_body=two_body)
     if symmetry == 8:
         if numpy.any(numpy.abs(h1e.imag)) > 1e-18:
             print("# Found complex numbers in one-body Hamiltonian but 8-fold"
@@ -102,9 +242,134 @@ def read_fcidump(filename, symmetry=8, verbose=True):
         if numpy.any(numpy.abs(h2e.imag)) > 1e-18:
             print("# Found complex numbers in two-body Hamiltonian but 8-fold"
                   " symmetry specified.")
-    nalpha = (nelec + ms2) // 2
-    nbeta = nalpha - ms2
-    return h1e, h2e, ecore, (nalpha, nbeta)
+    return h1e, h2e, ecore, nelec
+
+class ComplexIntegralsError(ValueError):
+    """Complex two-electron integrals found where real ones are required."""
+    pass
+
+class PackedERI(object):
+    """Real 8-fold symmetric ERIs stored by orbital pair.
+
+    Behaves like the (nbasis^2, nbasis^2) matrix :math:`M_{(ik),(lj)} =
+    (ik|jl)` for :func:`pauxy.utils.linalg.modified_cholesky_blocked`, but
+    only stores the (npair, npair) matrix of pair integrals.
+
+    Parameters
+    ----------
+    nbasis : int
+        Number of orbitals.
+
+    Attributes
+    ----------
+    V : :class:`numpy.ndarray`
+        Integrals (ik|jl) indexed by pair(i,k), pair(j,l).
+    pair : :class:`numpy.ndarray`
+        Pair index of each flattened (ik).
+    """
+
+    def __init__(self, nbasis):
+        npair = nbasis*(nbasis+1)//2
+        self.V = numpy.zeros((npair, npair))
+        i, k = numpy.indices((nbasis, nbasis))
+        self.pair = self.pair_index(i, k).ravel()
+        self.shape = (nbasis*nbasis, nbasis*nbasis)
+        self.dtype = self.V.dtype
+
+    @staticmethod
+    def pair_index(i, k):
+        a = numpy.maximum(i, k)
+        b = numpy.minimum(i, k)
+        return a*(a+1)//2 + b
+
+    def add(self, idx, vals):
+        """Store block of integrals (ik|jl) with zero based indices.
+
+        Raises ComplexIntegralsError if any integral is complex, as complex
+        integrals do not have 8-fold permutational symmetry.
+        """
+        if numpy.iscomplexobj(vals) and numpy.max(numpy.abs(vals.imag)) > 1e-12:
+            raise ComplexIntegralsError("Complex two-electron integrals found "
+                                        "but 8-fold symmetry specified.")
+        i, k, j, l = idx.T
+        p = self.pair_index(i, k)
+        q = self.pair_index(j, l)
+        P = numpy.stack([p, q], axis=1).ravel()
+        Q = numpy.stack([q, p], axis=1).ravel()
+        v = numpy.real(vals)
+        self.V[P,Q] = numpy.stack([v, v], axis=1).ravel()
+
+    def diagonal(self):
+        return self.V[self.pair,self.pair]
+
+    def __getitem__(self, key):
+        (rows, cols) = key
+        return self.V[numpy.ix_(self.pair[rows], self.pair[cols])]
+
+def fcidump_to_cholesky(filename, tol=1e-5, symmetry=8, verbose=True,
+                        cmax=20, block_size=32):
+    """Modified Cholesky decomposition of integrals in FCIDUMP file.
+
+    For 8-fold symmetry the two-electron integrals are only stored by
+    orbital pair (see :class:`PackedERI`) and the full nbasis^4 tensor is
+    never constructed.
+
+    Parameters
+    ----------
+    filename : string
+        File containing integrals in FCIDUMP format.
+    tol : float
+        Cholesky convergence threshold.
+    symmetry : int
+        Permutational symmetry of two electron integrals.
+    verbose : bool
+        Controls printing verbosity.
+    cmax : int
+        Maximum number of Cholesky vectors is cmax*nbasis.
+    block_size : int
+        Number of pivots per block of the Cholesky decomposition.
+
+    Returns
+    -------
+    h1e : :class:`numpy.ndarray`
+        One-body part of the Hamiltonian.
+    chol : :class:`numpy.ndarray`
+        Cholesky vectors of shape (nchol, nbasis*nbasis).
+    ecore : float
+        Core contribution to the total energy.
+    nelec : tuple
+        Number of electrons.
+    """
+    eri = None
+    if symmetry == 8:
+        with open(filename) as f:
+            nbasis, nelec, ms2 = read_fcidump_header(f)
+        eri = PackedERI(nbasis)
+        try:
+            h1e, ecore, nbasis, nelec = read_fcidump_integrals(
+                    filename, symmetry=symmetry, verbose=verbose,
+                    two_body=eri.add)
+        except ComplexIntegralsError:
+            if verbose:
+                print("# Found complex two-electron integrals. Falling back "
+                      "to 4-fold symmetry.")
+            symmetry = 4
+            eri = None
+        else:
+            if verbose:
+                mem = eri.V.nbytes / 1024.0**3
+                print("# Memory required for packed integrals: {:.6f} GB"
+                      .format(mem))
+    if eri is None:
+        h1e, h2e, ecore, nelec = read_fcidump(filename, symmetry=symmetry,
+                                              verbose=verbose)
+        nbasis = h1e.shape[-1]
+        # If the ERIs are complex then we need to form M_{(ik),(lj}} which is
+        # Hermitian.
+        eri = numpy.transpose(h2e,(0,1,3,2)).reshape(nbasis**2,nbasis**2)
+    chol = modified_cholesky_blocked(eri, tol, verbose, cmax=cmax,
+                                     block_size=block_size)
+    return h1e, chol, ecore, nelec
 
 def read_qmcpack_hamiltonian(filename, get_chol=True):
     """Read Hamiltonian from QMCPACK format.
@@ -131,22 +131,7 @@ def from_qmcpack_sparse(filename):
         enuc = fh5['Hamiltonian/Energies'][:][0]
         dims = fh5['Hamiltonian/dims'][:]
         nmo = dims[3]
-        real_ints = False
-        try:
-            hcore = fh5['Hamiltonian/hcore'][:]
-            hcore = hcore.view(numpy.complex128).reshape(nmo,nmo)
-        except KeyError:
-            # Old sparse format.
-            hcore = fh5['Hamiltonian/H1'][:].view(numpy.complex128).ravel()
-            idx = fh5['Hamiltonian/H1_indx'][:]
-            row_ix = idx[::2]
-            col_ix = idx[1::2]
-            hcore = scipy.sparse.csr_matrix((hcore, (row_ix, col_ix))).toarray()
-            hcore = numpy.tril(hcore, -1) + numpy.tril(hcore, 0).conj().T
-        except ValueError:
-            # Real format.
-            hcore = fh5['Hamiltonian/hcore'][:]
-            real_ints = True
+        hcore, real_ints = read_qmcpack_hcore(fh5, nmo)
         chunks = dims[2]
         block_sizes = fh5['Hamiltonian/Factorized/block_sizes'][:]
         nchol = dims[7]
@@ -173,6 +158,144 @@ def from_qmcpack_sparse(filename):
                                             shape=(nmo*nmo,nchol))
         return (hcore, chol_vecs, enuc, int(nmo), int(nalpha), int(nbeta))
 
+def read_qmcpack_cholesky_dims(filename):
+    """Read dimensions of Cholesky vectors from QMCPACK hdf5 file.
+
+    Parameters
+    ----------
+    filename : string
+        QMCPACK Hamiltonian file.
+
+    Returns
+    -------
+    nmo : int
+        Number of basis functions.
+    nchol : int
+        Number of Cholesky vectors.
+    real_ints : bool
+        True if integrals are stored in real format.
+    """
+    with h5py.File(filename, 'r') as fh5:
+        dims = fh5['Hamiltonian/dims'][:]
+        nmo = int(dims[3])
+        nchol = int(dims[7])
+        hcore, real_ints = read_qmcpack_hcore(fh5, nmo)
+    return nmo, nchol, real_ints
+
+def read_qmcpack_hcore(fh5, nmo):
+    """Read one-body Hamiltonian from open QMCPACK hdf5 file.
+
+    Parameters
+    ----------
+    fh5 : :class:`h5py.File`
+        Open Hamiltonian file.
+    nmo : int
+        Number of basis functions.
+
+    Returns
+    -------
+    hcore : :class:`numpy.ndarray`
+        One-body Hamiltonian.
+    real_ints : bool
+        True if integrals are stored in real format.
+    """
+    try:
+        hcore = fh5['Hamiltonian/hcore'][:]
+        hcore = hcore.view(numpy.complex128).reshape(nmo,nmo)
+        real_ints = False
+    except KeyError:
+        # Old sparse format.
+        hcore = fh5['Hamiltonian/H1'][:].view(numpy.complex128).ravel()
+        idx = fh5['Hamiltonian/H1_indx'][:]
+        row_ix = idx[::2]
+        col_ix = idx[1::2]
+        hcore = scipy.sparse.csr_matrix((hcore, (row_ix, col_ix))).toarray()
+        hcore = numpy.tril(hcore, -1) + numpy.tril(hcore, 0).conj().T
+        real_ints = False
+    except ValueError:
+        # Real format.
+        hcore = fh5['Hamiltonian/hcore'][:]
+        real_ints = True
+    return hcore, real_ints
+
+def from_qmcpack_cholesky(filename, start=0, end=None, block_size=None):
+    """Read Cholesky vectors from QMCPACK hdf5 file in blocks.
+
+    Works for both sparse and dense formats. Vectors are written directly
+    into a single (nvec, nmo, nmo) array, so neither the full file dataset nor
+    transposed copies of it are held in memory at the same time.
+
+    Parameters
+    ----------
+    filename : string
+        QMCPACK Hamiltonian file.
+    start : int
+        Index of first Cholesky vector to read. Optional. Default 0.
+    end : int
+        One past the index of last Cholesky vector to read. Optional. Default
+        None, i.e., read all vectors.
+    block_size : int
+        Number of Cholesky vectors to read at once from dense files.
+        Optional. Default None, i.e., use blocks of roughly 128 MB.
+
+    Returns
+    -------
+    hcore : :class:`numpy.ndarray`
+        One-body Hamiltonian.
+    chol_vecs : :class:`numpy.ndarray`
+        Cholesky vectors of shape (end-start, nmo, nmo).
+    enuc : float
+        Nuclear repulsion energy.
+    nmo : int
+        Number of basis functions.
+    nalpha : int
+        Number of alpha electrons.
+    nbeta : int
+        Number of beta electrons.
+    """
+    with h5py.File(filename, 'r') as fh5:
+        enuc = fh5['Hamiltonian/Energies'][:][0]
+        dims = fh5['Hamiltonian/dims'][:]
+        nmo = int(dims[3])
+        nalpha = int(dims[4])
+        nbeta = int(dims[5])
+        nchol = int(dims[7])
+        if end is None:
+            end = nchol
+        nvec = end - start
+        hcore, real_ints = read_qmcpack_hcore(fh5, nmo)
+        dtype = numpy.float64 if real_ints else numpy.complex128
+        chol_vecs = numpy.zeros((nvec, nmo, nmo), dtype=dtype)
+        if 'Hamiltonian/DenseFactorized/L' in fh5:
+            dset = fh5['Hamiltonian/DenseFactorized/L']
+            if block_size is None:
+                itemsize = numpy.dtype(dtype).itemsize
+                block_size = max(1, 2**27 // (nmo*nmo*itemsize))
+            for n0 in range(start, end, block_size):
+                n1 = min(n0+block_size, end)
+                block = dset[:,n0:n1]
+                if not real_ints:
+                    block = block.view(numpy.complex128).reshape(nmo*nmo,-1)
+                chol_vecs[n0-start:n1-start] = block.T.reshape((-1,nmo,nmo))
+        else:
+            # Sparse (row=ik, column=n) pairs stored in blocks. Duplicate
+            # entries are summed as for a COO matrix.
+            flat = chol_vecs.reshape(nvec, nmo*nmo)
+            block_sizes = fh5['Hamiltonian/Factorized/block_sizes'][:]
+            for ic in range(len(block_sizes)):
+                ixs = fh5['Hamiltonian/Factorized/index_%i'%ic][:]
+                vals = fh5['Hamiltonian/Factorized/vals_%i'%ic][:]
+                if real_ints:
+                    vals = numpy.real(vals).ravel()
+                else:
+                    vals = vals.view(numpy.complex128).ravel()
+                row_ix = ixs[::2]
+                col_ix = ixs[1::2]
+                mask = (col_ix >= start) & (col_ix < end)
+                numpy.add.at(flat, (col_ix[mask]-start, row_ix[mask]),
+                             vals[mask])
+    return (hcore, chol_vecs, enuc, nmo, nalpha, nbeta)
+
 def write_qmcpack_dense(hcore, chol, nelec, nmo, enuc=0.0,
                         filename='hamiltonian.h5', real_chol=True,
                         verbose=False, ortho=None):
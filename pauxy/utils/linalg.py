@@ -1,4 +1,5 @@
 import functools
+import math
 import numpy
 import scipy.linalg
 import time
@@ -108,6 +109,34 @@ def overlap(A,B):
     S = numpy.dot(A.conj().T, B)
     return S
 
+def adjugate(A):
+    """Adjugate of a stack of small square matrices.
+
+    Unlike det(A) inv(A) this is well defined for singular matrices.
+
+    Parameters
+    ----------
+    A : :class:`numpy.ndarray`
+        Array of shape (..., n, n).
+
+    Returns
+    -------
+    adj : :class:`numpy.ndarray`
+        Adjugates of matrices in A.
+    """
+    n = A.shape[-1]
+    if n == 1:
+        return numpy.ones_like(A)
+    adj = numpy.zeros_like(A)
+    idx = numpy.arange(n)
+    for i in range(n):
+        rows = idx[idx != i]
+        for j in range(n):
+            cols = idx[idx != j]
+            minor = A[..., rows[:,None], cols[None,:]]
+            adj[..., j, i] = (-1)**(i+j) * numpy.linalg.det(minor)
+    return adj
+
 
 def modified_cholesky(M, tol=1e-6, verbose=True, cmax=20):
     """Modified cholesky decomposition of matrix.
@@ -160,6 +189,78 @@ def modified_cholesky(M, tol=1e-6, verbose=True, cmax=20):
 
     return numpy.array(chol_vecs[:nchol])
 
+def modified_cholesky_blocked(M, tol=1e-6, verbose=True, cmax=20,
+                              block_size=32):
+    """Blocked modified cholesky decomposition of matrix.
+
+    Pivots are chosen exactly as in :func:`modified_cholesky`, so the same
+    vectors are returned to within round off. The residual columns of up to
+    block_size candidate pivots (the largest elements of the residual
+    diagonal) are computed with a single matrix-matrix product. A block ends
+    early once the largest residual element is not one of the candidates.
+
+    Parameters
+    ----------
+    M : :class:`numpy.ndarray`
+        Positive semi-definite, symmetric matrix. Any object with shape and
+        dtype attributes, a diagonal() method and column indexing M[:,cols]
+        can be used instead, e.g.
+        :class:`pauxy.utils.hamiltonian_converter.PackedERI`.
+    tol : float
+        Accuracy desired.
+    verbose : bool
+        If true print out convergence progress.
+    cmax : int
+        Maximum number of cholesky vectors is cmax * sqrt(M.shape[0]).
+    block_size : int
+        Number of candidate pivots per block.
+
+    Returns
+    -------
+    chol_vecs : :class:`numpy.ndarray`
+        Matrix of cholesky vectors.
+    """
+    assert len(M.shape) == 2
+    diag = M.diagonal()
+    nchol_max = int(cmax*M.shape[0]**0.5)
+    delta = numpy.copy(diag)
+    nu = numpy.argmax(numpy.abs(delta))
+    delta_max = delta[nu]
+    if verbose:
+        print ("# max number of cholesky vectors = %d"%nchol_max)
+        print ("# iteration %d: delta_max = %f"%(0, delta_max.real))
+    Mapprox = numpy.zeros(M.shape[0], dtype=M.dtype)
+    chol_vecs = numpy.zeros((nchol_max, M.shape[0]), dtype=M.dtype)
+    nchol = 0
+    while abs(delta_max) > tol and nchol < nchol_max:
+        start = time.time()
+        pivots = numpy.argsort(-numpy.abs(delta))[:block_size]
+        index = {p: i for (i, p) in enumerate(pivots)}
+        # Residual columns of candidate pivots from previous vectors.
+        Lp = chol_vecs[:nchol,pivots].conj().T
+        R = numpy.dot(Lp, chol_vecs[:nchol])
+        cols = M[:,pivots].T - R
+        nblock = nchol
+        while abs(delta_max) > tol and nchol < nchol_max:
+            if nu not in index:
+                break
+            Munu0 = numpy.dot(chol_vecs[nblock:nchol,nu].conj(),
+                              chol_vecs[nblock:nchol,:])
+            chol_vecs[nchol] = (cols[index[nu]] - Munu0) / delta_max**0.5
+            Mapprox += chol_vecs[nchol]*chol_vecs[nchol].conj()
+            delta = diag - Mapprox
+            nu = numpy.argmax(numpy.abs(delta))
+            delta_max = numpy.abs(delta[nu])
+            nchol += 1
+        if verbose:
+            step_time = time.time() - start
+            info = (nchol, delta_max, nchol-nblock, step_time)
+            print ("# iteration %d: delta_max = %13.8e: block size = %d: "
+                   "time = %13.8e"%info)
+    if verbose and abs(delta_max) > tol:
+        print ("# Warning: maximum number of cholesky vectors reached.")
+    return numpy.array(chol_vecs[:nchol])
+
 def exponentiate_matrix(M, order=6):
     """Taylor series approximation for matrix exponential"""
     T = numpy.copy(M)
@@ -169,6 +270,51 @@ def exponentiate_matrix(M, order=6):
         T = M.dot(T) / (n+1)
     return EXPM
 
+def exponentiate_matrix_adaptive(M, tol=1e-6, max_order=6, scaling=True):
+    """Taylor series approximation for matrix exponential with adaptive order.
+
+    The series is truncated once the norm of the next term falls below tol
+    relative to the norm of the partial sum. If scaling is True and the
+    1-norm of M exceeds one, the exponential of M/2^s is computed and squared
+    s times.
+
+    Parameters
+    ----------
+    M : :class:`numpy.ndarray`
+        Matrix to exponentiate.
+    tol : float
+        Relative truncation threshold.
+    max_order : int
+        Maximum order of Taylor series.
+    scaling : bool
+        If True use scaling and squaring for matrices with large norm.
+
+    Returns
+    -------
+    EXPM : :class:`numpy.ndarray`
+        Approximation to exp(M).
+    order : int
+        Number of terms retained in Taylor series.
+    """
+    nsquare = 0
+    if scaling:
+        norm = numpy.max(numpy.sum(numpy.abs(M), axis=0))
+        if norm > 1.0:
+            nsquare = int(math.ceil(math.log2(norm)))
+            M = M / 2**nsquare
+    EXPM = numpy.identity(M.shape[0], dtype=numpy.complex128)
+    T = numpy.identity(M.shape[0], dtype=numpy.complex128)
+    order = max_order
+    for n in range(1, max_order+1):
+        T = M.dot(T) / n
+        EXPM += T
+        if numpy.linalg.norm(T) < tol * numpy.linalg.norm(EXPM):
+            order = n
+            break
+    for i in range(nsquare):
+        EXPM = EXPM.dot(EXPM)
+    return EXPM, order
+
 def molecular_orbitals_rhf(fock, AORot):
     fock_ortho = numpy.dot(AORot.conj().T, numpy.dot(fock, AORot))
     mo_energies, mo_orbs = scipy.linalg.eigh(fock_ortho)
@@ -96,7 +96,8 @@ def serialise(obj, verbose=0):
         elif k == 'estimates' or k == 'global_estimates':
             pass
         elif k == 'walkers':
-            obj_dict[k] = [str(x) for x in v][0]
+            if len(v) > 0:
+                obj_dict[k] = str(v[0])
         elif isinstance(v, numpy.ndarray):
             if verbose == 3:
                 if v.dtype == complex:
@@ -0,0 +1,334 @@
+"""Utilities for sharing integrals and other data between MPI ranks."""
+import io
+import numpy
+import pickle
+import scipy.sparse
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+def is_mpi_comm(comm):
+    """True if comm is a genuine mpi4py intracommunicator."""
+    return MPI is not None and isinstance(comm, MPI.Intracomm)
+
+
+def get_shared_memory(comm, verbose=False):
+    """Create node-level shared memory handler if possible.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+        Global communicator.
+    verbose : bool
+        Print extra information.
+
+    Returns
+    -------
+    shm : :class:`NodeSharedMemory` or None
+        Shared memory handler. None if mpi4py is unavailable or comm is not a
+        genuine MPI communicator (e.g. :class:`pauxy.qmc.comm.FakeComm`).
+    """
+    if not is_mpi_comm(comm):
+        if verbose:
+            print("# Node-level shared memory unavailable. Using private "
+                  "copies of integrals.")
+        return None
+    shm = NodeSharedMemory(comm)
+    if verbose:
+        print("# Using node-level shared memory for integrals.")
+        print("# Number of ranks per node (root node): %d"%shm.node.size)
+    return shm
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Pickler which stores large numpy arrays out of band."""
+
+    def __init__(self, file, min_bytes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.min_bytes = min_bytes
+        self.arrays = []
+        self.index = {}
+
+    def persistent_id(self, obj):
+        if (type(obj) is not numpy.ndarray or obj.dtype.hasobject or
+                obj.nbytes < self.min_bytes):
+            return None
+        # Arrays referenced more than once are only sent once.
+        pid = self.index.get(id(obj))
+        if pid is None:
+            pid = len(self.arrays)
+            self.index[id(obj)] = pid
+            self.arrays.append(obj)
+        return pid
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    """Unpickler which restores arrays stored by :class:`_ArrayPickler`."""
+
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        return self.arrays[pid]
+
+
+def bcast_object(obj, comm, root=0, min_bytes=2**16, max_bytes=2**30):
+    """Broadcast object sending large numpy arrays as raw buffers.
+
+    Pickling an object containing large arrays, e.g. a multi-determinant
+    trial wavefunction, creates several temporary copies of the data on every
+    rank. Here only a skeleton of the object is pickled, while arrays larger
+    than min_bytes are broadcast directly into their final memory.
+
+    Parameters
+    ----------
+    obj : object
+        Object to broadcast. Only referenced on root.
+    comm : MPI communicator
+        Communicator.
+    root : int
+        Rank of sending processor. Optional. Default 0.
+    min_bytes : int
+        Arrays smaller than this are pickled. Optional. Default 64 KB.
+    max_bytes : int
+        Maximum size of a single broadcast. Optional. Default 1 GB.
+
+    Returns
+    -------
+    obj : object
+        obj on root, a copy of it on other ranks.
+    """
+    if comm.size == 1:
+        return obj
+    if comm.rank == root:
+        f = io.BytesIO()
+        pickler = _ArrayPickler(f, min_bytes)
+        pickler.dump(obj)
+        arrays = [numpy.ascontiguousarray(a) for a in pickler.arrays]
+        meta = (f.getvalue(), [(a.shape, a.dtype.str) for a in arrays])
+    else:
+        meta = None
+    (skeleton, specs) = comm.bcast(meta, root=root)
+    if comm.rank != root:
+        arrays = [numpy.empty(shape, dtype=dtype) for (shape, dtype) in specs]
+    for a in arrays:
+        flat = a.reshape(-1).view(numpy.uint8)
+        for i in range(0, flat.size, max_bytes):
+            comm.Bcast(flat[i:i+max_bytes], root=root)
+    if comm.rank == root:
+        return obj
+    return _ArrayUnpickler(io.BytesIO(skeleton), arrays).load()
+
+
+class NodeSharedMemory(object):
+    """Allocate arrays once per node in MPI-3 shared memory windows.
+
+    Arrays are constructed on the global root, broadcast between the node
+    leaders and written once into a shared window. All ranks on a node then
+    map the same buffer read-only.
+
+    Parameters
+    ----------
+    comm : :class:`mpi4py.MPI.Intracomm`
+        Global communicator.
+
+    Attributes
+    ----------
+    node : :class:`mpi4py.MPI.Intracomm`
+        Communicator for ranks sharing memory with this rank.
+    leaders : :class:`mpi4py.MPI.Intracomm`
+        Communicator between rank 0 of each node. MPI.COMM_NULL on other
+        ranks.
+    windows : list
+        Allocated shared memory windows.
+    """
+
+    # Maximum number of elements per broadcast to stay within MPI int counts.
+    max_count = 2**27
+
+    def __init__(self, comm):
+        self.comm = comm
+        self.node = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.rank)
+        color = 0 if self.node.rank == 0 else MPI.UNDEFINED
+        self.leaders = comm.Split(color, key=comm.rank)
+        self.windows = []
+
+    @property
+    def is_root(self):
+        return self.comm.rank == 0
+
+    @property
+    def is_node_root(self):
+        return self.node.rank == 0
+
+    def allocate(self, shape, dtype):
+        """Allocate array in node-level shared memory.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of array.
+        dtype : :class:`numpy.dtype`
+            Data type.
+
+        Returns
+        -------
+        array : :class:`numpy.ndarray`
+            Array backed by shared window. Only writeable on node leaders.
+        """
+        dtype = numpy.dtype(dtype)
+        nbytes = int(numpy.prod(shape)) * dtype.itemsize
+        size = nbytes if self.is_node_root else 0
+        win = MPI.Win.Allocate_shared(size, dtype.itemsize, comm=self.node)
+        self.windows.append(win)
+        buf, itemsize = win.Shared_query(0)
+        array = numpy.ndarray(buffer=buf, dtype=dtype, shape=shape)
+        if not self.is_node_root:
+            array.setflags(write=False)
+        return array
+
+    def share(self, obj):
+        """Copy array from global root into node-level shared memory.
+
+        Parameters
+        ----------
+        obj : :class:`numpy.ndarray` or :class:`scipy.sparse.csr_matrix`
+            Array to share. Only referenced on the global root.
+
+        Returns
+        -------
+        shared : :class:`numpy.ndarray` or :class:`scipy.sparse.csr_matrix`
+            Read-only copy of obj backed by shared memory.
+        """
+        if self.is_root:
+            sparse = scipy.sparse.issparse(obj)
+            shape = obj.shape
+        else:
+            sparse = shape = None
+        sparse, shape = self.comm.bcast((sparse, shape), root=0)
+        if sparse:
+            if self.is_root:
+                obj = obj.tocsr()
+                parts = (obj.data, obj.indices, obj.indptr)
+            else:
+                parts = (None, None, None)
+            data, indices, indptr = [self._share_array(p) for p in parts]
+            return scipy.sparse.csr_matrix((data, indices, indptr),
+                                           shape=shape, copy=False)
+        else:
+            return self._share_array(obj)
+
+    def _share_array(self, array):
+        if self.is_root:
+            array = numpy.ascontiguousarray(array)
+            meta = (array.shape, array.dtype.str)
+        else:
+            meta = None
+        shape, dtype = self.comm.bcast(meta, root=0)
+        shared = self.allocate(shape, dtype)
+        if self.is_node_root:
+            if self.is_root:
+                shared[...] = array
+            flat = shared.reshape(-1)
+            for i in range(0, flat.size, self.max_count):
+                self.leaders.Bcast(flat[i:i+self.max_count], root=0)
+            shared.setflags(write=False)
+        self.node.Barrier()
+        return shared
+
+    def free(self):
+        """Release shared memory windows."""
+        for win in self.windows:
+            win.Free()
+        self.windows = []
+
+
+class CholeskyGroup(object):
+    """Partition of the Cholesky / auxiliary field index across ranks.
+
+    Consecutive ranks of comm are split into groups of group_size ranks. Each
+    rank in a group stores a contiguous slice of the auxiliary field index and
+    all ranks in a group propagate identical walkers. Quantities which are
+    sums over the field index are reduced across the group, while per-field
+    vectors are allgathered.
+
+    Parameters
+    ----------
+    comm : :class:`mpi4py.MPI.Intracomm`
+        Global communicator.
+    group_size : int
+        Number of ranks sharing the integrals. Must divide comm.size.
+    nfields : int
+        Length of field index to partition.
+
+    Attributes
+    ----------
+    comm : :class:`mpi4py.MPI.Intracomm`
+        Communicator for ranks within this group.
+    walker_comm : :class:`mpi4py.MPI.Intracomm`
+        Communicator between ranks holding the same slice in each group. Used
+        for operations over the walker population, e.g. population control.
+    counts : :class:`numpy.ndarray`
+        Number of fields stored on each rank in the group.
+    displs : :class:`numpy.ndarray`
+        Offset of each rank's slice.
+    slice : slice
+        Slice of field index stored on this rank.
+    """
+
+    def __init__(self, comm, group_size, nfields):
+        self.comm = comm.Split(comm.rank // group_size, key=comm.rank)
+        self.walker_comm = comm.Split(self.comm.rank, key=comm.rank)
+        size = self.comm.size
+        self.counts = numpy.full(size, nfields // size, dtype=numpy.int32)
+        self.counts[:nfields % size] += 1
+        self.displs = numpy.zeros(size, dtype=numpy.int32)
+        self.displs[1:] = numpy.cumsum(self.counts)[:-1]
+        start = int(self.displs[self.comm.rank])
+        self.slice = slice(start, start+int(self.counts[self.comm.rank]))
+        self.nfields = nfields
+
+    def gather(self, local):
+        """Allgather slices of a vector along its last axis.
+
+        Parameters
+        ----------
+        local : :class:`numpy.ndarray`
+            Array of shape (..., nlocal).
+
+        Returns
+        -------
+        full : :class:`numpy.ndarray`
+            Array of shape (..., nfields).
+        """
+        shape = local.shape[:-1]
+        nrow = int(numpy.prod(shape))
+        # Blocks from each rank must be contiguous in the receive buffer.
+        send = numpy.ascontiguousarray(local.reshape(nrow, -1).T)
+        recv = numpy.empty((self.nfields, nrow), dtype=local.dtype)
+        self.comm.Allgatherv(send, [recv, (self.counts*nrow,
+                                           self.displs*nrow)])
+        return recv.T.reshape(shape+(self.nfields,))
+
+    def reduce(self, local):
+        """Sum array over ranks in group.
+
+        Parameters
+        ----------
+        local : :class:`numpy.ndarray` or scalar
+            Contribution from this rank's slice.
+
+        Returns
+        -------
+        total : :class:`numpy.ndarray` or scalar
+            Sum over group.
+        """
+        if numpy.isscalar(local):
+            return self.comm.allreduce(local, op=MPI.SUM)
+        local = numpy.ascontiguousarray(local)
+        total = numpy.empty_like(local)
+        self.comm.Allreduce(local, total, op=MPI.SUM)
+        return total
@@ -0,0 +1,37 @@
+import numpy
+import pytest
+from pauxy.estimators.ci import get_perm
+from pauxy.utils.bitstring import (
+        occs_to_bits,
+        popcount,
+        excitation_level,
+        excitation
+        )
+
+@pytest.mark.unit
+def test_popcount():
+    x = numpy.array([0, 1, 2**63+5, 2**64-1], dtype=numpy.uint64)
+    assert numpy.all(popcount(x) == [0, 1, 3, 64])
+
+@pytest.mark.unit
+def test_excitation():
+    numpy.random.seed(7)
+    norbs = 150
+    nelec = 10
+    ref = numpy.sort(numpy.random.choice(norbs, nelec, replace=False))
+    bref = occs_to_bits([ref], norbs)
+    for nex in [1, 2]:
+        for it in range(20):
+            det = ref.copy()
+            holes = numpy.random.choice(nelec, nex, replace=False)
+            virt = numpy.setdiff1d(numpy.arange(norbs), ref)
+            det[holes] = numpy.random.choice(virt, nex, replace=False)
+            det = numpy.sort(det)
+            bdet = occs_to_bits([det], norbs)
+            assert excitation_level(bdet, bref)[0] == nex
+            (f, t, perm) = excitation(bdet, bref, nex)
+            from_orb = sorted(set(ref)-set(det))
+            to_orb = sorted(set(det)-set(ref))
+            assert numpy.all(f[0] == from_orb)
+            assert numpy.all(t[0] == to_orb)
+            assert perm[0] == get_perm(from_orb, to_orb, det, ref)
@@ -1,3 +1,5 @@
+import h5py
+import numpy
 import os
 import pytest
 try:
@@ -6,7 +8,8 @@ try:
             integrals_from_scf,
             integrals_from_chkfile,
             get_pyscf_wfn,
-            dump_pauxy
+            dump_pauxy,
+            chunked_cholesky_outcore
             )
     no_pyscf = False
 except (ImportError, OSError):
@@ -56,9 +59,26 @@ def test_pyscf_to_pauxy():
     h1e, chol, ecore, nmo, na, nb = from_qmcpack_sparse('afqmc.h5')
     write_input('input.json', 'afqmc.h5', 'afqmc.h5')
 
+@pytest.mark.unit
+@pytest.mark.skipif(no_pyscf, reason="pyscf not found.")
+def test_cholesky_outcore():
+    atom = gto.M(atom=[('H', 1.5*i, 0, 0) for i in range(0,6)],
+                 basis='6-31g', verbose=0, parse_arg=False)
+    nao = atom.nao_nr()
+    eri = atom.intor('int2e_sph').reshape(nao*nao, nao*nao)
+    # Small chunks with and without caching exercise reading back from file.
+    for cache in [0.0, 1.0]:
+        nchol = chunked_cholesky_outcore(atom, filename='chol.h5',
+                                         max_error=1e-5, CHUNK_SIZE=1e-5,
+                                         CACHE_SIZE=cache, nbatch=4)
+        with h5py.File('chol.h5', 'r') as fh5:
+            L = fh5['Lao'][:nchol]
+            assert fh5['dims'][1] == nchol
+        assert numpy.max(numpy.abs(numpy.dot(L.T, L)-eri)) < 1e-5
+
 def teardown_module(self):
     cwd = os.getcwd()
-    files = ['scf.chk', 'afqmc.h5', 'input.json']
+    files = ['scf.chk', 'afqmc.h5', 'input.json', 'chol.h5']
     for f in files:
         try:
             os.remove(cwd+'/'+f)
@@ -0,0 +1,68 @@
+import os
+import numpy
+import pytest
+from pauxy.utils.hamiltonian_converter import (
+        read_fcidump,
+        fcidump_to_cholesky,
+        ComplexIntegralsError,
+        PackedERI
+        )
+
+def write_test_fcidump(filename, h1e, eri, ecore, nelec):
+    nmo = h1e.shape[0]
+    with open(filename, 'w') as f:
+        f.write("&FCI NORB={:d}, NELEC={:d}, MS2=0,\n".format(nmo, nelec))
+        f.write("ORBSYM=" + ",".join(["1"]*nmo) + ",\nISYM=1\n&END\n")
+        for i in range(nmo):
+            for k in range(i+1):
+                for j in range(nmo):
+                    for l in range(j+1):
+                        if i*(i+1)//2+k >= j*(j+1)//2+l:
+                            f.write("{: 20.16e} {:d} {:d} {:d} {:d}\n"
+                                    .format(eri[i,k,j,l], i+1, k+1, j+1, l+1))
+        for i in range(nmo):
+            for k in range(i+1):
+                f.write("{: 20.16e} {:d} {:d} 0 0\n".format(h1e[i,k], i+1, k+1))
+        f.write("{: 20.16e} 0 0 0 0\n".format(ecore))
+
+@pytest.mark.unit
+def test_fcidump():
+    numpy.random.seed(7)
+    nmo = 5
+    L = numpy.random.random((8,nmo,nmo))
+    L = L + L.transpose(0,2,1)
+    eri = numpy.einsum('xik,xjl->ikjl', L, L)
+    h1e = numpy.random.random((nmo,nmo))
+    h1e = h1e + h1e.T
+    write_test_fcidump('FCIDUMP_test', h1e, eri, 1.5, 4)
+    h1e_, h2e, ecore, nelec = read_fcidump('FCIDUMP_test', verbose=False)
+    assert nelec == (2,2)
+    assert ecore == pytest.approx(1.5)
+    assert numpy.max(numpy.abs(h1e_-h1e)) < 1e-12
+    assert numpy.max(numpy.abs(h2e-eri)) < 1e-12
+    M = eri.transpose(0,1,3,2).reshape(nmo*nmo,nmo*nmo)
+    h1e_, chol, ecore, nelec = fcidump_to_cholesky('FCIDUMP_test', tol=1e-8,
+                                                   verbose=False)
+    assert numpy.max(numpy.abs(numpy.dot(chol.T, chol)-M)) < 1e-8
+    eri = PackedERI(nmo)
+    with pytest.raises(ComplexIntegralsError):
+        eri.add(numpy.array([[0,1,0,1]]), numpy.array([1.0+0.5j]))
+    # Corrupt line mid file.
+    with open('FCIDUMP_test') as f:
+        lines = f.readlines()
+    lines[10] = lines[10].replace('e', 'x', 1)
+    with open('FCIDUMP_test', 'w') as f:
+        f.writelines(lines)
+    with pytest.raises(ValueError):
+        read_fcidump('FCIDUMP_test', verbose=False)
+    with pytest.raises(ValueError):
+        fcidump_to_cholesky('FCIDUMP_test', verbose=False)
+
+def teardown_module():
+    cwd = os.getcwd()
+    files = ['FCIDUMP_test']
+    for f in files:
+        try:
+            os.remove(cwd+'/'+f)
+        except OSError:
+            pass
@@ -0,0 +1,22 @@
+import numpy
+import pytest
+from pauxy.utils.linalg import modified_cholesky, modified_cholesky_blocked
+
+@pytest.mark.unit
+def test_modified_cholesky_blocked():
+    numpy.random.seed(7)
+    nmo = 6
+    for cplx in [False, True]:
+        # Low rank so all pivots are well conditioned.
+        A = numpy.random.random((nmo*nmo,10))
+        if cplx:
+            A = A + 1j*numpy.random.random((nmo*nmo,10))
+        M = numpy.dot(A, A.conj().T)
+        ref = modified_cholesky(M, tol=1e-8, verbose=False)
+        for block_size in [1, 4, 64]:
+            chol = modified_cholesky_blocked(M, tol=1e-8, verbose=False,
+                                             block_size=block_size)
+            assert chol.shape == ref.shape
+            assert numpy.max(numpy.abs(chol-ref)) < 1e-6
+        Mapprox = numpy.dot(chol.T, chol.conj())
+        assert numpy.max(numpy.abs(Mapprox-M)) < 1e-8
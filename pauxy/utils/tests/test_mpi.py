@@ -0,0 +1,153 @@
+import io
+import numpy
+import pytest
+from mpi4py import MPI
+from pauxy.estimators.generic import local_energy_generic_cholesky_opt
+from pauxy.estimators.mixed import local_energy
+from pauxy.propagation.generic import GenericContinuous
+from pauxy.systems.generic import Generic
+from pauxy.trial_wavefunction.multi_slater import MultiSlater
+from pauxy.utils.misc import dotdict
+from pauxy.utils.mpi import (
+        bcast_object,
+        CholeskyGroup,
+        _ArrayPickler,
+        _ArrayUnpickler
+        )
+from pauxy.utils.testing import (
+        generate_hamiltonian,
+        get_random_nomsd,
+        get_random_wavefunction
+        )
+from pauxy.walkers.single_det import SingleDetWalker
+
+class Payload(object):
+    def __init__(self):
+        self.psi = numpy.random.random((100,20,6)) + 1j
+        self.coeffs = numpy.arange(10)
+        self.rot_chol = [self.psi[0], numpy.ones((50,50))]
+        self.name = 'MultiSlater'
+
+@pytest.mark.unit
+def test_array_pickler():
+    numpy.random.seed(7)
+    obj = Payload()
+    f = io.BytesIO()
+    pickler = _ArrayPickler(f, min_bytes=1024)
+    pickler.dump(obj)
+    # Small arrays are pickled.
+    assert len(pickler.arrays) == 3
+    arrays = [a.copy() for a in pickler.arrays]
+    new = _ArrayUnpickler(io.BytesIO(f.getvalue()), arrays).load()
+    assert new.name == obj.name
+    assert numpy.array_equal(new.psi, obj.psi)
+    assert numpy.array_equal(new.coeffs, obj.coeffs)
+    assert numpy.array_equal(new.rot_chol[1], obj.rot_chol[1])
+    assert new.psi is arrays[0]
+
+@pytest.mark.unit
+def test_bcast_object():
+    comm = MPI.COMM_WORLD
+    numpy.random.seed(7)
+    obj = Payload()
+    if comm.rank == 0:
+        data = obj
+    else:
+        data = None
+    data = bcast_object(data, comm, min_bytes=1024, max_bytes=1000)
+    assert numpy.array_equal(data.psi, obj.psi)
+    assert numpy.array_equal(data.rot_chol[0], obj.psi[0])
+
+def to_dense(a):
+    if hasattr(a, 'toarray'):
+        return a.toarray()
+    return a
+
+@pytest.mark.unit
+def test_node_shared_memory():
+    comm = MPI.COMM_WORLD
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (4,3)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    (h1e, chol, enuc) = comm.bcast((h1e, chol, enuc), root=0)
+    for sparse in [False, True]:
+        options = {'sparse': sparse}
+        ref = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                      inputs=options)
+        options['shared_memory'] = True
+        system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                         inputs=options, comm=comm)
+        assert system._shm is not None
+        numpy.random.seed(7)
+        wfn = get_random_nomsd(ref, ndet=1, cplx=False)
+        init = get_random_wavefunction(nelec, nmo)
+        (wfn, init) = comm.bcast((wfn, init), root=0)
+        trial = MultiSlater(ref, wfn, init=init)
+        ref.construct_integral_tensors_real(trial)
+        system.construct_integral_tensors_real(trial)
+        assert numpy.allclose(system.chol_vecs, ref.chol_vecs)
+        assert numpy.allclose(to_dense(system.hs_pot), to_dense(ref.hs_pot))
+        assert numpy.allclose(system.h1e_mod, ref.h1e_mod)
+        for s in [0, 1]:
+            assert numpy.allclose(to_dense(system.rot_hs_pot[s]),
+                                  to_dense(ref.rot_hs_pot[s]))
+        walker = SingleDetWalker({}, ref, trial)
+        e_ref = local_energy(ref, walker.G, Ghalf=walker.Gmod)
+        e = local_energy(system, walker.G, Ghalf=walker.Gmod)
+        assert numpy.allclose(e, e_ref)
+        # Shared arrays are read-only on every rank.
+        assert not system.chol_vecs.flags.writeable
+        if sparse:
+            assert not system.hs_pot.data.flags.writeable
+            assert not system.rot_hs_pot[0].data.flags.writeable
+        else:
+            assert not system.hs_pot.flags.writeable
+            assert not system.rot_hs_pot[0].flags.writeable
+
+@pytest.mark.unit
+@pytest.mark.skipif(MPI.COMM_WORLD.size == 1,
+                    reason="Test should be run on multiple cores.")
+def test_cholesky_group():
+    comm = MPI.COMM_WORLD
+    numpy.random.seed(7)
+    nfields = 17
+    group = CholeskyGroup(comm, comm.size, nfields)
+    full = comm.bcast(numpy.random.random((3,nfields)), root=0)
+    local = full[:,group.slice]
+    assert numpy.allclose(group.gather(local), full)
+    assert numpy.allclose(group.reduce(local.sum(-1)), full.sum(-1))
+    assert group.reduce(local[0].sum()) == pytest.approx(full[0].sum())
+    # Distributed integrals reproduce the undistributed energy, force bias
+    # and HS potential.
+    nmo = 10
+    nelec = (4,3)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    (h1e, chol, enuc) = comm.bcast((h1e, chol, enuc), root=0)
+    ref = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc)
+    system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                     inputs={'cholesky_group_size': comm.size}, comm=comm)
+    assert system.chol_group is not None
+    assert system.nchol == ref.nchol
+    wfn = get_random_nomsd(ref, ndet=1, cplx=False)
+    init = get_random_wavefunction(nelec, nmo)
+    (wfn, init) = comm.bcast((wfn, init), root=0)
+    trial = MultiSlater(ref, wfn, init=init)
+    ref.construct_integral_tensors_real(trial)
+    system.construct_integral_tensors_real(trial)
+    assert numpy.allclose(system.h1e_mod, ref.h1e_mod)
+    walker = SingleDetWalker({}, ref, trial)
+    e_ref = local_energy_generic_cholesky_opt(ref, walker.G, Ghalf=walker.Gmod)
+    e = local_energy_generic_cholesky_opt(system, walker.G,
+                                          Ghalf=walker.Gmod)
+    assert numpy.allclose(e, e_ref)
+    qmc = dotdict({'dt': 0.005, 'nstblz': 5})
+    prop_ref = GenericContinuous(ref, trial, qmc)
+    prop = GenericContinuous(system, trial, qmc)
+    assert numpy.allclose(prop.mf_shift, prop_ref.mf_shift)
+    xbar_ref = prop_ref.construct_force_bias(ref, walker, trial)
+    xbar = prop.construct_force_bias(system, walker, trial)
+    assert numpy.allclose(xbar, xbar_ref)
+    xshifted = comm.bcast(numpy.random.random(ref.nfields), root=0)
+    assert numpy.allclose(prop.construct_VHS(system, xshifted),
+                          prop_ref.construct_VHS(ref, xshifted))
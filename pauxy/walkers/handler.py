@@ -2,19 +2,25 @@ import copy
 import cmath
 import h5py
 import math
+import os
 import numpy
 import scipy.linalg
 import sys
 import time
 from pauxy.walkers.multi_ghf import MultiGHFWalker
 from pauxy.walkers.single_det import SingleDetWalker
+from pauxy.walkers.single_det_batch import SingleDetWalkerBatch
 from pauxy.walkers.multi_det import MultiDetWalker
 from pauxy.walkers.thermal import ThermalWalker
 from pauxy.walkers.stack import FieldConfig
 from pauxy.qmc.comm import FakeComm
+from pauxy.qmc.utils import get_rng_state, set_rng_state
 from pauxy.utils.io import get_input_value
 from pauxy.utils.misc import update_stack
 
+# Bump when the layout of checkpoint files changes.
+CHECKPOINT_VERSION = 2
+
 
 class Walkers(object):
     """Container for groups of walkers which make up a wavefunction.
@@ -46,6 +52,17 @@ class Walkers(object):
             rank = comm.rank
         if verbose:
             print("# Setting up wavefunction object.")
+        self.pcont_method = get_input_value(walker_opts, 'population_control',
+                                            default='comb')
+        batched = get_input_value(walker_opts, 'batched', default=False,
+                                  alias=['batch'], verbose=verbose)
+        self.batched = (batched and system.name == 'Generic' and
+                        nprop_tot is None and self.pcont_method == 'comb')
+        if batched and not self.batched and verbose:
+            print("# Batched walkers are only implemented for the Generic "
+                  "system with comb population control and without back "
+                  "propagation.")
+            print("# Using list of walkers instead.")
         if trial.name == 'MultiSlater':
             self.walker_type = 'MSD'
             # TODO: FDM FIXTHIS
@@ -53,23 +70,30 @@ class Walkers(object):
                 if verbose:
                     print("# Usinge single det walker with msd wavefunction.")
                 self.walker_type = 'SD'
-                self.walkers = [SingleDetWalker(walker_opts, system, trial,
-                                                index=w, nprop_tot=nprop_tot,
-                                                nbp=nbp)
-                                for w in range(qmc.nwalkers)]
+                if self.batched:
+                    self.setup_batch(walker_opts, system, trial, qmc, verbose)
+                else:
+                    self.walkers = [SingleDetWalker(walker_opts, system, trial,
+                                                    index=w,
+                                                    nprop_tot=nprop_tot,
+                                                    nbp=nbp)
+                                    for w in range(qmc.nwalkers)]
             else:
+                self.batched = False
                 self.walkers = [
                         MultiDetWalker(walker_opts, system, trial,
                                        verbose=(verbose and w == 0))
                         for w in range(qmc.nwalkers)
                         ]
-            self.buff_size = self.walkers[0].buff_size
+            if not self.batched:
+                self.buff_size = self.walkers[0].buff_size
             if nbp is not None:
                 self.buff_size += self.walkers[0].field_configs.buff_size
             self.walker_buffer = numpy.zeros(self.buff_size,
                                              dtype=numpy.complex128)
         elif trial.name == 'thermal':
             self.walker_type = 'thermal'
+            self.batched = False
             self.walkers = [ThermalWalker(walker_opts, system, trial, verbose and w==0)
                             for w in range(qmc.nwalkers)]
             self.buff_size = self.walkers[0].buff_size + self.walkers[0].stack.buff_size
@@ -90,6 +114,9 @@ class Walkers(object):
                     else:
                         qmc.nstblz = update_stack(qmc.nstblz, stack_size,
                                                   name="nstblz", verbose=verbose)
+        elif self.batched:
+            self.walker_type = 'SD'
+            self.setup_batch(walker_opts, system, trial, qmc, verbose)
         else:
             self.walker_type = 'SD'
             self.walkers = [SingleDetWalker(walker_opts, system, trial,
@@ -108,8 +135,6 @@ class Walkers(object):
             dtype = complex
         else:
             dtype = int
-        self.pcont_method = get_input_value(walker_opts, 'population_control',
-                                            default='comb')
         self.min_weight = walker_opts.get('min_weight', 0.1)
         self.max_weight = walker_opts.get('max_weight', 4.0)
         if verbose:
@@ -121,25 +146,40 @@ class Walkers(object):
                 # TODO: FDM FIX THIS
                 print(" # Warning: Walker buffer size > 2GB. May run into MPI"
                       "issues.")
-        if not self.walker_type == "thermal":
-            walker_size = 3 + self.walkers[0].phi.size
-        if self.write_freq > 0:
-            self.write_restart = True
-            self.dsets = []
-            with h5py.File(self.write_file,'w',driver='mpio',comm=comm) as fh5:
-                for i in range(self.ntot_walkers):
-                    fh5.create_dataset('walker_%d'%i, (walker_size,),
-                                       dtype=numpy.complex128)
-
-        else:
-            self.write_restart = False
-        if self.read_file is not None:
-            if verbose:
-                print("# Reading walkers from %s file series."%self.read_file)
-            self.read_walkers(comm)
+        self.write_restart = self.write_freq > 0
         self.target_weight = qmc.ntot_walkers
         self.nw = qmc.nwalkers
         self.set_total_weight(qmc.ntot_walkers)
+        self.restart_state = None
+        if self.read_file is not None:
+            if verbose:
+                print("# Reading walkers from %s."%self.read_file)
+            if comm is None:
+                comm = FakeComm()
+            self.restart_state = self.read_walkers(comm, verbose=verbose)
+
+    def setup_batch(self, walker_opts, system, trial, qmc, verbose=False):
+        """Store single determinant walkers as a single batch.
+
+        Parameters
+        ----------
+        walker_opts : dict
+            Input options for walkers.
+        system : object
+            System object.
+        trial : object
+            Trial wavefunction object.
+        qmc : :class:`pauxy.qmc.options.QMCOpts`
+            QMC options.
+        """
+        if verbose:
+            print("# Storing walkers as a single batch.")
+        self.batch = SingleDetWalkerBatch(walker_opts, system, trial,
+                                          qmc.nwalkers)
+        self.walkers = []
+        self.buff_size = self.batch.buff_size
+        self.walker_buffer = numpy.zeros(self.buff_size,
+                                         dtype=numpy.complex128)
 
     def orthogonalise(self, trial, free_projection):
         """Orthogonalise all walkers.
@@ -151,6 +191,13 @@ class Walkers(object):
         free_projection : bool
             True if doing free projection.
         """
+        if self.batched:
+            detR = self.batch.reortho(trial)
+            if free_projection:
+                magn = numpy.absolute(detR)
+                self.batch.weight *= magn
+                self.batch.phase *= detR / magn
+            return
         for w in self.walkers:
             detR = w.reortho(trial)
             if free_projection:
@@ -201,7 +248,10 @@ class Walkers(object):
             numpy.copyto(self.walkers[i].phi_right, self.walkers[i].phi)
 
     def pop_control(self, comm):
-        weights = numpy.array([abs(w.weight) for w in self.walkers])
+        if self.batched:
+            weights = numpy.absolute(self.batch.weight)
+        else:
+            weights = numpy.array([abs(w.weight) for w in self.walkers])
         if comm.rank == 0:
             global_weights = numpy.empty(len(weights)*comm.size)
         else:
@@ -218,6 +268,9 @@ class Walkers(object):
             sys.exit()
         self.set_total_weight(total_weight)
         # Todo: Just standardise information we want to send between routines.
+        if self.batched:
+            self.batch.unscaled_weight = self.batch.weight.copy()
+            self.batch.weight = self.batch.weight / scale
         for w in self.walkers:
             w.unscaled_weight = w.weight
             w.weight = w.weight / scale
@@ -243,68 +296,78 @@ class Walkers(object):
         # walker objects in memory. We don't want future changes in a given
         # element of psi having unintended consequences.
         # todo : add phase to walker for free projection
-        if comm.rank == 0:
-            parent_ix = numpy.zeros(len(weights), dtype='i')
-        else:
-            parent_ix = numpy.empty(len(weights), dtype='i')
+        parent_ix = numpy.zeros(len(weights), dtype='i')
         if comm.rank == 0:
             total_weight = sum(weights)
             cprobs = numpy.cumsum(weights)
             r = numpy.random.random()
-            comb = [(i+r) * (total_weight/self.target_weight) for i in
-                    range(self.target_weight)]
-            iw = 0
-            ic = 0
-            while ic < len(comb):
-                if comb[ic] < cprobs[iw]:
-                    parent_ix[iw] += 1
-                    ic += 1
-                else:
-                    iw += 1
-            data = {'ix': parent_ix}
-        else:
-            data = None
-
-        data = comm.bcast(data, root=0)
-        parent_ix = data['ix']
-        # Keep total weight saved for capping purposes.
-        # where returns a tuple (array,), selecting first element.
+            comb = ((numpy.arange(self.target_weight)+r) *
+                    (total_weight/self.target_weight))
+            # Tooth ic of comb selects first walker with cprobs[iw] > comb[ic].
+            parents = numpy.searchsorted(cprobs, comb, side='right')
+            parents = numpy.minimum(parents, len(weights)-1)
+            parent_ix[:] = numpy.bincount(parents, minlength=len(weights))
+        comm.Bcast(parent_ix, root=0)
+        # Walkers with parent_ix > 1 are copied parent_ix - 1 times into the
+        # slots of walkers with parent_ix == 0.
         kill = numpy.where(parent_ix == 0)[0]
         clone = numpy.where(parent_ix > 1)[0]
-        reqs = []
-        walker_buffers = []
-        # First initiate non-blocking sends of walkers.
-        for i, (c, k) in enumerate(zip(clone, kill)):
-            # Sending from current processor?
-            if c // self.nw == comm.rank:
-                # Location of walker to clone in local list.
-                clone_pos = c % self.nw
-                # copying walker data to intermediate buffer to avoid issues
-                # with accessing walker data during send. Might not be
-                # necessary.
-                dest_proc = k // self.nw
-                buff = self.walkers[clone_pos].get_buffer()
-                reqs.append(comm.Isend(buff, dest=dest_proc, tag=i))
-        # Now receive walkers on processors where walkers are to be killed.
-        for i, (c, k) in enumerate(zip(clone, kill)):
-            # Receiving to current processor?
-            if k // self.nw == comm.rank:
-                # Processor we are receiving from.
-                source_proc = c // self.nw
-                # Location of walker to kill in local list of walkers.
-                kill_pos = k % self.nw
-                comm.Recv(self.walker_buffer, source=source_proc, tag=i)
-                self.walkers[kill_pos].set_buffer(self.walker_buffer)
-        # Complete non-blocking send.
-        for rs in reqs:
-            rs.wait()
-        # Necessary?
-        comm.Barrier()
+        clone = numpy.repeat(clone, parent_ix[clone]-1)
+        nmove = min(len(clone), len(kill))
+        self.redistribute(comm, clone[:nmove], kill[:nmove])
         # Reset walker weight.
         # TODO: check this.
+        if self.batched:
+            self.batch.weight[:] = 1.0
         for w in self.walkers:
             w.weight = 1.0
 
+    def redistribute(self, comm, source, dest):
+        """Copy walkers between processors using a single Alltoallv.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+        source : :class:`numpy.ndarray`
+            Global indices of walkers to copy.
+        dest : :class:`numpy.ndarray`
+            Global indices of walkers to overwrite.
+        """
+        nprocs = comm.size
+        source_proc = source // self.nw
+        dest_proc = dest // self.nw
+        # Walkers sent from this processor ordered by destination and
+        # received by this processor ordered by source. The stable sort
+        # preserves the pairing order between each pair of processors.
+        send = numpy.where(source_proc == comm.rank)[0]
+        send = send[numpy.argsort(dest_proc[send], kind='mergesort')]
+        recv = numpy.where(dest_proc == comm.rank)[0]
+        recv = recv[numpy.argsort(source_proc[recv], kind='mergesort')]
+        send_buff = numpy.zeros((len(send), self.buff_size),
+                                dtype=numpy.complex128)
+        recv_buff = numpy.zeros((len(recv), self.buff_size),
+                                dtype=numpy.complex128)
+        for i, ix in enumerate(send):
+            pos = source[ix] % self.nw
+            if self.batched:
+                send_buff[i] = self.batch.get_buffer(pos)
+            else:
+                send_buff[i] = self.walkers[pos].get_buffer()
+        send_counts = self.buff_size * numpy.bincount(dest_proc[send],
+                                                      minlength=nprocs)
+        recv_counts = self.buff_size * numpy.bincount(source_proc[recv],
+                                                      minlength=nprocs)
+        send_displ = numpy.insert(numpy.cumsum(send_counts)[:-1], 0, 0)
+        recv_displ = numpy.insert(numpy.cumsum(recv_counts)[:-1], 0, 0)
+        comm.Alltoallv([send_buff, (send_counts, send_displ)],
+                       [recv_buff, (recv_counts, recv_displ)])
+        for i, ix in enumerate(recv):
+            pos = dest[ix] % self.nw
+            if self.batched:
+                self.batch.set_buffer(pos, recv_buff[i])
+            else:
+                self.walkers[pos].set_buffer(recv_buff[i])
+
     def pair_branch(self, comm):
         walker_info = [[abs(w.weight),1,comm.rank,comm.rank] for w in self.walkers]
         glob_inf = comm.gather(walker_info, root=0)
@@ -381,10 +444,16 @@ class Walkers(object):
 
 
     def recompute_greens_function(self, trial, time_slice=None):
+        if self.batched:
+            self.batch.greens_function(trial)
+            return
         for w in self.walkers:
             w.greens_function(trial, time_slice)
 
     def set_total_weight(self, total_weight):
+        if self.batched:
+            self.batch.total_weight = total_weight
+            self.batch.old_total_weight = total_weight
         for w in self.walkers:
             w.total_weight = total_weight
             w.old_total_weight = w.total_weight
@@ -397,36 +466,269 @@ class Walkers(object):
             w.weight = 1.0
             w.phase = 1.0 + 0.0j
 
-    def get_write_buffer(self, i):
-        w = self.walkers[i]
-        buff = numpy.concatenate([[w.weight], [w.phase], [w.ot], w.phi.ravel()])
-        return buff
+    def get_total_weight(self):
+        if self.batched:
+            return self.batch.total_weight
+        return self.walkers[0].total_weight
+
+    def get_weights(self):
+        """Absolute weights of walkers on this processor."""
+        if self.batched:
+            return numpy.absolute(self.batch.weight)
+        return numpy.array([abs(w.weight) for w in self.walkers])
+
+    def set_weights(self, weight):
+        if self.batched:
+            self.batch.weight[:] = weight
+        for w in self.walkers:
+            w.weight = weight
 
-    def set_walker_from_buffer(self, i, buff):
-        w = self.walkers[i]
-        w.weight = buff[0]
-        w.phase = buff[1]
-        w.ot = buff[2]
-        w.phi = buff[3:].reshape(self.walkers[i].phi.shape)
+    def get_field_configs(self):
+        """FieldConfig of first walker or None without back propagation."""
+        if self.batched:
+            return None
+        return getattr(self.walkers[0], 'field_configs', None)
 
-    def write_walkers(self, comm):
+    def get_walker_buffers(self):
+        """Pack walkers on this processor into a single array.
+
+        Returns
+        -------
+        buffs : :class:`numpy.ndarray`
+            Array of shape (nwalkers, buff_size) of walker buffers.
+        """
+        buffs = numpy.zeros((self.nw, self.buff_size), dtype=numpy.complex128)
+        for i in range(self.nw):
+            if self.batched:
+                buffs[i] = self.batch.get_buffer(i)
+            else:
+                buffs[i] = self.walkers[i].get_buffer()
+        return buffs
+
+    def set_walker_buffers(self, buffs):
+        """Set walkers on this processor from array of walker buffers.
+
+        Parameters
+        ----------
+        buffs : :class:`numpy.ndarray`
+            Array of shape (nwalkers, buff_size) of walker buffers.
+        """
+        for (i, buff) in enumerate(buffs):
+            if self.batched:
+                self.batch.set_buffer(i, buff)
+            else:
+                self.walkers[i].set_buffer(buff)
+
+    def write_walkers(self, comm, attrs=None, state=None):
+        """Write checkpoint of walkers, random number generators and state.
+
+        Walkers are stored as the rows of a single (ntot_walkers, buff_size)
+        dataset. With parallel HDF5 each processor writes its rows with a
+        collective hyperslab write, otherwise the rows are gathered to and
+        written by the root processor. The checkpoint is written to a
+        temporary file which replaces write_file once complete, so a failed
+        write never corrupts the previous checkpoint.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+        attrs : dict
+            Scalar simulation state, e.g. the current step, which must be
+            identical on all processors. Optional.
+        state : dict
+            Arrays local to each processor, e.g. estimator accumulators.
+            Names may contain '/' to create groups. Optional.
+        """
         start = time.time()
-        with h5py.File(self.write_file,'r+',driver='mpio',comm=comm) as fh5:
-            for (i,w) in enumerate(self.walkers):
-                ix = i + self.nwalkers*comm.rank
-                buff = self.get_write_buffer(i)
-                fh5['walker_%d'%ix][:] = self.get_write_buffer(i)
+        # Each record is stored in rows [n*rank, n*(rank+1)) of a dataset.
+        records = {'walkers': self.get_walker_buffers(),
+                   'weights': self.get_weights()}
+        for (k, v) in get_rng_state().items():
+            records['rng/'+k] = v.reshape((1,)+v.shape)
+        if state is not None:
+            for (k, v) in state.items():
+                v = numpy.asarray(v)
+                records['state/'+k] = v.reshape((1,)+v.shape)
+        header = {'version': CHECKPOINT_VERSION, 'nprocs': comm.size,
+                  'ntot_walkers': self.nw*comm.size,
+                  'total_weight': self.get_total_weight()}
+        fc = self.get_field_configs()
+        if fc is not None:
+            # Step counters are shared by all walkers so are not buffered.
+            header.update({'fc_step': fc.step, 'fc_block': fc.block,
+                           'fc_ib': fc.ib})
+        if attrs is not None:
+            header.update(attrs)
+        tmp = self.write_file + '.tmp'
+        if parallel_io(comm):
+            with h5py.File(tmp, 'w', driver='mpio', comm=comm) as fh5:
+                for (name, local) in records.items():
+                    n = local.shape[0]
+                    dset = fh5.create_dataset(name,
+                                              (n*comm.size,)+local.shape[1:],
+                                              dtype=local.dtype)
+                    with dset.collective:
+                        dset[n*comm.rank:n*(comm.rank+1)] = local
+                for (k, v) in header.items():
+                    fh5.attrs[k] = v
+        else:
+            data = {}
+            for (name, local) in records.items():
+                local = numpy.ascontiguousarray(local)
+                if comm.rank == 0:
+                    data[name] = numpy.zeros((comm.size,)+local.shape,
+                                             dtype=local.dtype)
+                else:
+                    data[name] = None
+                comm.Gather(local, data[name], root=0)
+            if comm.rank == 0:
+                with h5py.File(tmp, 'w') as fh5:
+                    for (name, glob) in data.items():
+                        fh5[name] = glob.reshape((-1,)+glob.shape[2:])
+                    for (k, v) in header.items():
+                        fh5.attrs[k] = v
+        comm.Barrier()
         if comm.rank == 0:
+            os.replace(tmp, self.write_file)
             print(" # Writing walkers to file.")
             print(" # Time to write restart: {:13.8e} s"
                   .format(time.time()-start))
 
-    def read_walkers(self, comm):
+    def read_walkers(self, comm, verbose=False):
+        """Read checkpoint written by :meth:`write_walkers`.
+
+        If the checkpoint was written with the same number of processors and
+        walkers the random number generator streams are restored and the
+        simulation resumes exactly. Otherwise walkers are redistributed with
+        :func:`rebalance_walkers`, the generators keep their fresh seeds and
+        per-processor arrays are summed onto the root processor.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+        verbose : bool
+            Print information about restart. Optional. Default False.
+
+        Returns
+        -------
+        restart : dict or None
+            Scalar simulation state ('attrs') and this processor's arrays
+            ('state') stored with the checkpoint. None if the file could not be
+            read.
+        """
         with h5py.File(self.read_file, 'r') as fh5:
-            for (i,w) in enumerate(self.walkers):
-                try:
-                    ix = i + self.nwalkers*comm.rank
-                    self.set_walker_from_buffer(i, fh5['walker_%d'%ix][:])
-                except KeyError:
+            if 'walkers' not in fh5:
+                if comm.rank == 0:
                     print(" # Could not read walker data from:"
                           " %s"%(self.read_file))
+                return None
+            (nfile, buff_size) = fh5['walkers'].shape
+            if buff_size != self.buff_size:
+                if comm.rank == 0:
+                    print(" # Walker buffer size in %s does not match the "
+                          "current simulation."%(self.read_file))
+                return None
+            attrs = dict(fh5.attrs)
+            nprocs = int(attrs['nprocs'])
+            exact = (nprocs == comm.size and nfile == self.nw*comm.size)
+            resampled = False
+            if exact:
+                buffs = fh5['walkers'][self.nw*comm.rank:self.nw*(comm.rank+1)]
+                set_rng_state({k: v[comm.rank] for (k, v) in fh5['rng'].items()})
+            else:
+                if verbose:
+                    print("# Checkpoint written with {} processors and {} "
+                          "walkers.".format(nprocs, nfile))
+                    print("# Redistributing walkers and reseeding random "
+                          "number generators.")
+                if 'weights' in fh5:
+                    weights = fh5['weights'][:]
+                else:
+                    weights = numpy.ones(nfile)
+                if comm.rank == 0:
+                    r = numpy.random.random()
+                else:
+                    r = None
+                r = comm.bcast(r, root=0)
+                (assignment, resampled) = rebalance_walkers(weights, comm.size,
+                                                            self.nw, r=r)
+                # HDF5 point selections must be increasing.
+                (uniq, inv) = numpy.unique(assignment[comm.rank],
+                                           return_inverse=True)
+                buffs = fh5['walkers'][list(uniq)][inv]
+            state = {}
+            def read_state(name, obj):
+                if not isinstance(obj, h5py.Dataset):
+                    return
+                if nprocs == comm.size:
+                    state[name] = obj[comm.rank]
+                elif comm.rank == 0:
+                    state[name] = obj[:].sum(axis=0)
+                else:
+                    state[name] = numpy.zeros_like(obj[0])
+            if 'state' in fh5:
+                fh5['state'].visititems(read_state)
+        self.set_walker_buffers(buffs)
+        if resampled:
+            self.set_weights(1.0)
+        else:
+            self.set_total_weight(attrs['total_weight'])
+        if 'fc_step' in attrs:
+            for w in self.walkers:
+                w.field_configs.step = int(attrs['fc_step'])
+                w.field_configs.block = int(attrs['fc_block'])
+                w.field_configs.ib = int(attrs['fc_ib'])
+        return {'attrs': attrs, 'state': state}
+
+
+def parallel_io(comm):
+    """Check if comm can be used for parallel HDF5 output."""
+    return (h5py.get_config().mpi and not isinstance(comm, FakeComm) and
+            comm.size > 1)
+
+
+def rebalance_walkers(weights, nprocs, nwalkers, r=0.5):
+    """Assign checkpointed walkers to processors.
+
+    If the number of walkers changes they are first resampled using the comb
+    method. Walkers are then dealt to processors in order of decreasing weight
+    in a serpentine pattern, so each processor holds nwalkers walkers with
+    approximately the same total weight.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        Absolute weights of checkpointed walkers.
+    nprocs : int
+        Number of processors.
+    nwalkers : int
+        Number of walkers per processor.
+    r : float
+        Offset of comb in [0,1). Must be the same on all processors. Optional.
+        Default 0.5.
+
+    Returns
+    -------
+    assignment : :class:`numpy.ndarray`
+        Array of shape (nprocs, nwalkers) of indices into weights.
+    resampled : bool
+        True if walkers were resampled, in which case their weights should be
+        reset to one.
+    """
+    ntot = nprocs * nwalkers
+    nfile = len(weights)
+    weights = numpy.asarray(weights, dtype=float)
+    resampled = nfile != ntot
+    if resampled:
+        if weights.sum() <= 0:
+            weights = numpy.ones(nfile)
+        cprobs = numpy.cumsum(weights)
+        comb = (numpy.arange(ntot)+r) * (cprobs[-1]/ntot)
+        parents = numpy.searchsorted(cprobs, comb, side='right')
+        parents = numpy.minimum(parents, nfile-1)
+    else:
+        parents = numpy.arange(nfile)
+    order = parents[numpy.argsort(-weights[parents], kind='mergesort')]
+    order = order.reshape(nwalkers, nprocs)
+    order[1::2] = order[1::2,::-1]
+    return (order.T.copy(), resampled)
@@ -2,6 +2,8 @@ import copy
 import numpy
 import scipy.linalg
 from pauxy.estimators.mixed import local_energy_multi_det
+from pauxy.utils.io import get_input_value
+from pauxy.utils.linalg import adjugate
 from pauxy.utils.misc import get_numeric_names
 
 class MultiDetWalker(object):
@@ -21,6 +23,11 @@ class MultiDetWalker(object):
         Initialise weights to zeros or ones.
     wfn0 : string
         Initial wavefunction.
+
+    For particle-hole trial wavefunctions the 'wick' walker option evaluates
+    overlaps and the Green's function relative to the first (reference)
+    determinant using the generalised Wick theorem. Per-determinant Green's
+    functions are then never stored.
     """
 
     def __init__(self, walker_opts, system, trial, index=0,
@@ -36,6 +43,22 @@ class MultiDetWalker(object):
         self.phi = copy.deepcopy(trial.init)
         self.ndets = trial.psi.shape[0]
         dtype = numpy.complex128
+        wick = get_input_value(walker_opts, 'wick', default=False,
+                               alias=['generalised_wick'], verbose=verbose)
+        self.wick = wick and getattr(trial, 'ortho_expansion', False)
+        if wick and not self.wick and verbose:
+            print("# Generalised Wick theorem requires a particle-hole trial "
+                  "wavefunction.")
+        if self.wick and system.name != "Generic":
+            raise ValueError("Generalised Wick walkers are only implemented "
+                             "for Generic systems.")
+        if self.wick:
+            self._trial = trial
+            # theta = phi (D_0^dagger phi)^{-1} for each spin.
+            self.theta = numpy.zeros(self.phi.shape, dtype=dtype)
+            # Overlap with reference and ratios for each spin.
+            self.ovlp0 = 0j
+            self.ratios = numpy.ones((2, self.ndets), dtype=dtype)
         # This stores an array of overlap matrices with the various elements of
         # the trial wavefunction.
         self.inv_ovlp = [numpy.zeros(shape=(self.ndets, system.nup, system.nup),
@@ -58,8 +81,11 @@ class MultiDetWalker(object):
             print("# Initial overlap of walker with trial wavefunction: {:13.8e}"
                   .format(self.ot.real))
         # Green's functions for various elements of the trial wavefunction.
-        self.Gi = numpy.zeros(shape=(self.ndets, 2, system.nbasis,
-                                     system.nbasis), dtype=dtype)
+        if self.wick:
+            self.Gi = None
+        else:
+            self.Gi = numpy.zeros(shape=(self.ndets, 2, system.nbasis,
+                                         system.nbasis), dtype=dtype)
         # Actual green's function contracted over determinant index in Gi above.
         # i.e., <psi_T|c_i^d c_j|phi>
         self.G = numpy.zeros(shape=(2, system.nbasis, system.nbasis),
@@ -84,6 +110,9 @@ class MultiDetWalker(object):
             self.field_configs = None
 
     def overlap_direct(self, trial):
+        if self.wick:
+            self.inverse_overlap(trial)
+            return self.calc_otrial(trial)
         nup = self.nup
         for (i, det) in enumerate(trial.psi):
             Oup = numpy.dot(det[:,:nup].conj().T, self.phi[:,:nup])
@@ -103,6 +132,9 @@ class MultiDetWalker(object):
         trial : :class:`numpy.ndarray`
             Trial wavefunction.
         """
+        if self.wick:
+            self.inverse_overlap_wick(trial)
+            return
         nup = self.nup
         for (indx, t) in enumerate(trial.psi):
             Oup = numpy.dot(t[:,:nup].conj().T, self.phi[:,:nup])
@@ -123,6 +155,8 @@ class MultiDetWalker(object):
         ovlp : float / complex
             Overlap.
         """
+        if self.wick:
+            return sum(self.weights)
         for ix in range(self.ndets):
             det_O_up = 1.0 / scipy.linalg.det(self.inv_ovlp[0][ix])
             det_O_dn = 1.0 / scipy.linalg.det(self.inv_ovlp[1][ix])
@@ -168,6 +202,9 @@ class MultiDetWalker(object):
         trial : object
             Trial wavefunction object.
         """
+        if self.wick:
+            self.greens_function_wick(trial)
+            return
         nup = self.nup
         for (ix, t) in enumerate(trial.psi):
             # construct "local" green's functions for each component of psi_T
@@ -178,6 +215,186 @@ class MultiDetWalker(object):
                     (self.phi[:,nup:].dot(self.inv_ovlp[1][ix]).dot(t[:,nup:].conj().T)).T
             )
 
+    def spin_slices(self):
+        return [slice(0, self.nup), slice(self.nup, self.phi.shape[1])]
+
+    def inverse_overlap_wick(self, trial):
+        """Compute overlaps using the generalised Wick theorem.
+
+        The overlap ratio of a k-fold excitation of the reference with the
+        walker is the determinant of a k x k block of theta, so the cost is
+        O(N^2 Ne + ndets k^3) rather than O(ndets N^2 Ne).
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object.
+        """
+        self.ovlp0 = 1.0 + 0j
+        for (s, ix) in enumerate(self.spin_slices()):
+            exc = trial.excitations[s]
+            self.ratios[s] = exc['signs']
+            if ix.stop == ix.start:
+                continue
+            O0 = self.phi[exc['reference'], ix]
+            self.inv_ovlp[s] = scipy.linalg.inv(O0)
+            self.ovlp0 *= scipy.linalg.det(O0)
+            theta = numpy.dot(self.phi[:,ix], self.inv_ovlp[s])
+            self.theta[:,ix] = theta
+            for (dets, particles, holes) in exc['blocks']:
+                if particles.shape[1] == 0:
+                    continue
+                A = theta[particles[:,:,None], holes[:,None,:]]
+                self.ratios[s,dets] *= numpy.linalg.det(A)
+        self.ovlps[:] = self.ovlp0 * self.ratios[0] * self.ratios[1]
+        self.weights[:] = trial.coeffs.conj() * self.ovlps
+
+    def greens_function_wick(self, trial):
+        r"""Compute Green's function contracted over determinants.
+
+        For a determinant with particles p and hole positions h
+
+        .. math::
+            G_k^T = G_0^T + \theta_{:,h} A_k^{-1} (I - G_0^T)_{p,:}
+
+        with A_k = theta_{p,h}. The weighted sum over determinants only
+        requires a single (Ne x N) matrix of weighted inverses, which are
+        evaluated as r_k A_k^{-1} = sign adj(A_k) to allow for singular A_k.
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object.
+        """
+        M = self.phi.shape[0]
+        denom = sum(self.weights)
+        for (s, ix) in enumerate(self.spin_slices()):
+            self.G[s] = 0.0
+            if ix.stop == ix.start:
+                continue
+            exc = trial.excitations[s]
+            theta = self.theta[:,ix]
+            G0T = numpy.zeros((M, M), dtype=numpy.complex128)
+            G0T[:,exc['reference']] = theta
+            # Weight of each determinant with this spin's ratio removed.
+            fac = (trial.coeffs.conj() * self.ovlp0 * self.ratios[1-s] *
+                   exc['signs'] / denom)
+            T = numpy.zeros((theta.shape[1], M), dtype=numpy.complex128)
+            for (dets, particles, holes) in exc['blocks']:
+                if particles.shape[1] == 0:
+                    continue
+                A = theta[particles[:,:,None], holes[:,None,:]]
+                numpy.add.at(T, (holes[:,:,None], particles[:,None,:]),
+                             fac[dets,None,None]*adjugate(A))
+            GT = G0T + numpy.dot(theta, numpy.dot(T, numpy.eye(M)-G0T))
+            self.G[s] = GT.T
+
+    def local_energy_wick(self, system):
+        r"""Local energy using the generalised Wick theorem.
+
+        Writing :math:`G_k^T = G_0^T + U_k V_k` with :math:`U_k =
+        \theta_{:,h}` and :math:`V_k = A_k^{-1} (I-G_0^T)_{p,:}`, the one-body,
+        Coulomb and exchange energies of each determinant are the reference
+        contributions plus traces of k x k blocks of intermediates such as
+        :math:`\Lambda_n = (I-G_0^T) L_n \theta`. These are built once for all
+        determinants, so the cost per determinant is O(k^3 nchol).
+        """
+        (e1a, Xa, xa, ta, ia) = self._wick_energy_terms(system, 0)
+        (e1b, Xb, xb, tb, ib) = self._wick_energy_terms(system, 1)
+        w = self.weights
+        denom = sum(w)
+        Y = Xa + Xb
+        # sum_n (Y_n + ta_n + tb_n)^2 for each determinant.
+        coul = numpy.dot(Y, Y) * denom
+        for (t, i) in ((ta, ia), (tb, ib)):
+            coul += numpy.dot(w, (2*numpy.dot(t, Y) +
+                                  numpy.einsum('kn,kn->k', t, t))[i])
+        chunk = max(1, 2**24//max(1, len(Y)))
+        for k0 in range(0, self.ndets, chunk):
+            k = slice(k0, k0+chunk)
+            coul += 2*numpy.dot(w[k], numpy.einsum('kn,kn->k', ta[ia[k]],
+                                                   tb[ib[k]]))
+        e1 = numpy.dot(w, e1a+e1b) / denom + system.ecore
+        e2 = 0.5 * (coul - numpy.dot(w, xa+xb)) / denom
+        if system.chol_group is not None:
+            e2 = system.chol_group.reduce(e2)
+        return (e1+e2, e1, e2)
+
+    def _wick_energy_terms(self, system, s):
+        """Energy contributions of one spin for all determinants.
+
+        Returns
+        -------
+        e1 : :class:`numpy.ndarray`
+            One-body energy of each determinant.
+        X0 : :class:`numpy.ndarray`
+            Coulomb vector of the reference.
+        exx : :class:`numpy.ndarray`
+            Exchange energy of each determinant.
+        t : :class:`numpy.ndarray`
+            Coulomb corrections for distinct excitations (first row zero).
+        index : :class:`numpy.ndarray`
+            Row of t for each determinant.
+        """
+        M = self.phi.shape[0]
+        L = system.chol_vecs.reshape((-1,M,M))
+        nchol = L.shape[0]
+        e1 = numpy.zeros(self.ndets, dtype=numpy.complex128)
+        exx = numpy.zeros(self.ndets, dtype=numpy.complex128)
+        index = numpy.zeros(self.ndets, dtype=numpy.int64)
+        tvec = [numpy.zeros((1,nchol), dtype=numpy.complex128)]
+        ix = self.spin_slices()[s]
+        if ix.stop == ix.start:
+            return e1, numpy.zeros(nchol), exx, tvec[0], index
+        exc = self._trial.excitations[s]
+        ref = exc['reference']
+        theta = self.theta[:,ix]
+        # Q_n = L_n[ref,:] theta and Lambda_n = (I-G_0^T) L_n theta.
+        Ltheta = numpy.tensordot(L, theta, axes=((2),(0)))
+        Q = Ltheta[:,ref,:]
+        Lam = Ltheta - numpy.einsum('ma,nab->nmb', theta, Q, optimize=True)
+        X0 = numpy.einsum('naa->n', Q)
+        Omega = numpy.einsum('nma,nab->mb', Lam, Q, optimize=True)
+        H1theta = numpy.dot(system.H1[s], theta)
+        Q1 = H1theta[ref,:]
+        Lam1 = H1theta - numpy.dot(theta, Q1)
+        e1[:] = numpy.trace(Q1)
+        exx[:] = numpy.einsum('nab,nba->', Q, Q)
+        LamT = Lam.transpose((1,2,0))
+        nrow = 1
+        for (dets, particles, holes) in exc['blocks']:
+            r = particles.shape[1]
+            if r == 0:
+                continue
+            # Determinants sharing this spin's excitation share corrections.
+            uniq, inv = numpy.unique(numpy.hstack([particles, holes]), axis=0,
+                                     return_inverse=True)
+            inv = inv.reshape(-1)
+            P = uniq[:,:r,None]
+            H = uniq[:,None,r:]
+            A = theta[P,H]
+            # Singular blocks only occur for determinants with zero weight.
+            singular = numpy.abs(numpy.linalg.det(A)) < 1e-14
+            A[singular] = numpy.eye(r)
+            Ainv = numpy.linalg.inv(A)
+            Ainv[singular] = 0.0
+            c1 = numpy.einsum('kab,kba->k', Ainv, Lam1[P,H])
+            cx = 2*numpy.einsum('kab,kba->k', Ainv, Omega[P,H])
+            t = numpy.zeros((len(uniq),nchol), dtype=numpy.complex128)
+            chunk = max(1, 2**24//(r*r*nchol))
+            for k0 in range(0, len(uniq), chunk):
+                k = slice(k0, k0+chunk)
+                Lph = LamT[P[k],H[k]]
+                t[k] = numpy.einsum('kab,kban->kn', Ainv[k], Lph)
+                B = numpy.einsum('kab,kbcn->kacn', Ainv[k], Lph)
+                cx[k] += numpy.einsum('kacn,kcan->k', B, B)
+            e1[dets] += c1[inv]
+            exx[dets] += cx[inv]
+            index[dets] = nrow + inv
+            nrow += len(uniq)
+            tvec.append(t)
+        return e1, X0, exx, numpy.vstack(tvec), index
+
     def local_energy(self, system, two_rdm=None):
         """Compute walkers local energy
 
@@ -191,10 +408,15 @@ class MultiDetWalker(object):
         (E, T, V) : tuple
             Mixed estimates for walker's energy components.
         """
+        if self.wick:
+            return self.local_energy_wick(system)
         return local_energy_multi_det(system, self.Gi,
                                       self.weights, two_rdm=None)
 
     def contract_one_body(self, ints, trial):
+        if self.wick:
+            # G is already contracted over determinants.
+            return numpy.dot((self.G[0]+self.G[1]).ravel(), ints.ravel())
         numer = 0.0
         denom = 0.0
         for i, Gi in enumerate(self.Gi):
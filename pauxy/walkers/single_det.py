@@ -5,7 +5,6 @@ from pauxy.estimators.mixed import local_energy
 from pauxy.trial_wavefunction.free_electron import FreeElectron
 from pauxy.utils.linalg import sherman_morrison
 from pauxy.walkers.stack import PropagatorStack, FieldConfig
-from pauxy.utils.misc import get_numeric_names
 
 class SingleDetWalker(object):
     """UHF style walker.
@@ -34,6 +33,7 @@ class SingleDetWalker(object):
         self.nup = system.nup
         self.ndown = system.ndown
         self.inverse_overlap(trial)
+        self._trial = trial
         self.G = numpy.zeros(shape=(2, system.nbasis, system.nbasis),
                              dtype=trial.psi.dtype)
         self.Gmod = [numpy.zeros(shape=(system.nup, system.nbasis),
@@ -77,7 +77,16 @@ class SingleDetWalker(object):
                                              numpy.complex128)
         else:
             self.field_configs = None
-        self.buff_names, self.buff_size = get_numeric_names(self.__dict__)
+        # Walker state communicated during population control. Derived
+        # quantities (Green's functions and overlap matrices) are recomputed
+        # by the receiving walker.
+        self.buff_names = ['weight', 'unscaled_weight', 'phase', 'ot',
+                           'hybrid_energy', 'phi']
+        if self.field_configs is not None:
+            # Historic wavefunctions for back propagation and ITCF.
+            self.buff_names += ['phi_old', 'phi_right']
+        self.buff_size = sum(numpy.size(self.__dict__[d])
+                             for d in self.buff_names)
 
     def inverse_overlap(self, trial):
         """Compute inverse overlap matrix from scratch.
@@ -226,10 +235,37 @@ class SingleDetWalker(object):
         self.ot = self.ot / detR
         return detR
 
+    @property
+    def G(self):
+        """Walker's full Green's function.
+
+        Constructed from the half-rotated Green's function on first access
+        after the latter has been updated.
+        """
+        if self._G_stale:
+            self.full_greens_function()
+        return self._G
+
+    @G.setter
+    def G(self, G):
+        self._G = G
+        self._G_stale = False
+
+    def full_greens_function(self):
+        """Construct full Green's function from half-rotated Green's function.
+        """
+        nup = self.nup
+        psi = self._trial.psi
+        self._G[0] = numpy.dot(psi[:,:nup].conj(), self.Gmod[0])
+        if self.ndown > 0:
+            self._G[1] = numpy.dot(psi[:,nup:].conj(), self.Gmod[1])
+        self._G_stale = False
+
     def greens_function(self, trial):
         """Compute walker's green's function.
 
-        Also updates walker's inverse overlap.
+        Only the half-rotated Green's function is computed here, the full
+        Green's function is constructed when it is next accessed.
 
         Parameters
         ----------
@@ -242,12 +278,50 @@ class SingleDetWalker(object):
         ovlp = numpy.dot(self.phi[:,:nup].T, trial.psi[:,:nup].conj())
         # self.inv_ovlp[0] = scipy.linalg.inv(ovlp)
         self.Gmod[0] = numpy.dot(scipy.linalg.inv(ovlp), self.phi[:,:nup].T)
-        self.G[0] = numpy.dot(trial.psi[:,:nup].conj(), self.Gmod[0])
         if ndown > 0:
             # self.inv_ovlp[1] = scipy.linalg.inv(ovlp)
             ovlp = numpy.dot(self.phi[:,nup:].T, trial.psi[:,nup:].conj())
             self.Gmod[1] = numpy.dot(scipy.linalg.inv(ovlp), self.phi[:,nup:].T)
-            self.G[1] = numpy.dot(trial.psi[:,nup:].conj(), self.Gmod[1])
+        self._trial = trial
+        self._G_stale = True
+
+    def overlap_greens_function(self, trial):
+        """Compute overlap and Green's function from a single factorisation.
+
+        One LU factorisation of the overlap matrix per spin yields the
+        log-determinant of the overlap and the half-rotated Green's function.
+        The full Green's function is constructed when it is next accessed.
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object.
+
+        Returns
+        -------
+        ot : float / complex
+            Overlap with trial wavefunction.
+        """
+        nup = self.nup
+        ndown = self.ndown
+        sign = 1.0
+        log_ot = 0.0
+        for (s, nocc, ix) in [(0, nup, slice(0, nup)),
+                              (1, ndown, slice(nup, nup+ndown))]:
+            if nocc == 0:
+                continue
+            ovlp = numpy.dot(self.phi[:,ix].T, trial.psi[:,ix].conj())
+            lu, piv = scipy.linalg.lu_factor(ovlp, check_finite=False)
+            diag = numpy.diag(lu)
+            absdiag = numpy.abs(diag)
+            nperm = numpy.sum(piv != numpy.arange(nocc))
+            sign *= (-1)**nperm * numpy.prod(diag/absdiag)
+            log_ot += numpy.sum(numpy.log(absdiag))
+            self.Gmod[s] = scipy.linalg.lu_solve((lu, piv), self.phi[:,ix].T,
+                                                 check_finite=False)
+        self._trial = trial
+        self._G_stale = True
+        return sign * numpy.exp(log_ot)
 
     def rotated_greens_function(self):
         """Compute "rotated" walker's green's function.
@@ -308,6 +382,9 @@ class SingleDetWalker(object):
     def set_buffer(self, buff):
         """Set walker buffer following MPI communication
 
+        The walker's Green's function is recomputed from the received
+        wavefunction.
+
         Parameters
         -------
         buff : dict
@@ -325,3 +402,4 @@ class SingleDetWalker(object):
             s += dsize
         if self.field_configs is not None:
             self.field_configs.set_buffer(buff[self.buff_size:])
+        self.greens_function(self._trial)
@@ -0,0 +1,248 @@
+import numpy
+import scipy.linalg
+from pauxy.estimators.mixed import local_energy
+from pauxy.estimators.generic import local_energy_generic_cholesky_opt_batch
+
+class SingleDetWalkerBatch(object):
+    """Batch of UHF style walkers stored in contiguous arrays.
+
+    All walker wavefunctions are stored in a single array of shape
+    (nwalkers, nbasis, nup+ndown) while weights, phases, overlaps and hybrid
+    energies are stored as 1D arrays of length nwalkers.
+
+    Parameters
+    ----------
+    walker_opts : dict
+        Input options for walkers.
+    system : object
+        System object.
+    trial : object
+        Trial wavefunction object.
+    nwalkers : int
+        Number of walkers in batch.
+    """
+
+    def __init__(self, walker_opts, system, trial, nwalkers):
+        self.nwalkers = nwalkers
+        self.nup = system.nup
+        self.ndown = system.ndown
+        self.nbasis = system.nbasis
+        weight = walker_opts.get('weight', 1.0)
+        self.weight = numpy.array([weight]*nwalkers, dtype=numpy.float64)
+        self.unscaled_weight = self.weight.copy()
+        self.phase = numpy.ones(nwalkers, dtype=numpy.complex128)
+        self.ot = numpy.ones(nwalkers, dtype=numpy.complex128)
+        self.hybrid_energy = numpy.zeros(nwalkers, dtype=numpy.complex128)
+        self.phi = numpy.array([trial.init.copy() for w in range(nwalkers)],
+                               dtype=numpy.complex128)
+        self._trial = trial
+        self.G = numpy.zeros(shape=(nwalkers, 2, system.nbasis, system.nbasis),
+                             dtype=numpy.complex128)
+        self.Gmod = [numpy.zeros(shape=(nwalkers, system.nup, system.nbasis),
+                                 dtype=numpy.complex128),
+                     numpy.zeros(shape=(nwalkers, system.ndown, system.nbasis),
+                                 dtype=numpy.complex128)]
+        self.greens_function(trial)
+        self.total_weight = 0.0
+        self.old_total_weight = 0.0
+        # weight, unscaled_weight, phase, ot, hybrid_energy, phi. Green's
+        # functions are recomputed on the receiving end.
+        self.buff_size = 5 + self.phi[0].size
+
+    @property
+    def G(self):
+        """Full Green's functions of all walkers in the batch.
+
+        Constructed from the half-rotated Green's functions on first access
+        after the latter have been updated.
+        """
+        if self._G_stale:
+            self.full_greens_function()
+        return self._G
+
+    @G.setter
+    def G(self, G):
+        self._G = G
+        self._G_stale = False
+
+    def full_greens_function(self):
+        """Construct full Green's functions from half-rotated ones.
+        """
+        nup = self.nup
+        psi = self._trial.psi
+        self._G[:,0] = numpy.matmul(psi[:,:nup].conj(), self.Gmod[0])
+        if self.ndown > 0:
+            self._G[:,1] = numpy.matmul(psi[:,nup:].conj(), self.Gmod[1])
+        self._G_stale = False
+
+    def greens_function(self, trial):
+        """Compute half-rotated Green's functions for all walkers in the batch.
+
+        The full Green's functions are constructed when next accessed.
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object.
+        """
+        self.overlap_greens_function(trial)
+
+    def _overlaps(self, trial):
+        """Overlap matrices <phi_s|psi_s> of all walkers for each spin."""
+        nup = self.nup
+        ovlps = []
+        for ix in [slice(0, nup), slice(nup, nup+self.ndown)]:
+            phi = self.phi[:,:,ix].transpose(0,2,1)
+            ovlps.append((phi, numpy.matmul(phi, trial.psi[:,ix].conj())))
+        return ovlps
+
+    def overlap_greens_function(self, trial):
+        """Compute overlaps and half-rotated Green's functions of all walkers.
+
+        The determinants and Green's functions are evaluated with batched
+        LAPACK calls on the (nwalkers, nsigma, nsigma) stack of overlap
+        matrices. The full Green's functions are constructed when next
+        accessed.
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object.
+
+        Returns
+        -------
+        ot : :class:`numpy.ndarray`
+            Overlaps with trial wavefunction.
+        """
+        sign = numpy.ones(self.nwalkers, dtype=numpy.complex128)
+        log_ot = numpy.zeros(self.nwalkers)
+        for (s, (phi, ovlp)) in enumerate(self._overlaps(trial)):
+            if ovlp.shape[-1] == 0:
+                continue
+            (sgn, logdet) = numpy.linalg.slogdet(ovlp)
+            sign *= sgn
+            log_ot += logdet
+            self.Gmod[s] = numpy.linalg.solve(ovlp, phi)
+        self._trial = trial
+        self._G_stale = True
+        return sign * numpy.exp(log_ot)
+
+    def calc_otrial(self, trial):
+        """Caculate overlap with trial wavefunction for all walkers.
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object.
+
+        Returns
+        -------
+        ot : :class:`numpy.ndarray`
+            Overlaps.
+        """
+        sign = numpy.ones(self.nwalkers, dtype=numpy.complex128)
+        log_ot = numpy.zeros(self.nwalkers)
+        for (phi, ovlp) in self._overlaps(trial):
+            if ovlp.shape[-1] == 0:
+                continue
+            (sgn, logdet) = numpy.linalg.slogdet(ovlp)
+            sign *= sgn
+            log_ot += logdet
+        return sign * numpy.exp(log_ot)
+
+    def reortho(self, trial):
+        """Reorthogonalise all walkers.
+
+        Parameters
+        ----------
+        trial : object
+            Trial wavefunction object. For interface consistency.
+
+        Returns
+        -------
+        detR : :class:`numpy.ndarray`
+            Determinant of R factor for each walker.
+        """
+        nup = self.nup
+        detR = numpy.ones(self.nwalkers, dtype=numpy.complex128)
+        for ix in [slice(0, nup), slice(nup, nup+self.ndown)]:
+            if ix.stop == ix.start:
+                continue
+            (Q, R) = numpy.linalg.qr(self.phi[:,:,ix], mode='reduced')
+            diag = numpy.diagonal(R, axis1=1, axis2=2)
+            signs = numpy.sign(diag)
+            self.phi[:,:,ix] = Q * signs[:,None,:]
+            detR *= numpy.prod(signs*diag, axis=1)
+        self.ot = self.ot / detR
+        return detR
+
+    def local_energy(self, system):
+        """Compute local energy for all walkers.
+
+        Parameters
+        ----------
+        system : object
+            System object.
+
+        Returns
+        -------
+        (E, T, V) : tuple of :class:`numpy.ndarray`
+            Mixed estimates for walkers' energy components.
+        """
+        if system.name == "Generic" and not system.half_rotated_integrals:
+            return local_energy_generic_cholesky_opt_batch(system, self.G,
+                                                           Ghalf=self.Gmod)
+        # Other systems only provide single walker energies.
+        energies = numpy.zeros((3,self.nwalkers), dtype=numpy.complex128)
+        for iw in range(self.nwalkers):
+            Ghalf = [self.Gmod[0][iw], self.Gmod[1][iw]]
+            energies[:,iw] = local_energy(system, self.G[iw], Ghalf=Ghalf)
+        return (energies[0], energies[1], energies[2])
+
+    def get_buffer(self, iw):
+        """Get buffer for walker iw for MPI communication.
+
+        Parameters
+        ----------
+        iw : int
+            Index of walker in batch.
+
+        Returns
+        -------
+        buff : :class:`numpy.ndarray`
+            Relevant walker information for population control.
+        """
+        buff = numpy.zeros(self.buff_size, dtype=numpy.complex128)
+        buff[:5] = [self.weight[iw], self.unscaled_weight[iw], self.phase[iw],
+                    self.ot[iw], self.hybrid_energy[iw]]
+        buff[5:] = self.phi[iw].ravel()
+        return buff
+
+    def set_buffer(self, iw, buff):
+        """Set walker iw from buffer following MPI communication.
+
+        The walker's half-rotated Green's function is recomputed from the
+        received wavefunction.
+
+        Parameters
+        ----------
+        iw : int
+            Index of walker in batch.
+        buff : :class:`numpy.ndarray`
+            Relevant walker information for population control.
+        """
+        self.weight[iw] = buff[0].real
+        self.unscaled_weight[iw] = buff[1].real
+        self.phase[iw] = buff[2]
+        self.ot[iw] = buff[3]
+        self.hybrid_energy[iw] = buff[4]
+        self.phi[iw] = buff[5:].reshape(self.phi[iw].shape)
+        nup = self.nup
+        psi = self._trial.psi
+        for (s, ix) in [(0, slice(0, nup)), (1, slice(nup, nup+self.ndown))]:
+            if self.Gmod[s].shape[1] == 0:
+                continue
+            phi = self.phi[iw][:,ix].T
+            ovlp = numpy.dot(phi, psi[:,ix].conj())
+            self.Gmod[s][iw] = scipy.linalg.solve(ovlp, phi)
+        self._G_stale = True
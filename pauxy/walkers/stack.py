@@ -29,7 +29,10 @@ class FieldConfig(object):
         self.nbp = nbp
         self.nprop_tot = nprop_tot
         self.nblock = nprop_tot // nbp
-        self.buff_names, self.buff_size = get_numeric_names(self.__dict__)
+        # Step counters are the same for all walkers so are not communicated.
+        self.buff_names = ['configs', 'cos_fac', 'weight_fac', 'tot_wfac']
+        self.buff_size = sum(numpy.size(self.__dict__[d])
+                             for d in self.buff_names)
 
     def push(self, config):
         """Add field configuration to buffer.
@@ -2,6 +2,7 @@ import pytest
 import numpy
 
 from mpi4py import MPI
+from pauxy.walkers.handler import rebalance_walkers
 comm = MPI.COMM_WORLD
 numpy.random.seed(7)
 skip = comm.size == 1
@@ -78,3 +79,19 @@ def test_pair_branch():
         assert len(buff) == 2
         assert sum(buff[0]) == 2
         assert sum(buff[1]) == 0
+
+@pytest.mark.unit
+def test_rebalance_walkers():
+    weights = numpy.array([0.5, 2.0, 1.0, 1.5, 0.1, 3.0, 0.7, 1.2])
+    assignment, resampled = rebalance_walkers(weights, 2, 4)
+    assert not resampled
+    assert sorted(assignment.ravel()) == list(range(8))
+    totals = weights[assignment].sum(axis=1)
+    assert totals[0] == pytest.approx(5.3)
+    assert totals[1] == pytest.approx(4.7)
+    assignment, resampled = rebalance_walkers(weights, 3, 4, r=0.3)
+    assert resampled
+    assert assignment.shape == (3,4)
+    counts = numpy.bincount(assignment.ravel(), minlength=len(weights))
+    expected = 12 * weights / weights.sum()
+    assert numpy.all(numpy.abs(counts-expected) < 1)
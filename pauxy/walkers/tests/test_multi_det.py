@@ -101,3 +101,39 @@ def test_walker_energy():
         nume += trial.coeffs[i].conj()*ovlp*e
         deno += trial.coeffs[i].conj()*ovlp
     print(nume/deno,nume,deno,e0[0])
+
+@pytest.mark.unit
+def test_walker_wick():
+    numpy.random.seed(7)
+    nelec = (3,2)
+    nmo = 7
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc,
+                     inputs={'integral_tensor': False})
+    orbs = numpy.arange(nmo)
+    oa = [c for c in itertools.combinations(orbs, nelec[0])]
+    ob = [c for c in itertools.combinations(orbs, nelec[1])]
+    oa, ob = zip(*itertools.product(oa,ob))
+    # Scramble orbital order to test permutation signs.
+    oa = [o if i % 3 else o[::-1] for (i, o) in enumerate(oa[:40])]
+    ob = [o if i % 2 else o[::-1] for (i, o) in enumerate(ob[:40])]
+    coeffs = numpy.random.random(40) + 1j*numpy.random.random(40)
+    init = get_random_wavefunction(nelec, nmo)
+    trial = MultiSlater(system, (coeffs,oa,ob), init=init)
+    ref = MultiDetWalker({}, system, trial)
+    walker = MultiDetWalker({'wick': True}, system, trial)
+    assert walker.Gi is None
+    assert walker.ot == pytest.approx(ref.ot)
+    assert numpy.allclose(walker.ovlps, ref.ovlps)
+    G = numpy.einsum('i,ispq->spq', ref.weights, ref.Gi) / sum(ref.weights)
+    assert numpy.allclose(walker.G, G)
+    e_ref = ref.local_energy(system)
+    e = walker.local_energy(system)
+    assert numpy.allclose(e, e_ref)
+    # Walker with exact zero overlap with excited determinants.
+    trial = MultiSlater(system, (coeffs,oa,ob))
+    walker = MultiDetWalker({'wick': True}, system, trial)
+    assert walker.ot == pytest.approx(coeffs[0].conj())
+    assert numpy.allclose(walker.G[0].trace(), nelec[0])
+    ref = MultiDetWalker({}, system, trial)
+    assert numpy.allclose(walker.local_energy(system), ref.local_energy(system))
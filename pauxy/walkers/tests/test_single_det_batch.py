@@ -0,0 +1,60 @@
+import numpy
+import pytest
+from pauxy.systems.generic import Generic
+from pauxy.propagation.continuous import Continuous
+from pauxy.trial_wavefunction.multi_slater import MultiSlater
+from pauxy.utils.misc import dotdict
+from pauxy.utils.testing import (
+        generate_hamiltonian,
+        get_random_nomsd,
+        get_random_wavefunction
+        )
+from pauxy.walkers.single_det import SingleDetWalker
+from pauxy.walkers.single_det_batch import SingleDetWalkerBatch
+
+@pytest.mark.unit
+def test_batch_propagation():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (4,3)
+    h1e, chol, enuc, eri = generate_hamiltonian(nmo, nelec, cplx=False)
+    system = Generic(nelec=nelec, h1e=h1e, chol=chol, ecore=enuc)
+    wfn = get_random_nomsd(system, ndet=1, cplx=True)
+    init = get_random_wavefunction(nelec, nmo)
+    trial = MultiSlater(system, wfn, init=init)
+    system.construct_integral_tensors_real(trial)
+    qmc = dotdict({'dt': 0.005, 'nstblz': 5})
+    prop = Continuous(system, trial, qmc)
+    nwalkers = 4
+    walkers = [SingleDetWalker({}, system, trial) for iw in range(nwalkers)]
+    batch = SingleDetWalkerBatch({}, system, trial, nwalkers)
+    numpy.random.seed(7)
+    for iw in range(nwalkers):
+        prop.propagate_walker(walkers[iw], system, trial, 0.0)
+    numpy.random.seed(7)
+    prop.propagate_walker_batch(batch, system, trial, 0.0)
+    energies = batch.local_energy(system)
+    for iw, w in enumerate(walkers):
+        assert numpy.allclose(batch.phi[iw], w.phi)
+        assert numpy.allclose(batch.Gmod[0][iw], w.Gmod[0])
+        assert numpy.allclose(batch.Gmod[1][iw], w.Gmod[1])
+        assert numpy.allclose(batch.G[iw], w.G)
+        assert batch.weight[iw] == pytest.approx(w.weight)
+        assert batch.ot[iw] == pytest.approx(w.ot)
+        assert batch.hybrid_energy[iw] == pytest.approx(w.hybrid_energy)
+        e = w.local_energy(system)
+        assert energies[0][iw] == pytest.approx(e[0])
+        assert energies[2][iw] == pytest.approx(e[2])
+    buff = batch.get_buffer(1)
+    batch.set_buffer(0, buff)
+    assert numpy.allclose(batch.phi[0], batch.phi[1])
+    assert numpy.allclose(batch.Gmod[0][0], batch.Gmod[0][1])
+    detR = batch.reortho(trial)
+    for iw, w in enumerate(walkers[1:], 1):
+        assert detR[iw] == pytest.approx(w.reortho(trial))
+        assert numpy.allclose(batch.phi[iw], w.phi)
+    ot = batch.overlap_greens_function(trial)
+    assert numpy.allclose(ot, batch.calc_otrial(trial))
+    for iw, w in enumerate(walkers[1:], 1):
+        assert ot[iw] == pytest.approx(w.overlap_greens_function(trial))
+        assert numpy.allclose(batch.Gmod[0][iw], w.Gmod[0])